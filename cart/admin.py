@@ -1,22 +1,218 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
 
-from .models import Item, Cart
+from . import reports, search, snapshot
+from .models import Item, Cart, CartLine, DailySummary, Order, OrderLine
+
+
+def estimated_count(queryset):
+    """ Number of rows of the table of a queryset, from the statistics of
+    the database instead of a COUNT(*) that reads the whole table
+
+    :param queryset: unfiltered queryset
+    :return: int, None if the database has no estimate
+    """
+
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # Updated by VACUUM and ANALYZE, -1 if the table was never
+            # analyzed
+            cursor.execute('SELECT reltuples FROM pg_class '
+                           'WHERE oid = %s::regclass', [table])
+            row = cursor.fetchone()
+            return int(row[0]) if row and row[0] >= 0 else None
+        if connection.vendor == 'sqlite':
+            # The last rowid is read from the end of the table b-tree, the
+            # deleted rows are counted too
+            cursor.execute('SELECT MAX(rowid) FROM %s' %
+                           connection.ops.quote_name(table))
+            return cursor.fetchone()[0] or 0
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """ Paginator of the changelists of large tables
+
+    The count of an unfiltered table above ESTIMATE_THRESHOLD rows is the
+    estimate of the database, and filtered counts stop at MAX_COUNT rows:
+    the pages after it are not linked until the filters are narrowed. Use
+    it with show_full_result_count = False, which skips the other count of
+    the changelist.
+    """
+
+    ESTIMATE_THRESHOLD = 10000
+    MAX_COUNT = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_count(queryset)
+            if estimate is not None and estimate > self.ESTIMATE_THRESHOLD:
+                return estimate
+        # COUNT(*) over a subquery with a LIMIT stops reading at MAX_COUNT
+        return queryset.order_by()[:self.MAX_COUNT].count()
 
 
 class ItemAdmin(admin.ModelAdmin):
-    """ Custom Item inside admin"""
+    """ Custom Item inside admin
+
+    The list is ordered and sorted by indexed columns only, and filtered by
+    category and level with item_category_id_idx and item_level_id_idx.
+    """
+
+    list_display = ['id', 'name', 'category', 'level', 'price', 'image']
+    list_filter = ['category', 'level']
+    ordering = ['-id']
+    sortable_by = ['id', 'name']
+    search_fields = ['name']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    # Number of matches of a search, the best ranked
+    search_limit = 1000
 
-    list_display = ['id', 'name', 'price', 'image']
-    ordering = ['id', 'date_created', 'name']
+    def get_search_results(self, request, queryset, search_term):
+        """ Search the names with the index of cart.search instead of a
+        LIKE over the whole table """
+
+        terms = search.search_terms(search_term)
+        if not terms:
+            return queryset, False
+        ids = search.get_backend().search(terms, None, None,
+                                          self.search_limit)
+        return queryset.filter(id__in=ids), False
 
 admin.site.register(Item, ItemAdmin)
 
 
+class CartLineInline(admin.TabularInline):
+    """ Lines inside the cart
+
+    The items are joined to the lines and shown as links, instead of a
+    widget that looks up the item of each line; lines are added with
+    NewCartLineInline.
+    """
+
+    model = CartLine
+    fields = ['item', 'price', 'date_added']
+    readonly_fields = ['item', 'date_added']
+    extra = 0
+
+    def get_queryset(self, request):
+        return (super(CartLineInline, self).get_queryset(request)
+                .select_related('item'))
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+class NewCartLineInline(admin.TabularInline):
+    """ Empty forms to add lines to the cart """
+
+    model = CartLine
+    fields = ['item', 'price']
+    raw_id_fields = ['item']
+    extra = 0
+    verbose_name = _('New cart line')
+    verbose_name_plural = _('New cart lines')
+
+    def get_queryset(self, request):
+        return super(NewCartLineInline, self).get_queryset(request).none()
+
+
 class CartAdmin(admin.ModelAdmin):
-    """ Custom Cart inside admin"""
+    """ Custom Cart inside admin
+
+    The users are joined to the carts, the list is filtered by active with
+    cart_active_id_idx and cart_inactive_id_idx and searched by the exact
+    username.
+    """
 
     list_display = ['id', 'user', 'date_created', 'active']
-    ordering = ['id', 'date_created', 'user']
+    list_filter = ['active']
+    list_select_related = ['user']
+    ordering = ['-id']
+    sortable_by = ['id']
+    search_fields = ['=user__username']
+    raw_id_fields = ['user']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    inlines = [CartLineInline, NewCartLineInline]
+
+    def save_related(self, request, form, formsets, change):
+        """ Rebuild the total and the item count after editing the lines """
+
+        super(CartAdmin, self).save_related(request, form, formsets, change)
+        form.instance.set_total()
+        snapshot.invalidate(form.instance.user)
 
 
 admin.site.register(Cart, CartAdmin)
+
+
+class OrderLineInline(admin.TabularInline):
+    """ Lines inside the order """
+
+    model = OrderLine
+    raw_id_fields = ['item']
+    extra = 0
+
+
+class OrderAdmin(admin.ModelAdmin):
+    """ Custom Order inside admin"""
+
+    list_display = ['id', 'user', 'status', 'total', 'date_created']
+    list_filter = ['status']
+    list_select_related = ['user']
+    raw_id_fields = ['user', 'cart']
+    inlines = [OrderLineInline]
+
+
+admin.site.register(Order, OrderAdmin)
+
+
+class DailySummaryAdmin(admin.ModelAdmin):
+    """ Dashboard of the sales reports
+
+    The days are listed and filtered as any changelist, and the template
+    admin/cart/dailysummary/change_list.html shows the totals, the sales by
+    category and level and the best sold items of the selected days, all
+    read from the rollups of cart.reports.
+    """
+
+    list_display = ['date', 'carts', 'orders', 'conversion', 'items',
+                    'revenue']
+    date_hierarchy = 'date'
+    ordering = ['-date']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description=_('Conversion'))
+    def conversion(self, obj):
+        return '-' if obj.conversion is None else '%.1f%%' % (
+            obj.conversion * 100)
+
+    def changelist_view(self, request, extra_context=None):
+        response = super(DailySummaryAdmin, self).changelist_view(
+            request, extra_context)
+        # Invalid filters redirect without a changelist
+        changelist = getattr(response, 'context_data', {}).get('cl')
+        if changelist is not None:
+            response.context_data.update(
+                reports.summarize(changelist.queryset))
+        return response
+
+
+admin.site.register(DailySummary, DailySummaryAdmin)
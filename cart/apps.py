@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class CartConfig(AppConfig):
     name = 'cart'
+
+    def ready(self):
+        # Connect the signal receivers
+        from . import catalogue, counters, images, reports, search  # NOQA
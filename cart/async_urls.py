@@ -0,0 +1,36 @@
+from django.urls import re_path
+
+from . import async_views
+from .urls import urlpatterns as sync_urlpatterns
+
+# URLs of the ASGI deployment, the cart endpoints use their async versions
+# and the rest are shared with cart.urls
+async_urlpatterns = [
+    re_path(
+        route=r'^$',
+        view=async_views.ItemListView.as_view(),
+        name='item_list'
+    ),
+    re_path(
+        route=r'^add/(?P<item_id>\d+)/$',
+        view=async_views.add_item_cart,
+        name='item_add'
+    ),
+    re_path(
+        route=r'^cart/$',
+        view=async_views.cart_detail,
+        name='cart_detail'
+    ),
+    re_path(
+        route=r'^delete/(?P<item_id>\d+)/$',
+        view=async_views.delete_item_cart,
+        name='cart_remove_item'
+    ),
+]
+
+_async_names = {pattern.name for pattern in async_urlpatterns}
+
+urlpatterns = async_urlpatterns + [
+    pattern for pattern in sync_urlpatterns
+    if pattern.name not in _async_names
+]
@@ -0,0 +1,161 @@
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.shortcuts import render
+from django.views import View
+
+from . import catalogue, search, snapshot
+from .models import Item, Cart, CartConflict
+from .context_processors import aget_cart_count
+from .session import SessionCart
+from .views import (ADDED_MESSAGE, catalogue_context, conflict_response,
+                    not_found_response, redirect_back, response_format,
+                    summary_response)
+
+
+async def prepare_request(request):
+    """ Load the user and the session without blocking the event loop
+
+    The auth context processor reads the user synchronously, so it is
+    loaded before rendering.
+    :param request: 
+    """
+
+    request.user = await request.auser()
+    await request.session.aget(SessionCart.SESSION_KEY)
+
+
+async def render_page(request, template_name, context):
+    """ Render a full page, loading the badge count of base.html first
+
+    :param request: 
+    :param template_name: 
+    :param context: 
+    :return: HttpResponse
+    """
+
+    request.cart_count = await aget_cart_count(request)
+    return render(request, template_name, context)
+
+
+class ItemListView(View):
+    """ Async version of views.ItemListView """
+
+    async def get(self, request):
+        await prepare_request(request)
+        query = request.GET.get('q', '').strip()
+        if query:
+            # The search index is queried with raw SQL, which is sync only
+            page = await sync_to_async(search.search)(
+                query, category=request.GET.get('category'),
+                level=request.GET.get('level'),
+                page=request.GET.get('page'))
+        else:
+            page = await catalogue.aget_page(
+                category=request.GET.get('category'),
+                level=request.GET.get('level'),
+                cursor=request.GET.get('after'))
+
+        context = {'item_list': page['items']}
+        context.update(catalogue_context(request, page))
+        return await render_page(request, 'cart/item_list.html', context)
+
+
+async def add_item_cart(request, item_id):
+    """ Async version of views.add_item_cart
+
+    :param request: 
+    :param item_id: 
+    :return: HttpResponse
+    """
+
+    await prepare_request(request)
+    kind = response_format(request)
+    try:
+        item = await Item.objects.aget(id=item_id)
+    except Item.DoesNotExist:
+        return not_found_response(request, kind, 'item_list')
+
+    if request.user.is_anonymous:
+        cart = await SessionCart.aload(request.session)
+        added = cart.add(item.id)
+        await cart.asave()
+        count = len(cart)
+    else:
+        cart, created = await Cart.objects.aget_or_create(
+            user=request.user, active=True)
+
+        # The total is updated inside a transaction, which is sync only
+        try:
+            added = await sync_to_async(cart.add_item)(item)
+        except CartConflict:
+            return conflict_response(request, kind, 'item_list')
+        if added:
+            await snapshot.ainvalidate(request.user)
+        count = cart.item_count
+
+    if kind is None:
+        messages.success(request, ADDED_MESSAGE, fail_silently=True)
+        return redirect_back(request, 'item_list')
+    total = await cart.atotal() if request.user.is_anonymous else cart.total
+    return summary_response(request, kind, added, count, total)
+
+
+async def cart_detail(request):
+    """ Async version of views.cart_detail
+
+    :param request: 
+    :return: HttpResponse
+    """
+
+    await prepare_request(request)
+    if request.user.is_anonymous:
+        cart = await SessionCart.aload(request.session)
+        items, total = await cart.aresolve()
+        return await render_page(request, 'cart/cart_detail.html',
+                                 {'items': items, 'total': total})
+
+    cart = await snapshot.aget_snapshot(request.user)
+    if cart is None:
+        return await render_page(request, 'cart/cart_detail.html',
+                                 {'items': [], 'total': 0})
+    return await render_page(request, 'cart/cart_detail.html',
+                             {'items': cart['items'], 'total': cart['total']})
+
+
+async def delete_item_cart(request, item_id):
+    """ Async version of views.delete_item_cart
+
+    :param request: 
+    :param item_id: 
+    :return: HttpResponse
+    """
+
+    await prepare_request(request)
+    kind = response_format(request)
+    if request.user.is_anonymous:
+        cart = await SessionCart.aload(request.session)
+        removed = cart.remove(item_id)
+        await cart.asave()
+
+        if kind is None:
+            return redirect_back(request, 'cart_detail')
+        return summary_response(request, kind, removed, len(cart),
+                                await cart.atotal())
+
+    try:
+        cart = await Cart.objects.aget(user=request.user, active=True)
+        item = await Item.objects.aget(id=item_id)
+    except (Cart.DoesNotExist, Item.DoesNotExist):
+        return not_found_response(request, kind, 'item_list')
+
+    try:
+        removed = await sync_to_async(cart.remove_item)(item)
+    except CartConflict:
+        return conflict_response(request, kind, 'cart_pay')
+    if removed:
+        await snapshot.ainvalidate(request.user)
+    count = cart.item_count
+
+    if kind is None:
+        return redirect_back(request, 'cart_pay')
+    return summary_response(request, kind, removed, count, cart.total)
@@ -0,0 +1,139 @@
+import base64
+import json
+
+from django.core.cache import cache
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Item
+from .utils import aget_cache_version, get_cache_version, bump_cache_version
+
+PAGE_SIZE = 10
+PAGE_TIMEOUT = 60 * 15
+VERSION_KEY = 'catalogue:version'
+
+CATEGORIES = [category.value[0] for category in Item.Category]
+LEVELS = [level.value[0] for level in Item.Level]
+
+
+def encode_cursor(item):
+    """ Build the opaque cursor that points right after an item """
+
+    data = json.dumps([item.name, item.id]).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """ Read a cursor built by encode_cursor
+
+    :param cursor: string received from the client
+    :return: tuple (name, id) or None if the cursor is not valid
+    """
+
+    try:
+        name, item_id = json.loads(
+            base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        return str(name), int(item_id)
+    except (TypeError, ValueError, UnicodeError, AttributeError):
+        return None
+
+
+def invalidate():
+    """ Discard every cached page by moving to a new version """
+
+    bump_cache_version(VERSION_KEY)
+
+
+def get_page(category=None, level=None, cursor=None, page_size=PAGE_SIZE):
+    """ Return a page of the catalogue ordered by name
+
+    Pages are built with keyset pagination on (name, id) so every page costs
+    the same regardless of its position, and are cached until an item
+    changes. Unknown filters and malformed cursors are ignored.
+    :param category: value of Item.Category
+    :param level: value of Item.Level
+    :param cursor: cursor returned as next by the previous page
+    :param page_size: number of items of the page
+    :return: dict with the items and the cursor of the next page
+    """
+
+    category, level, after, key = _page_key(
+        get_cache_version(VERSION_KEY), category, level, cursor, page_size)
+    page = cache.get(key)
+    if page is None:
+        page = _build_page(category, level, after, page_size)
+        cache.set(key, page, PAGE_TIMEOUT)
+    return page
+
+
+async def aget_page(category=None, level=None, cursor=None,
+                    page_size=PAGE_SIZE):
+    """ Async version of get_page """
+
+    category, level, after, key = _page_key(
+        await aget_cache_version(VERSION_KEY), category, level, cursor,
+        page_size)
+    page = await cache.aget(key)
+    if page is None:
+        queryset = page_queryset(category, level, after)[:page_size + 1]
+        page = _slice_page([item async for item in queryset], page_size)
+        await cache.aset(key, page, PAGE_TIMEOUT)
+    return page
+
+
+def _page_key(version, category, level, cursor, page_size):
+    """ Clean the arguments of a page and build its cache key """
+
+    category = category if category in CATEGORIES else None
+    level = level if level in LEVELS else None
+    after = decode_cursor(cursor) if cursor else None
+    key = 'catalogue:%s:%s:%s:%s:%s' % (
+        version, category, level, cursor if after else '', page_size)
+    return category, level, after, key
+
+
+def page_queryset(category=None, level=None, after=None):
+    """ Build the keyset query of a catalogue page
+
+    :param category: value of Item.Category
+    :param level: value of Item.Level
+    :param after: tuple (name, id) of the last item of the previous page
+    :return: QuerySet
+    """
+
+    queryset = Item.objects.order_by('name', 'id')
+    if category:
+        queryset = queryset.filter(category=category)
+    if level:
+        queryset = queryset.filter(level=level)
+    if after:
+        name, item_id = after
+        queryset = queryset.filter(
+            Q(name__gt=name) | Q(name=name, id__gt=item_id))
+    return queryset
+
+
+def _build_page(category, level, after, page_size):
+    """ Query one page of the catalogue """
+
+    items = list(page_queryset(category, level, after)[:page_size + 1])
+    return _slice_page(items, page_size)
+
+
+def _slice_page(items, page_size):
+    """ Keep page_size items and point the cursor to the next page """
+
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        next_cursor = encode_cursor(items[-1])
+    return {'items': items, 'next': next_cursor}
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+def invalidate_catalogue(sender, **kwargs):
+    """ Any change of an item makes the cached pages stale """
+
+    invalidate()
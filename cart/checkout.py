@@ -0,0 +1,264 @@
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import connection, transaction
+from django.db.models import DecimalField, F, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import reports, snapshot
+from .models import (Cart, CartConflict, CartLine, CourseAccess, Item,
+                     Order, OrderLine)
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class PaymentDeclined(Exception):
+    """ The gateway refused the payment, retrying will not help """
+
+
+class LocalGateway(object):
+    """ Stand-in payment gateway that approves every valid amount
+
+    Authorizations are remembered by idempotency key, so retrying an
+    authorization returns the reference of the first one.
+    """
+
+    _authorizations = {}
+    _lock = threading.Lock()
+
+    def authorize(self, amount, idempotency_key):
+        """ Authorize the payment of an amount
+
+        :param amount: Decimal
+        :param idempotency_key: key that identifies the payment
+        :return: reference of the authorization
+        """
+
+        if amount < 0:
+            raise PaymentDeclined('Invalid amount %s' % amount)
+        with self._lock:
+            if idempotency_key not in self._authorizations:
+                self._authorizations[idempotency_key] = 'local-%s' % (
+                    hashlib.sha1(idempotency_key.encode('utf-8'))
+                    .hexdigest()[:16])
+            return self._authorizations[idempotency_key]
+
+
+def get_gateway():
+    """ Return the gateway configured in CHECKOUT_PAYMENT_GATEWAY """
+
+    return import_string(settings.CHECKOUT_PAYMENT_GATEWAY)()
+
+
+def place_order(cart):
+    """ Turn the active cart into a pending order and close the cart
+
+    The order copies the name, category and level of each item and the
+    price stored in its line of the cart, and its total is the sum of the
+    copied lines. The cart is closed with a compare-and-swap on its
+    version, so a mutation committed since the cart was read aborts the
+    order instead of adding lines that were not in the total. Paying the
+    same cart twice returns the order created the first time.
+    :param cart: Cart instance
+    :return: Order
+    :raise CartConflict: if the cart changed since it was read
+    """
+
+    with transaction.atomic():
+        order, created = Order.objects.get_or_create(
+            idempotency_key='cart-%s' % cart.id,
+            defaults={'user_id': cart.user_id, 'cart': cart})
+        if created:
+            if not Cart.objects.filter(
+                    pk=cart.pk, version=cart.version, active=True).update(
+                    active=False, version=F('version') + 1):
+                raise CartConflict(cart)
+            _copy_lines(order, cart)
+            order.total = order.lines.aggregate(
+                total=Coalesce(Sum('price'), Value(0),
+                               output_field=DecimalField()))['total']
+            order.save(update_fields=['total', 'date_updated'])
+    snapshot.invalidate(cart.user)
+    return order
+
+
+def _copy_lines(order, cart):
+    """ Copy the lines of the cart into order lines in a single query
+
+    The ORM can not express INSERT ... SELECT, and copying in the database
+    avoids loading the lines, whatever the size of the cart.
+    """
+
+    cart_line = CartLine._meta
+    sql = (
+        'INSERT INTO {line} (order_id, item_id, name, category, level, '
+        'price) '
+        'SELECT %s, item.id, item.name, item.category, item.level, '
+        'cart_line.{price_column} '
+        'FROM {item} item INNER JOIN {cart_line} cart_line '
+        'ON cart_line.{item_column} = item.id '
+        'WHERE cart_line.{cart_column} = %s'
+    ).format(
+        line=OrderLine._meta.db_table,
+        item=Item._meta.db_table,
+        cart_line=cart_line.db_table,
+        price_column=cart_line.get_field('price').column,
+        item_column=cart_line.get_field('item').column,
+        cart_column=cart_line.get_field('cart').column,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [order.id, cart.id])
+
+
+def enqueue(order):
+    """ Process the order in the worker pool once the transaction commits
+
+    With CHECKOUT_EAGER the order is processed right away in the caller.
+    :param order: Order instance
+    """
+
+    if settings.CHECKOUT_EAGER:
+        process_order(order.id)
+        return
+    transaction.on_commit(
+        lambda: _get_executor().submit(_run_job, order.id))
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.CHECKOUT_WORKERS)
+        return _executor
+
+
+def _run_job(order_id):
+    """ Entry point of the worker threads """
+
+    try:
+        process_order(order_id)
+    finally:
+        # Worker threads own their connection, do not leak it
+        connection.close()
+
+
+def process_order(order_id):
+    """ Run the fulfilment steps of an order, retrying on errors
+
+    Each step records that it was done, so a retry or a second worker
+    skips it: authorize the payment, grant access to the courses, send the
+    receipt and add the order to the reports, see cart.reports. The order
+    ends completed, or failed if the payment is declined. The status only
+    follows the payment: after CHECKOUT_MAX_ATTEMPTS attempts the error is
+    recorded and the order stays pending or authorized, to be resumed by
+    resume_orders.
+    :param order_id: id of the order
+    """
+
+    attempts = settings.CHECKOUT_MAX_ATTEMPTS
+    for attempt in range(1, attempts + 1):
+        try:
+            _fulfil(Order.objects.get(pk=order_id))
+            return
+        except PaymentDeclined as error:
+            _fail(order_id, error)
+            return
+        except Exception as error:
+            logger.exception('Order %s failed on attempt %s',
+                             order_id, attempt)
+            if attempt == attempts:
+                Order.objects.filter(pk=order_id).update(error=str(error))
+                return
+            time.sleep(settings.CHECKOUT_RETRY_DELAY * 2 ** (attempt - 1))
+
+
+def _fail(order_id, error):
+    """ Fail an order whose payment was declined, never after it was
+    authorized """
+
+    Order.objects.filter(
+        pk=order_id, status=Order.Status.get_value('pending')).update(
+        status=Order.Status.get_value('failed'), error=str(error))
+
+
+def unfinished_orders(older_than):
+    """ Orders left pending or authorized, by a restart or by the errors of
+    their last attempts
+
+    :param older_than: timedelta since the last change of the orders, so
+        the orders of the workers running now are left out
+    :return: queryset of Order
+    """
+
+    return Order.objects.filter(
+        status__in=[Order.Status.get_value('pending'),
+                    Order.Status.get_value('authorized')],
+        date_updated__lt=timezone.now() - older_than)
+
+
+def _fulfil(order):
+    if order.is_finished:
+        return
+
+    if order.status == Order.Status.get_value('pending'):
+        order.payment_reference = get_gateway().authorize(
+            order.total, order.idempotency_key)
+        order.status = Order.Status.get_value('authorized')
+        order.save(update_fields=['payment_reference', 'status',
+                                  'date_updated'])
+
+    if not order.access_granted:
+        _grant_access(order)
+        order.access_granted = True
+        order.save(update_fields=['access_granted', 'date_updated'])
+
+    if not order.receipt_sent:
+        _send_receipt(order)
+        order.receipt_sent = True
+        order.save(update_fields=['receipt_sent', 'date_updated'])
+
+    with transaction.atomic():
+        # Added to the reports once, also when another worker with a stale
+        # copy of the order gets here
+        if (Order.objects.filter(pk=order.pk, reported=False)
+                .update(reported=True)):
+            reports.record_order(order)
+        order.reported = True
+        order.status = Order.Status.get_value('completed')
+        order.error = ''
+        order.save(update_fields=['status', 'reported', 'error',
+                                  'date_updated'])
+
+
+def _grant_access(order):
+    """ Give the user access to the courses of the order """
+
+    item_ids = set(order.lines.exclude(item=None)
+                   .values_list('item_id', flat=True))
+    with transaction.atomic():
+        item_ids -= set(CourseAccess.objects
+                        .filter(user_id=order.user_id, item_id__in=item_ids)
+                        .values_list('item_id', flat=True))
+        CourseAccess.objects.bulk_create([
+            CourseAccess(user_id=order.user_id, item_id=item_id, order=order)
+            for item_id in item_ids
+        ])
+
+
+def _send_receipt(order):
+    lines = ['%s: $ %s' % (name, price) for name, price in
+             order.lines.values_list('name', 'price')]
+    lines.append('Total: $ %s' % order.total)
+    send_mail('Recibo de tu compra #%s' % order.id, '\n'.join(lines),
+              None, [order.user.email])
@@ -0,0 +1,41 @@
+from django.utils.functional import SimpleLazyObject
+
+from . import snapshot
+from .session import SessionCart
+
+
+def get_cart_count(request):
+    """ Number of items of the cart of the request
+
+    The session cart of anonymous users is counted in memory, the cart of
+    logged in users is read from Cart.item_count through the cache.
+    :param request: 
+    :return: int
+    """
+
+    if request.user.is_anonymous:
+        return len(SessionCart(request.session))
+    return snapshot.get_item_count(request.user)
+
+
+async def aget_cart_count(request):
+    """ Async version of get_cart_count """
+
+    user = await request.auser()
+    if user.is_anonymous:
+        return len(await SessionCart.aload(request.session))
+    return await snapshot.aget_item_count(user)
+
+
+def cart(request):
+    """ Expose the number of items of the cart to the templates as cart_count
+
+    It is evaluated only if the template uses it. Async views load it
+    before rendering into request.cart_count, see async_views.
+    :param request: 
+    :return: dict
+    """
+
+    if hasattr(request, 'cart_count'):
+        return {'cart_count': request.cart_count}
+    return {'cart_count': SimpleLazyObject(lambda: get_cart_count(request))}
@@ -0,0 +1,80 @@
+from django.db import transaction
+from django.db.models import F, Func, OuterRef, Subquery
+from django.db.models.signals import m2m_changed, pre_delete
+from django.dispatch import receiver
+
+from . import snapshot
+from .models import Item, Cart, CartLine
+
+
+def item_count_subquery():
+    """ Number of items of the outer cart, always one row, 0 if empty """
+
+    return Subquery(
+        CartLine.objects.filter(cart_id=OuterRef('pk')).order_by()
+        .annotate(count=Func(F('id'), function='COUNT')).values('count'))
+
+
+@receiver(m2m_changed, sender=CartLine)
+def update_item_count(sender, instance, action, reverse, pk_set, **kwargs):
+    """ Keep Cart.item_count in step with the lines added through Cart.items
+
+    The methods of Cart update the count themselves, this covers the items
+    manager, e.g. cart.items.add(item, through_defaults={'price': ...}).
+    Additions apply a delta with F(), since Django reports only the rows
+    it inserted, removals recount the affected carts in the same UPDATE,
+    since Django reports the ids it was asked to remove. Both sides of the
+    relation are handled: when reverse is True the instance is an Item and
+    pk_set holds cart ids. The version moves forward, see Cart.mutate.
+    """
+
+    if action == 'pre_clear' and reverse:
+        instance._cleared_cart_ids = list(
+            instance.cart_set.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if reverse:
+        if action == 'post_clear':
+            pk_set = instance.__dict__.pop('_cleared_cart_ids', [])
+        carts = Cart.objects.filter(pk__in=pk_set)
+        added = 1
+    else:
+        carts = Cart.objects.filter(pk=instance.pk)
+        added = len(pk_set or ())
+
+    if action == 'post_add':
+        if added:
+            carts.update(item_count=F('item_count') + added,
+                         version=F('version') + 1)
+    elif action == 'post_remove':
+        carts.update(item_count=item_count_subquery(),
+                     version=F('version') + 1)
+    elif reverse:
+        carts.update(item_count=F('item_count') - 1,
+                     version=F('version') + 1)
+    else:
+        carts.update(item_count=0, version=F('version') + 1)
+
+
+@receiver(pre_delete, sender=Item)
+def discount_deleted_item(sender, instance, **kwargs):
+    """ The lines of a deleted item are removed by the cascade
+
+    The carts that contain it lose one item and the price of its line, and
+    the cached carts of their users are discarded once the deletion is
+    committed, see cart.snapshot.
+    """
+
+    carts = Cart.objects.filter(lines__item=instance)
+    user_ids = list(carts.filter(active=True)
+                    .values_list('user_id', flat=True))
+    line_price = CartLine.objects.filter(
+        cart_id=OuterRef('pk'), item=instance).values('price')
+    carts.update(
+        item_count=F('item_count') - 1,
+        total=F('total') - Subquery(line_price),
+        version=F('version') + 1)
+    if user_ids:
+        transaction.on_commit(lambda: snapshot.invalidate_many(user_ids))
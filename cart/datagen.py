@@ -0,0 +1,304 @@
+import random
+import re
+import string
+from datetime import timedelta
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import search
+from .models import Cart, CartLine, Item
+from .session import SessionCart
+from .utils import batched
+
+WORDS = ['Adobe', 'Photoshop', 'Illustrator', 'Blender', 'Unity', 'After',
+         'Effects', 'Diseño', 'Fotografía', 'Animación', 'Ilustración',
+         'Modelado', 'Personajes', 'Producto', 'Digital', 'Avanzada', 'Web',
+         'Retoque', 'Iluminación', 'Composición', 'Videojuegos', '3D',
+         'Tipografía', 'Color', 'Retrato', 'Paisaje', 'Interfaces', 'Móvil']
+
+# Made up words of three syllables, the less frequent words of the names
+SYLLABLES = ['ba', 'ce', 'di', 'fo', 'gu', 'la', 'me', 'ni', 'po', 'ra',
+             'se', 'to', 'vu', 'za', 'be', 'ci', 'do', 'mu', 'ro', 'te']
+RARE_WORDS = [first + second + third for first in SYLLABLES
+              for second in SYLLABLES for third in SYLLABLES]
+
+# Prefix of the usernames of the generated users
+USER_PREFIX = 'shopper'
+PASSWORD = 'shop_1234'
+SESSION_KEY_CHARS = string.ascii_lowercase + string.digits
+
+
+def fake_items(count, seed=0, first_id=None, days=0):
+    """ Items named with two words of the catalogue and two rare words,
+    always the same for the same seed
+
+    Each catalogue word is in about one of every fourteen names and each
+    rare word in one of every four thousand.
+    :param first_id: id of the first item, the database assigns them if None
+    :param days: the items are created at random in the last days
+    """
+
+    generator = random.Random(seed)
+    categories = [category.value[0] for category in Item.Category]
+    levels = [level.value[0] for level in Item.Level]
+    now = timezone.now()
+    for number in range(count):
+        words = (generator.sample(WORDS, 2) +
+                 generator.sample(RARE_WORDS, 2))
+        generator.shuffle(words)
+        item = Item(name=' '.join(words),
+                    category=generator.choice(categories),
+                    level=generator.choice(levels),
+                    price=generator.randint(5, 60))
+        if first_id is not None:
+            item.id = first_id + number
+        if days:
+            item.date_created = now - timedelta(
+                seconds=generator.randint(0, days * 86400))
+        yield item
+
+
+class SizeDistribution(object):
+    """ Number of items of the generated carts
+
+    Built from 'geometric:MEAN', most carts small and a long tail,
+    'uniform:MIN:MAX' or 'fixed:SIZE'. Sizes are at least 1 and at most
+    maximum.
+    """
+
+    PATTERN = re.compile(r'^(geometric|uniform|fixed)((?::\d+(?:\.\d+)?)+)$')
+
+    def __init__(self, spec, maximum=1000):
+        match = self.PATTERN.match(spec)
+        if match is None:
+            raise ValueError('%r is not a size distribution, use '
+                             'geometric:MEAN, uniform:MIN:MAX or fixed:SIZE'
+                             % spec)
+        self.kind = match.group(1)
+        self.params = [float(param) for param in
+                       match.group(2).split(':')[1:]]
+        if len(self.params) != (2 if self.kind == 'uniform' else 1):
+            raise ValueError('Wrong number of parameters in %r' % spec)
+        self.spec = spec
+        self.maximum = maximum
+
+    def __repr__(self):
+        return self.spec
+
+    def sample(self, generator):
+        """ Draw a size with a random.Random """
+
+        if self.kind == 'fixed':
+            size = self.params[0]
+        elif self.kind == 'uniform':
+            size = generator.randint(int(self.params[0]),
+                                     int(self.params[1]))
+        else:
+            # Number of trials until the first success, with mean MEAN
+            mean = max(self.params[0], 1)
+            size = 1
+            while generator.random() > 1 / mean:
+                size += 1
+                if size >= self.maximum:
+                    break
+        return int(min(max(size, 1), self.maximum))
+
+
+class Plan(object):
+    """ Ids reserved for the rows of one run and how to build them
+
+    Every row comes from a random generator seeded with the seed, the kind
+    of the rows and the number of the chunk, and the ids are decided up
+    front, so the chunks can be built in any order by any process and the
+    result is the same for the same seed and the same starting database.
+    """
+
+    def __init__(self, seed=0, items=0, users=0, cart_ratio=0.5,
+                 cart_size='geometric:3', sessions=0, days=90,
+                 password=PASSWORD, chunk_size=20000, batch_size=2000):
+        self.seed = seed
+        self.items = items
+        self.users = users
+        self.cart_ratio = cart_ratio
+        self.cart_size = (cart_size if isinstance(cart_size, SizeDistribution)
+                          else SizeDistribution(cart_size))
+        self.sessions = sessions
+        self.days = days
+        # One hash shared by every user, hashing each password would take
+        # longer than the rest of the run
+        self.encoded_password = make_password(
+            password, salt='%s%s' % (USER_PREFIX, seed))
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+
+        self.first_item = self._next_id(Item)
+        self.first_user = self._next_id(User)
+        self.first_cart = self._next_id(Cart)
+        # The carts and sessions pick from the items that exist once the
+        # new ones are created
+        last = Item.objects.order_by('-id').values_list('id', flat=True)
+        self.item_range = (
+            Item.objects.order_by('id').values_list('id', flat=True).first()
+            or self.first_item,
+            max(last.first() or 0, self.first_item + items - 1))
+
+    def _next_id(self, model):
+        last = model.objects.order_by('-pk').values_list('pk', flat=True)
+        return (last.first() or 0) + 1
+
+    def chunks(self, kind, count):
+        return [(kind, number) for number in
+                range((count + self.chunk_size - 1) // self.chunk_size)]
+
+    def tasks(self):
+        """ Chunks of each phase; the chunks of a phase are independent, the
+        second phase needs the items and users of the first """
+
+        return [
+            self.chunks('items', self.items) +
+            self.chunks('users', self.users),
+            self.chunks('carts', self.users) +
+            self.chunks('sessions', self.sessions),
+        ]
+
+    def generator(self, kind, number):
+        return random.Random('%s-%s-%d' % (self.seed, kind, number))
+
+    def span(self, count, number):
+        """ Offset and size of a chunk """
+
+        start = number * self.chunk_size
+        return start, min(self.chunk_size, count - start)
+
+    def build(self, kind, number):
+        """ Create the rows of a chunk
+
+        :return: number of rows created
+        """
+
+        return getattr(self, 'build_' + kind)(number)
+
+    def build_items(self, number):
+        start, count = self.span(self.items, number)
+        items = fake_items(count, '%s-items-%d' % (self.seed, number),
+                           self.first_item + start, self.days)
+        for batch in batched(items, self.batch_size):
+            with transaction.atomic():
+                Item.objects.bulk_create(batch)
+                search.index_items(batch)
+        return count
+
+    def build_users(self, number):
+        generator = self.generator('users', number)
+        start, count = self.span(self.users, number)
+        now = timezone.now()
+        users = (User(id=self.first_user + start + offset,
+                      username='%s%d' % (USER_PREFIX,
+                                         self.first_user + start + offset),
+                      password=self.encoded_password,
+                      date_joined=now - timedelta(seconds=generator.randint(
+                          0, self.days * 86400)))
+                 for offset in range(count))
+        for batch in batched(users, self.batch_size):
+            User.objects.bulk_create(batch)
+        return count
+
+    def sample_items(self, generator):
+        """ Ids of the items of a cart, some may not exist """
+
+        low, high = self.item_range
+        size = min(self.cart_size.sample(generator), high - low + 1)
+        return generator.sample(range(low, high + 1), size)
+
+    def prices(self, carts):
+        """ Prices of the items of many carts, in a single query """
+
+        ids = {item_id for item_ids in carts for item_id in item_ids}
+        return dict(Item.objects.filter(id__in=ids)
+                    .values_list('id', 'price').order_by())
+
+    def build_carts(self, number):
+        """ An active cart for cart_ratio of the users of the chunk, with
+        its lines, total and item count """
+
+        generator = self.generator('carts', number)
+        start, count = self.span(self.users, number)
+        now = timezone.now()
+        created = 0
+        for offsets in batched(range(start, start + count), self.batch_size):
+            drawn = []
+            for offset in offsets:
+                if generator.random() < self.cart_ratio:
+                    date_created = now - timedelta(
+                        seconds=generator.randint(0, self.days * 86400))
+                    drawn.append((offset, date_created,
+                                  self.sample_items(generator)))
+            prices = self.prices(item_ids for _, _, item_ids in drawn)
+
+            carts, lines = [], []
+            for offset, date_created, item_ids in drawn:
+                items = [(item_id, prices[item_id]) for item_id in item_ids
+                         if item_id in prices]
+                cart = Cart(id=self.first_cart + offset,
+                            user_id=self.first_user + offset,
+                            date_created=date_created,
+                            total=sum(price for _, price in items),
+                            item_count=len(items))
+                carts.append(cart)
+                age = int((now - date_created).total_seconds())
+                lines.extend(
+                    CartLine(cart_id=cart.id, item_id=item_id, price=price,
+                             date_added=now - timedelta(
+                                 seconds=generator.randint(0, age)))
+                    for item_id, price in items)
+            with transaction.atomic():
+                Cart.objects.bulk_create(carts)
+                CartLine.objects.bulk_create(lines)
+            created += len(carts)
+        return created
+
+    def build_sessions(self, number):
+        """ Sessions of guests holding a cart, as SessionCart stores it """
+
+        generator = self.generator('sessions', number)
+        start, count = self.span(self.sessions, number)
+        engine = import_module(settings.SESSION_ENGINE)
+        model = engine.SessionStore.get_model_class()
+        store = engine.SessionStore()
+        expire_date = timezone.now() + timedelta(
+            seconds=settings.SESSION_COOKIE_AGE)
+        for offsets in batched(range(count), self.batch_size):
+            drawn = [(''.join(generator.choice(SESSION_KEY_CHARS)
+                              for _ in range(32)),
+                      self.sample_items(generator)) for _ in offsets]
+            prices = self.prices(item_ids for _, item_ids in drawn)
+
+            sessions = []
+            for key, item_ids in drawn:
+                item_ids = [item_id for item_id in item_ids
+                            if item_id in prices]
+                sessions.append(model(
+                    session_key=key, expire_date=expire_date,
+                    session_data=store.encode({
+                        SessionCart.SESSION_KEY: item_ids,
+                        SessionCart.COUNT_KEY: len(item_ids)})))
+            model.objects.bulk_create(sessions, ignore_conflicts=True)
+        return count
+
+    def finish(self):
+        """ Move the sequences past the ids given explicitly and compact the
+        search index """
+
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), [Item, User, Cart])
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+        if self.items:
+            search.get_backend().optimize()
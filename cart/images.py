@@ -0,0 +1,112 @@
+import hashlib
+import logging
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from PIL import Image, features
+
+from . import catalogue
+from .models import Item
+from .utils import RENDITION_SIZES, rendition_name
+
+FORMATS = [
+    ('webp', 'WEBP', {'quality': 80, 'method': 6}),
+    ('jpg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+]
+
+logger = logging.getLogger(__name__)
+
+
+def available_formats():
+    """ Formats of FORMATS supported by the installed Pillow """
+
+    return [fmt for fmt in FORMATS
+            if fmt[0] != 'webp' or features.check('webp')]
+
+
+def content_hash(storage, name):
+    """ Short hash of the content of a stored file """
+
+    digest = hashlib.sha1()
+    with storage.open(name, 'rb') as source:
+        for chunk in iter(lambda: source.read(64 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def render(storage, name, image_hash=None):
+    """ Create the renditions of an image next to the original
+
+    Renditions are named after the original, its content hash, the width
+    and the format, e.g. items/blender.3f9a1b2c4d5e.80.webp, so they never
+    go stale in browser caches. Existing renditions are not generated again.
+    It does not touch the database so it can run in worker processes.
+    :param storage: storage of the image
+    :param name: name of the image in the storage
+    :param image_hash: content hash of the image, if already known
+    :return: tuple with the content hash and the generated extensions
+    """
+
+    image_hash = image_hash or content_hash(storage, name)
+    formats = available_formats()
+
+    with storage.open(name, 'rb') as source:
+        original = Image.open(source)
+        original.load()
+    if original.mode not in ('RGB', 'RGBA'):
+        original = original.convert('RGBA')
+
+    for width in RENDITION_SIZES.values():
+        image = original.copy()
+        image.thumbnail((width, width * 4), Image.LANCZOS)
+        for extension, pil_format, options in formats:
+            rendition = rendition_name(name, image_hash, width, extension)
+            if storage.exists(rendition):
+                continue
+            output = image
+            if pil_format == 'JPEG' and image.mode == 'RGBA':
+                output = Image.new('RGB', image.size, (255, 255, 255))
+                output.paste(image, mask=image.split()[3])
+            buffer = BytesIO()
+            output.save(buffer, pil_format, **options)
+            storage.save(rendition, ContentFile(buffer.getvalue()))
+
+    return image_hash, ','.join(extension for extension, _, _ in formats)
+
+
+def update_item(item_id, image_hash, image_formats):
+    """ Save the result of render without sending post_save again """
+
+    Item.objects.filter(pk=item_id).update(image_hash=image_hash,
+                                           image_formats=image_formats)
+
+
+@receiver(post_save, sender=Item)
+def render_item_image(sender, instance, raw=False, **kwargs):
+    """ Create the renditions of the image of an item when it changes
+
+    Fixtures are skipped, the generate_renditions command backfills them.
+    A file that is not an image is logged and the item keeps its previous
+    renditions, the item itself is already saved.
+    """
+
+    if raw or not instance.image:
+        return
+    storage = instance.image.storage
+    if not storage.exists(instance.image.name):
+        return
+    try:
+        image_hash = content_hash(storage, instance.image.name)
+        if image_hash == instance.image_hash:
+            return
+        result = render(storage, instance.image.name, image_hash)
+    except (OSError, Image.UnidentifiedImageError):
+        logger.exception('Renditions of item %s failed, image %s',
+                         instance.pk, instance.image.name)
+        return
+
+    instance.image_hash, instance.image_formats = result
+    update_item(instance.pk, instance.image_hash, instance.image_formats)
+    catalogue.invalidate()
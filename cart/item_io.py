@@ -0,0 +1,109 @@
+import csv
+import json
+
+from django.core.exceptions import ValidationError
+
+from .models import Item
+
+FIELDS = ['id', 'name', 'category', 'level', 'price', 'image']
+FORMATS = ('csv', 'jsonl')
+
+
+def guess_format(path):
+    """ Format of a file by its extension, csv unless it is .jsonl or
+    .ndjson
+
+    :raise ValueError: for .json, a JSON array is not read one line at a
+        time
+    """
+
+    if path.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    if path.endswith('.json'):
+        raise ValueError('%s: JSON arrays are not supported, use JSON lines '
+                         'in a .jsonl file or --format jsonl' % path)
+    return 'csv'
+
+
+def read_rows(stream, file_format):
+    """ Read the rows of a CSV or JSONL stream one at a time
+
+    :param stream: text file object
+    :param file_format: 'csv' or 'jsonl'
+    :return: generator of (line number, dict) tuples, the dict is None if
+        the line is not valid JSON
+    """
+
+    if file_format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_number, line in enumerate(stream, 1):
+            if line.strip():
+                try:
+                    yield line_number, json.loads(line)
+                except ValueError:
+                    yield line_number, None
+
+
+def write_rows(stream, file_format, rows):
+    """ Write rows of FIELDS values as CSV or JSONL
+
+    :param stream: text file object
+    :param file_format: 'csv' or 'jsonl'
+    :param rows: iterable of tuples in the order of FIELDS
+    """
+
+    if file_format == 'csv':
+        writer = csv.writer(stream)
+        writer.writerow(FIELDS)
+        writer.writerows(rows)
+    else:
+        for row in rows:
+            stream.write(json.dumps(dict(zip(FIELDS, row)),
+                                    ensure_ascii=False, default=str) + '\n')
+
+
+def choice_value(enum, value):
+    """ Stored value of a choice, given as value ('des') or name ('design')
+
+    :raise ValidationError: if it is not a member of the enum
+    """
+
+    if value in {member.value[0] for member in enum}:
+        return value
+    try:
+        return enum.get_value(value)
+    except (KeyError, TypeError):
+        raise ValidationError('%r is not a valid %s'
+                              % (value, enum.__name__.lower()))
+
+
+def parse_row(row):
+    """ Build an Item from a row, validating it like the model does
+
+    :param row: dict with the FIELDS, id and image are optional
+    :return: Item instance, with id if the row has one
+    :raise ValidationError: if the row is not valid
+    """
+
+    if not isinstance(row, dict):
+        raise ValidationError('The row is not an object')
+
+    item_id = row.get('id')
+    try:
+        item_id = int(item_id) if item_id not in (None, '') else None
+    except (TypeError, ValueError):
+        raise ValidationError('%r is not a valid id' % item_id)
+    item = Item(
+        id=item_id,
+        name=row.get('name'),
+        category=choice_value(Item.Category, row.get('category')),
+        level=choice_value(Item.Level, row.get('level')),
+        price=row.get('price'),
+        image=row.get('image') or '',
+    )
+    item.clean_fields(exclude=['id', 'date_created', 'image_hash',
+                               'image_formats'])
+    return item
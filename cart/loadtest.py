@@ -0,0 +1,430 @@
+import http.client
+import io
+import random
+import threading
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+from wsgiref.util import setup_testing_defaults
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connections, transaction
+from django.urls import Resolver404, resolve, reverse
+
+from . import catalogue, search
+from .datagen import fake_items
+from .models import Item
+from .utils import batched, percentile
+
+# Prefix of the usernames created by seed_users
+USER_PREFIX = 'loadtest'
+PASSWORD = 'load_1234'
+
+
+class ScenarioError(Exception):
+    """ A response of a scenario was not the expected one """
+
+
+def seed_users(count, password=PASSWORD, batch_size=1000):
+    """ Create the users that log in during the buy scenario
+
+    The password is hashed once and shared, hashing it for each user would
+    take minutes. Users created by a previous run are kept.
+    :param count: number of users
+    :return: number of users created
+    """
+
+    encoded = make_password(password)
+    existing = set(User.objects.filter(username__startswith=USER_PREFIX)
+                   .values_list('username', flat=True))
+    users = (User(username='%s%d' % (USER_PREFIX, number), password=encoded)
+             for number in range(count)
+             if '%s%d' % (USER_PREFIX, number) not in existing)
+    created = 0
+    for batch in batched(users, batch_size):
+        User.objects.bulk_create(batch)
+        created += len(batch)
+    return created
+
+
+def seed_items(count, seed=0, batch_size=5000):
+    """ Create synthetic items, indexed for the search
+
+    :param count: number of items
+    :param seed: seed of the names and prices
+    :return: number of items created
+    """
+
+    for batch in batched(fake_items(count, seed), batch_size):
+        with transaction.atomic():
+            Item.objects.bulk_create(batch)
+            search.index_items(batch)
+    search.get_backend().optimize()
+    catalogue.invalidate()
+    return count
+
+
+class WSGITransport(object):
+    """ Call a WSGI application in the same process """
+
+    def __init__(self, application, host='localhost'):
+        self.application = application
+        self.host = host
+
+    def request(self, method, path, headers, body):
+        """ Send a request
+
+        :param method: HTTP method
+        :param path: path with the query string
+        :param headers: dict of header names and values
+        :param body: bytes
+        :return: tuple with the status, list of header tuples and the body
+        """
+
+        url = urlsplit(path)
+        environ = {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': url.path,
+            'QUERY_STRING': url.query,
+            'HTTP_HOST': self.host,
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': io.BytesIO(body),
+        }
+        for name, value in headers.items():
+            key = name.upper().replace('-', '_')
+            if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                key = 'HTTP_' + key
+            environ[key] = value
+        setup_testing_defaults(environ)
+
+        started = []
+        response = self.application(
+            environ, lambda status, response_headers, exc_info=None:
+            started.append((status, response_headers)))
+        try:
+            content = b''.join(response)
+        finally:
+            if hasattr(response, 'close'):
+                response.close()
+        status, response_headers = started[0]
+        return int(status.split()[0]), response_headers, content
+
+    def close(self):
+        pass
+
+
+class HTTPTransport(object):
+    """ Send requests to a running server over one keep-alive connection """
+
+    def __init__(self, base_url, timeout=30):
+        url = urlsplit(base_url)
+        self.host = url.netloc
+        self.connection_class = (http.client.HTTPSConnection
+                                 if url.scheme == 'https'
+                                 else http.client.HTTPConnection)
+        self.timeout = timeout
+        self.connection = None
+
+    def request(self, method, path, headers, body):
+        if self.connection is None:
+            self.connection = self.connection_class(self.host,
+                                                    timeout=self.timeout)
+        try:
+            self.connection.request(method, path, body=body or None,
+                                    headers=headers)
+            response = self.connection.getresponse()
+            content = response.read()
+        except (OSError, http.client.HTTPException):
+            # The server may close the connection, open a new one next time
+            self.close()
+            raise
+        return response.status, response.getheaders(), content
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class Browser(object):
+    """ A visitor of the shop: keeps the cookies and records each request
+
+    Redirects are not followed, every page of a scenario is requested
+    explicitly so that it is measured under its own url name.
+    """
+
+    def __init__(self, transport, stats):
+        self.transport = transport
+        self.stats = stats
+        self.cookies = {}
+
+    def request(self, method, path, data=None, expect=(200, 302)):
+        """ Send a request with the cookies of the browser
+
+        :param data: dict sent as a form, with the CSRF token of the cookie
+        :param expect: status codes that are not errors
+        :return: tuple with the status and the body
+        :raise ScenarioError: if the status is not expected
+        """
+
+        headers = {'Referer': 'http://localhost/', 'Accept': 'text/html'}
+        body = b''
+        if data is not None:
+            data = dict(data, csrfmiddlewaretoken=self.cookies.get(
+                'csrftoken', ''))
+            body = urlencode(data).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if self.cookies:
+            headers['Cookie'] = '; '.join(
+                '%s=%s' % cookie for cookie in self.cookies.items())
+
+        url_name = self.url_name(path)
+        start = time.perf_counter()
+        try:
+            status, response_headers, content = self.transport.request(
+                method, path, headers, body)
+        except Exception as error:
+            self.stats.record(url_name, None, time.perf_counter() - start)
+            raise ScenarioError('%s %s: %r' % (method, path, error))
+        self.stats.record(url_name, status, time.perf_counter() - start,
+                          status not in expect)
+
+        for name, value in response_headers:
+            if name.lower() == 'set-cookie':
+                for morsel in SimpleCookie(value).values():
+                    if morsel['max-age'] in (0, '0'):
+                        self.cookies.pop(morsel.key, None)
+                    else:
+                        self.cookies[morsel.key] = morsel.value
+        if status not in expect:
+            raise ScenarioError('%s %s: status %d' % (method, path, status))
+        return status, content
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, data, **kwargs):
+        return self.request('POST', path, data, **kwargs)
+
+    def url_name(self, path):
+        try:
+            return resolve(urlsplit(path).path).url_name
+        except Resolver404:
+            return path
+
+
+class Stats(object):
+    """ Latencies and errors of the requests, by url name """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.sessions = 0
+        self.failed_sessions = 0
+
+    def record(self, url_name, status, seconds, error=False):
+        """ Record a request, status None when it got no response """
+
+        with self.lock:
+            self.latencies.setdefault(url_name, []).append(seconds)
+            self.errors.setdefault(url_name, 0)
+            if status is None or error:
+                self.errors[url_name] += 1
+
+    def record_session(self, failed):
+        with self.lock:
+            self.sessions += 1
+            self.failed_sessions += failed
+
+    def summary(self, elapsed):
+        """ Throughput, latency percentiles in milliseconds and error rate
+        of each url name
+
+        :param elapsed: seconds of the run
+        :return: list of dicts, sorted by url name
+        """
+
+        rows = []
+        for url_name, latencies in sorted(self.latencies.items()):
+            rows.append({
+                'url_name': url_name,
+                'requests': len(latencies),
+                'throughput': len(latencies) / elapsed,
+                'p50': percentile(latencies, 50) * 1000,
+                'p95': percentile(latencies, 95) * 1000,
+                'p99': percentile(latencies, 99) * 1000,
+                'max': max(latencies) * 1000,
+                'errors': self.errors[url_name],
+                'error_rate': self.errors[url_name] / float(len(latencies)),
+            })
+        return rows
+
+
+def browse(browser, context):
+    """ A guest looks at the catalogue: pages, filters and a search """
+
+    rng = context.random
+    browser.get(reverse('item_list'))
+    context.pause()
+    browser.get(reverse('item_list') + '?' + urlencode({
+        'category': rng.choice(context.categories)}))
+    context.pause()
+    browser.get(reverse('item_list') + '?' + urlencode({
+        'level': rng.choice(context.levels)}))
+    context.pause()
+    browser.get(reverse('item_list') + '?' + urlencode({
+        'q': rng.choice(search.SAMPLE_QUERIES)}))
+
+
+def shop(browser, context):
+    """ A guest fills a cart, looks at it and changes their mind """
+
+    rng = context.random
+    browser.get(reverse('item_list'))
+    items = rng.sample(context.item_ids, rng.randint(1, 4))
+    for item_id in items:
+        context.pause()
+        browser.get(reverse('item_add', args=[item_id]))
+    context.pause()
+    browser.get(reverse('cart_detail'))
+    context.pause()
+    browser.get(reverse('cart_remove_item', args=[items[0]]))
+    browser.get(reverse('cart_detail'))
+
+
+def buy(browser, context):
+    """ A guest fills a cart, logs in to pay, which merges the cart of the
+    session, pays and logs out """
+
+    rng = context.random
+    browser.get(reverse('item_list'))
+    for item_id in rng.sample(context.item_ids, rng.randint(1, 3)):
+        context.pause()
+        browser.get(reverse('item_add', args=[item_id]))
+    context.pause()
+    browser.get(reverse('cart_detail'))
+    context.pause()
+    browser.get(reverse('cart_pay'))
+    browser.get(reverse('login'))
+    context.pause()
+    status, _ = browser.post(reverse('login'), {
+        'username': context.next_username(), 'password': context.password})
+    if status != 302:
+        raise ScenarioError('The login failed')
+    browser.get(reverse('cart_pay'))
+    context.pause()
+    browser.get(reverse('cart_pay_method'))
+    browser.post(reverse('logout'), {})
+
+
+SCENARIOS = {
+    'browse': browse,
+    'shop': shop,
+    'buy': buy,
+}
+
+# Share of the visits of each scenario
+DEFAULT_MIX = {'browse': 6, 'shop': 3, 'buy': 1}
+
+
+class Context(object):
+    """ Data and random generator of one virtual user
+
+    Each virtual user logs in with its own users, so that two concurrent
+    visits never pay the same cart.
+    """
+
+    def __init__(self, number, concurrency, item_ids, usernames, password,
+                 think_time, seed):
+        self.random = random.Random('%s-%d' % (seed, number))
+        self.item_ids = item_ids
+        self.usernames = usernames[number::concurrency]
+        self.password = password
+        self.think_time = think_time
+        self.visits = 0
+        self.categories = [category.value[0] for category in Item.Category]
+        self.levels = [level.value[0] for level in Item.Level]
+
+    def next_username(self):
+        if not self.usernames:
+            raise ScenarioError('No users to log in, seed them first')
+        username = self.usernames[self.visits % len(self.usernames)]
+        self.visits += 1
+        return username
+
+    def pause(self):
+        """ Wait a random think time, exponential with the mean given """
+
+        if self.think_time:
+            time.sleep(self.random.expovariate(1.0 / self.think_time))
+
+
+def run(transport_factory, mix=None, concurrency=10, duration=None,
+        visits=None, think_time=0, seed=0, password=PASSWORD):
+    """ Replay visits of the scenarios with concurrent virtual users
+
+    The run stops after duration seconds or after the given number of
+    visits, whichever comes first.
+    :param transport_factory: function that returns a new transport for
+        each virtual user
+    :param mix: dict of scenario names and weights, DEFAULT_MIX by default
+    :param concurrency: number of virtual users, each one a thread
+    :param think_time: mean seconds a visitor waits between pages
+    :param seed: seed of the choices of the virtual users
+    :return: tuple with the Stats and the elapsed seconds
+    """
+
+    mix = mix or DEFAULT_MIX
+    names = [name for name in mix if mix[name] > 0]
+    weights = [mix[name] for name in names]
+    item_ids = list(Item.objects.order_by('id').values_list('id', flat=True))
+    if not item_ids:
+        raise ScenarioError('There are no items, seed them first')
+    usernames = list(User.objects.filter(username__startswith=USER_PREFIX)
+                     .order_by('id').values_list('username', flat=True))
+
+    stats = Stats()
+    lock = threading.Lock()
+    remaining = [visits]
+    deadline = time.perf_counter() + duration if duration else None
+
+    def take_visit():
+        if deadline is not None and time.perf_counter() >= deadline:
+            return False
+        with lock:
+            if remaining[0] is None:
+                return True
+            if remaining[0] <= 0:
+                return False
+            remaining[0] -= 1
+            return True
+
+    def virtual_user(number):
+        context = Context(number, concurrency, item_ids, usernames,
+                          password, think_time, seed)
+        transport = transport_factory()
+        try:
+            while take_visit():
+                scenario = SCENARIOS[context.random.choices(
+                    names, weights)[0]]
+                browser = Browser(transport, stats)
+                try:
+                    scenario(browser, context)
+                except ScenarioError:
+                    stats.record_session(True)
+                else:
+                    stats.record_session(False)
+        finally:
+            transport.close()
+            connections.close_all()
+
+    threads = [threading.Thread(target=virtual_user, args=(number,))
+               for number in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return stats, time.perf_counter() - start
@@ -0,0 +1,117 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.util import setup_testing_defaults
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from cart.utils import percentile
+
+DEPLOYMENTS = [
+    ('wsgi', 'cart.urls'),
+    ('asgi', 'cart.async_urls'),
+]
+
+
+class Command(BaseCommand):
+    """ Compare the WSGI and ASGI deployments at a fixed concurrency
+
+    Both applications are driven in process, without a server in between,
+    so the numbers compare the handlers and the views: WSGI requests run in
+    a pool of threads and ASGI requests are tasks of one event loop. It
+    uses the configured database, which should be migrated and loaded.
+    """
+
+    help = 'Compare requests per second of the WSGI and ASGI deployments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Path to request, can be repeated')
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--requests', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or ['/', '/cart/']
+        concurrency = options['concurrency']
+        requests = [paths[number % len(paths)]
+                    for number in range(options['requests'])]
+
+        self.stdout.write('%d requests, concurrency %d, paths %s' % (
+            len(requests), concurrency, ' '.join(paths)))
+        for name, urlconf in DEPLOYMENTS:
+            with override_settings(ROOT_URLCONF=urlconf,
+                                   ALLOWED_HOSTS=['localhost']):
+                run = self.run_wsgi if name == 'wsgi' else self.run_asgi
+                # Warm up caches and connections before measuring
+                run(paths * concurrency, concurrency)
+                start = time.perf_counter()
+                results = run(requests, concurrency)
+                elapsed = time.perf_counter() - start
+
+            latencies = [latency for status, latency in results]
+            errors = sum(1 for status, latency in results if status >= 500)
+            self.stdout.write(
+                '%s: %.1f req/s, p50 %.2f ms, p95 %.2f ms, %d errors' % (
+                    name, len(results) / elapsed,
+                    percentile(latencies, 50) * 1000,
+                    percentile(latencies, 95) * 1000, errors))
+
+    def run_wsgi(self, paths, concurrency):
+        application = WSGIHandler()
+
+        def request(path):
+            environ = {'PATH_INFO': path, 'HTTP_HOST': 'localhost'}
+            setup_testing_defaults(environ)
+            status = []
+            start = time.perf_counter()
+            response = application(
+                environ, lambda code, headers: status.append(code))
+            for chunk in response:
+                pass
+            response.close()
+            return int(status[0].split()[0]), time.perf_counter() - start
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            return list(pool.map(request, paths))
+
+    def run_asgi(self, paths, concurrency):
+        application = ASGIHandler()
+
+        async def request(path, semaphore):
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'},
+                'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+                'path': path, 'raw_path': path.encode(), 'query_string': b'',
+                'root_path': '', 'headers': [(b'host', b'localhost')],
+                'client': ('127.0.0.1', 50000), 'server': ('localhost', 80),
+            }
+            messages = []
+            pending = [{'type': 'http.request', 'body': b'',
+                        'more_body': False}]
+            finished = asyncio.Event()
+
+            async def receive():
+                if pending:
+                    return pending.pop()
+                # Django listens for the disconnect once the body is read
+                await finished.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                messages.append(message)
+
+            async with semaphore:
+                start = time.perf_counter()
+                await application(scope, receive, send)
+                finished.set()
+                return messages[0]['status'], time.perf_counter() - start
+
+        async def run():
+            semaphore = asyncio.Semaphore(concurrency)
+            return await asyncio.gather(
+                *[request(path, semaphore) for path in paths])
+
+        return asyncio.run(run())
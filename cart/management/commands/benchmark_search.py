@@ -0,0 +1,79 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from cart import catalogue, search
+from cart.datagen import fake_items
+from cart.models import Item
+from cart.utils import batched, percentile
+
+# Filters of category and level applied to the measured queries in turn
+FILTERS = [(None, None), ('des', None), (None, 'a')]
+
+
+class Command(BaseCommand):
+    """ Measure the latency of the search index
+
+    Each query is run against the index without the cache: the first page
+    of a search queries the ranked ids, the facet counts and the items, the
+    next pages and filters of the same words reuse the cached counts.
+    --seed adds synthetic items first, e.g. --seed 500000 to measure a
+    large catalogue. It uses the configured database.
+    """
+
+    help = 'Measure the latency of searches on the item index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--query', action='append', dest='queries',
+                            help='Query to measure, can be repeated')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Number of synthetic items created first')
+        parser.add_argument('--repeat', type=int, default=100,
+                            help='Number of times each query is run')
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            self.seed(options['seed'])
+
+        self.stdout.write('%d items indexed' % Item.objects.count())
+        backend = search.get_backend()
+        for query in options['queries'] or search.SAMPLE_QUERIES:
+            terms = search.search_terms(query)
+            # Warm up the page cache of the database
+            counts = backend.facet_counts(terms)
+
+            first, page = [], []
+            for number in range(options['repeat']):
+                category, level = FILTERS[number % len(FILTERS)]
+                first.append(self.measure(terms, category, level))
+                page.append(self.measure(terms, category, level, counts))
+
+            self.stdout.write(
+                '%r: %d matches, first page p50 %.2f ms p95 %.2f ms, '
+                'next pages p50 %.2f ms p95 %.2f ms' % (
+                    query, sum(counts.values()),
+                    percentile(first, 50) * 1000,
+                    percentile(first, 95) * 1000,
+                    percentile(page, 50) * 1000,
+                    percentile(page, 95) * 1000))
+
+    def measure(self, terms, category, level, counts=None):
+        """ Seconds to search a page, with the facet counts of the terms if
+        they were cached already """
+
+        start = time.perf_counter()
+        search.search_index(terms, category, level, 1, catalogue.PAGE_SIZE,
+                            counts)
+        return time.perf_counter() - start
+
+    def seed(self, count):
+        start = time.perf_counter()
+        for batch in batched(fake_items(count), 5000):
+            with transaction.atomic():
+                Item.objects.bulk_create(batch)
+                search.index_items(batch)
+        search.get_backend().optimize()
+        catalogue.invalidate()
+        self.stdout.write('%d items created (%d items/s)' % (
+            count, count / (time.perf_counter() - start)))
@@ -0,0 +1,102 @@
+from importlib import import_module
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from cart import middleware
+from cart.models import Item
+
+ENGINES = [
+    'django.contrib.sessions.backends.db',
+    'django.contrib.sessions.backends.cached_db',
+    'cart.session',
+    'django.contrib.sessions.backends.cache',
+    'django.contrib.sessions.backends.signed_cookies',
+]
+
+
+class Command(BaseCommand):
+    """ Compare the session engines on the requests of an anonymous cart
+
+    Each round replays the same visit with a new client: the list, three
+    items added, the cart, an item removed, an item added again and the
+    payment page. The session time is measured by PerformanceMiddleware
+    and the queries to django_session are counted. It uses the configured
+    database, which should be migrated and loaded, and deletes the
+    sessions it creates.
+    """
+
+    help = 'Compare the session engines on an anonymous shopping visit'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--engine', action='append', dest='engines',
+                            help='Session engine to measure, can be '
+                                 'repeated')
+        parser.add_argument('--rounds', type=int, default=50,
+                            help='Number of visits replayed per engine')
+
+    def handle(self, *args, **options):
+        item_ids = list(Item.objects.order_by('id')
+                        .values_list('id', flat=True)[:3])
+        if len(item_ids) < 3:
+            raise CommandError('At least 3 items are needed, load '
+                               'cart/fixtures/item.json')
+        paths = [reverse('item_list')]
+        paths += [reverse('item_add', args=[item_id])
+                  for item_id in item_ids]
+        paths += [reverse('cart_detail'),
+                  reverse('cart_remove_item', args=[item_ids[0]]),
+                  reverse('item_add', args=[item_ids[1]]),
+                  reverse('cart_pay')]
+
+        self.stdout.write('%d visits of %d requests per engine' % (
+            options['rounds'], len(paths)))
+        for engine in options['engines'] or ENGINES:
+            with override_settings(SESSION_ENGINE=engine,
+                                   PERFORMANCE_SAMPLE_RATE=1,
+                                   ALLOWED_HOSTS=['testserver']):
+                # Warm up caches and connections before measuring
+                warm_up = self.run(paths, 1)
+                middleware.reset_stats()
+                queries, cookie, keys = self.run(paths, options['rounds'])
+                stats = middleware.get_stats().values()
+            self.clear(engine, warm_up[2] + keys)
+
+            requests = sum(url['requests'] for url in stats)
+            self.stdout.write(
+                '%s: session %.3f ms and %.2f session queries per request, '
+                'slowest url %.3f ms, cookie %d bytes' % (
+                    engine,
+                    sum(url['session_ms'] * url['requests']
+                        for url in stats) / requests,
+                    queries / float(requests),
+                    max(url['session_ms'] for url in stats), cookie))
+
+    def run(self, paths, rounds):
+        """ Replay the visit rounds times
+
+        :return: tuple with the number of session queries, the size of the
+            largest session cookie and the session keys created
+        """
+
+        queries, cookie, keys = 0, 0, []
+        for number in range(rounds):
+            client = Client()
+            with CaptureQueriesContext(connection) as captured:
+                for path in paths:
+                    client.get(path, HTTP_REFERER='/')
+            queries += sum(1 for query in captured.captured_queries
+                           if 'django_session' in query['sql'])
+            morsel = client.cookies.get('sessionid')
+            if morsel is not None:
+                cookie = max(cookie, len(morsel.value))
+                keys.append(morsel.value)
+        return queries, cookie, keys
+
+    def clear(self, engine, keys):
+        store = import_module(engine).SessionStore
+        for key in keys:
+            store(key).delete()
@@ -0,0 +1,64 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cart.item_io import FIELDS, FORMATS, guess_format, write_rows
+from cart.models import Item
+from cart.utils import Progress
+
+
+class Command(BaseCommand):
+    """ Write the items to a CSV or JSONL file in bounded memory
+
+    The items are read in chunks with a server side cursor where the
+    database supports it, and written as they arrive. The file can be
+    loaded back with import_items.
+    """
+
+    help = 'Export the items to a CSV or JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to write, - for stdout')
+        parser.add_argument('--format', choices=FORMATS,
+                            help='Format of the file, by its extension by '
+                                 'default')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of rows read per query')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        try:
+            file_format = options['format'] or guess_format(path)
+        except ValueError as error:
+            raise CommandError(str(error))
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be positive')
+
+        # The data may go to stdout, the progress goes to stderr
+        progress = Progress(self.stderr.write)
+        rows = self.counted(
+            Item.objects.order_by('id').values_list(*FIELDS)
+            .iterator(chunk_size=batch_size), batch_size, progress)
+
+        if path == '-':
+            write_rows(sys.stdout, file_format, rows)
+        else:
+            with open(path, 'w', newline='', encoding='utf-8') as stream:
+                write_rows(stream, file_format, rows)
+
+        self.stderr.write(self.style.SUCCESS(
+            '%d items exported (%d rows/s)' % (progress.rows, progress.rate)))
+
+    def counted(self, rows, batch_size, progress):
+        """ Pass the rows through, reporting progress once per batch """
+
+        count = 0
+        for row in rows:
+            yield row
+            count += 1
+            if count == batch_size:
+                progress.add(count)
+                count = 0
+        if count:
+            progress.add(count)
@@ -0,0 +1,128 @@
+import multiprocessing
+import os
+from importlib import import_module
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+
+from cart import catalogue, datagen
+from cart.utils import Progress
+
+_plan = None
+
+
+def _start_worker(plan):
+    """ Initializer of the worker processes """
+
+    global _plan
+    # Processes started with spawn import the project from scratch
+    django.setup()
+    _plan = plan
+
+
+def _build(task):
+    kind, number = task
+    try:
+        return kind, _plan.build(kind, number)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    """ Fill the database with synthetic items, users, carts and sessions
+
+    The data is the same for the same --seed on the same database: every
+    chunk of rows has its own random generator and the ids are reserved up
+    front, so --workers processes build the chunks in any order. Items and
+    users are created first, then the active carts of a share of the new
+    users and the guest sessions, holding carts of --cart-size items as
+    SessionCart stores them. The rows are inserted with bulk_create, the
+    totals of the carts are calculated while building them and the items
+    are added to the search index.
+    """
+
+    help = 'Generate synthetic items, users, carts and guest sessions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=0,
+                            help='Number of items')
+        parser.add_argument('--users', type=int, default=0,
+                            help='Number of users')
+        parser.add_argument('--cart-ratio', type=float, default=0.5,
+                            help='Share of the new users with an active cart')
+        parser.add_argument('--cart-size', default='geometric:3',
+                            help='Items per cart: geometric:MEAN, '
+                                 'uniform:MIN:MAX or fixed:SIZE')
+        parser.add_argument('--sessions', type=int, default=0,
+                            help='Number of guest sessions with a cart')
+        parser.add_argument('--days', type=int, default=90,
+                            help='The rows are dated in the last days')
+        parser.add_argument('--password', default=datagen.PASSWORD,
+                            help='Password of the users')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Number of processes, 1 on SQLite')
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Number of rows per INSERT')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        if not 0 <= options['cart_ratio'] <= 1:
+            raise CommandError('--cart-ratio must be between 0 and 1')
+        if options['sessions']:
+            engine = import_module(settings.SESSION_ENGINE)
+            if not hasattr(engine.SessionStore, 'get_model_class'):
+                raise CommandError('--sessions needs a session engine that '
+                                   'stores them in the database')
+
+        try:
+            cart_size = datagen.SizeDistribution(options['cart_size'])
+        except ValueError as error:
+            raise CommandError(error)
+
+        plan = datagen.Plan(
+            seed=options['seed'], items=options['items'],
+            users=options['users'], cart_ratio=options['cart_ratio'],
+            cart_size=cart_size, sessions=options['sessions'],
+            days=options['days'], password=options['password'],
+            batch_size=options['batch_size'])
+        workers = max(options['workers'] or 1, 1)
+        if connection.vendor == 'sqlite' and workers > 1:
+            # SQLite takes one writer at a time, more processes only wait
+            self.stdout.write('SQLite allows a single writer, using 1 worker')
+            workers = 1
+
+        created = {}
+        for tasks in plan.tasks():
+            progress = {kind: Progress(self.stdout.write, kind)
+                        for kind, number in tasks}
+            for kind, rows in self.run(plan, tasks, workers):
+                progress[kind].add(rows)
+            created.update((kind, phase.rows)
+                           for kind, phase in progress.items())
+        plan.finish()
+        catalogue.invalidate()
+        self.stdout.write(self.style.SUCCESS(
+            '%d items, %d users, %d carts and %d sessions created' % tuple(
+                created.get(kind, 0)
+                for kind in ('items', 'users', 'carts', 'sessions'))))
+
+    def run(self, plan, tasks, workers):
+        """ Build the chunks, in this process or in a pool of processes
+
+        :return: iterator of (kind, rows) tuples in completion order
+        """
+
+        if workers == 1:
+            for kind, number in tasks:
+                yield kind, plan.build(kind, number)
+            return
+
+        # The children must not share the connection of the parent
+        connections.close_all()
+        with multiprocessing.Pool(workers, _start_worker, (plan,)) as pool:
+            for result in pool.imap_unordered(_build, tasks):
+                yield result
@@ -0,0 +1,71 @@
+import multiprocessing
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from cart import catalogue
+from cart.images import render, update_item
+from cart.models import Item
+
+
+def render_image(pending):
+    """ Worker of the process pool, it only touches the storage
+
+    An image that cannot be rendered is returned as a failure, so it does
+    not stop the rest of the batch.
+    :param pending: tuple of the item id and the name of its image
+    :return: tuple of the item id, the name, the result of render and the
+        error, one of the last two None
+    """
+
+    item_id, name = pending
+    try:
+        return item_id, name, render(default_storage, name), None
+    except Exception as error:
+        return item_id, name, None, '%s: %s' % (type(error).__name__, error)
+
+
+class Command(BaseCommand):
+    """ Backfill the renditions of the item images
+
+    Images are resized in a pool of processes, the database is only read
+    and written by the main process, the workers never use the connections
+    they inherit. Each item is saved as soon as its images are done, so an
+    interrupted run keeps its progress, and the images that fail are
+    reported at the end.
+    """
+
+    help = 'Generate the resized renditions of the item images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Number of processes, one per CPU by default')
+        parser.add_argument('--all', action='store_true',
+                            help='Also process items that already have them')
+
+    def handle(self, *args, **options):
+        items = Item.objects.exclude(image='').exclude(image__isnull=True)
+        if not options['all']:
+            items = items.filter(image_hash='')
+        pending = list(items.order_by('id').values_list('id', 'image'))
+
+        processed = 0
+        failures = []
+        try:
+            with multiprocessing.Pool(options['workers']) as pool:
+                for item_id, name, result, error in pool.imap_unordered(
+                        render_image, pending):
+                    if error:
+                        failures.append((item_id, name, error))
+                        continue
+                    update_item(item_id, *result)
+                    processed += 1
+                    self.stdout.write('%s %s' % (item_id, name))
+        finally:
+            if processed:
+                catalogue.invalidate()
+
+        for item_id, name, error in failures:
+            self.stderr.write('%s %s %s' % (item_id, name, error))
+        self.stdout.write(self.style.SUCCESS(
+            '%d items processed, %d failed' % (processed, len(failures))))
@@ -0,0 +1,109 @@
+import sys
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+
+from cart import catalogue, search
+from cart.item_io import FORMATS, guess_format, parse_row, read_rows
+from cart.models import Item
+from cart.utils import Progress, batched
+
+UPDATE_FIELDS = ['name', 'category', 'level', 'price', 'image']
+
+
+class Command(BaseCommand):
+    """ Load items from a CSV or JSONL file in bounded memory
+
+    The file is read as a stream and written in batches, each one in its
+    own transaction: rows without id, or with an id that does not exist,
+    are inserted with bulk_create and the others are updated with
+    bulk_update, and their entries of the search index are written with
+    them. Invalid rows are reported and skipped. Images are not resized,
+    run generate_renditions afterwards.
+    """
+
+    help = 'Import items from a CSV or JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to read, - for stdin')
+        parser.add_argument('--format', choices=FORMATS,
+                            help='Format of the file, by its extension by '
+                                 'default')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of rows written per transaction')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        try:
+            file_format = options['format'] or guess_format(path)
+        except ValueError as error:
+            raise CommandError(str(error))
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+
+        if path == '-':
+            self.load(sys.stdin, file_format, options['batch_size'])
+        else:
+            with open(path, newline='', encoding='utf-8') as stream:
+                self.load(stream, file_format, options['batch_size'])
+
+    def load(self, stream, file_format, batch_size):
+        progress = Progress(self.stdout.write)
+        self.created = self.updated = self.skipped = 0
+        self.created_ids = False
+
+        for batch in batched(self.parse(read_rows(stream, file_format)),
+                             batch_size):
+            self.save(batch)
+            progress.add(len(batch))
+
+        if self.created_ids:
+            self.reset_sequence()
+        catalogue.invalidate()
+
+        self.stdout.write(self.style.SUCCESS(
+            '%d created, %d updated, %d skipped (%d rows/s)'
+            % (self.created, self.updated, self.skipped, progress.rate)))
+
+    def parse(self, rows):
+        """ Valid items of the rows, the invalid ones are reported """
+
+        for line_number, row in rows:
+            try:
+                yield parse_row(row)
+            except ValidationError as error:
+                self.skipped += 1
+                self.stderr.write('Line %d: %s' % (
+                    line_number, '; '.join(error.messages)))
+
+    def save(self, items):
+        """ Write a batch, the last row wins when an id is repeated """
+
+        with_id = {item.id: item for item in items if item.id is not None}
+        existing = set(Item.objects.filter(id__in=with_id).order_by()
+                       .values_list('id', flat=True)) if with_id else set()
+
+        to_update = [item for item_id, item in with_id.items()
+                     if item_id in existing]
+        to_create = [item for item_id, item in with_id.items()
+                     if item_id not in existing]
+        self.created_ids = self.created_ids or bool(to_create)
+        to_create += [item for item in items if item.id is None]
+
+        with transaction.atomic():
+            Item.objects.bulk_create(to_create)
+            Item.objects.bulk_update(to_update, UPDATE_FIELDS)
+            search.index_items(to_create + to_update)
+
+        self.created += len(to_create)
+        self.updated += len(to_update)
+
+    def reset_sequence(self):
+        """ Move the id sequence past the ids given in the file """
+
+        statements = connection.ops.sequence_reset_sql(no_style(), [Item])
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
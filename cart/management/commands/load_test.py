@@ -0,0 +1,133 @@
+import json
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from cart import loadtest
+
+
+def parse_mix(value):
+    """ Weights of the scenarios from 'browse=6,shop=3,buy=1' """
+
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in loadtest.SCENARIOS:
+            raise CommandError('Unknown scenario %r, choose from %s' % (
+                name, ', '.join(loadtest.SCENARIOS)))
+        try:
+            mix[name] = float(weight or 1)
+        except ValueError:
+            raise CommandError('Invalid weight %r of %s' % (weight, name))
+    if not any(mix.values()):
+        raise CommandError('At least one scenario needs a positive weight')
+    return mix
+
+
+class Command(BaseCommand):
+    """ Find the throughput ceiling of the shop with simulated visitors
+
+    Virtual users replay visits of the scenarios of cart.loadtest: guests
+    browsing the catalogue, guests filling a cart and buyers who log in,
+    which merges their session cart, and pay. Without --url the requests go
+    to shopping_cart.wsgi in this process, with --url to a running server.
+    --seed-items and --seed-users add synthetic items and users with the
+    password of --password to the configured database first.
+    """
+
+    help = 'Replay shopping visits concurrently and report per url stats'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url',
+                            help='Base url of a running server, e.g. '
+                                 'http://127.0.0.1:8000')
+        parser.add_argument('--concurrency', type=int, default=10,
+                            help='Number of virtual users')
+        parser.add_argument('--duration', type=float, default=30,
+                            help='Seconds to run, 0 to run the --visits')
+        parser.add_argument('--visits', type=int,
+                            help='Number of visits to replay')
+        parser.add_argument('--think-time', type=float, default=0,
+                            help='Mean seconds between the pages of a '
+                                 'visit')
+        parser.add_argument('--mix', type=parse_mix,
+                            default=loadtest.DEFAULT_MIX,
+                            help='Weights of the scenarios, e.g. '
+                                 'browse=6,shop=3,buy=1')
+        parser.add_argument('--seed-items', type=int, default=0,
+                            help='Number of synthetic items created first')
+        parser.add_argument('--seed-users', type=int, default=0,
+                            help='Number of users created first')
+        parser.add_argument('--password', default=loadtest.PASSWORD,
+                            help='Password of the load test users')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Seed of the choices of the visitors')
+        parser.add_argument('--json', dest='json_path',
+                            help='File to write the results as JSON')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency must be positive')
+        if not options['duration'] and not options['visits']:
+            raise CommandError('Give a --duration or a number of --visits')
+
+        if options['seed_items']:
+            self.stdout.write('%d items created' % loadtest.seed_items(
+                options['seed_items'], options['seed']))
+        if options['seed_users']:
+            self.stdout.write('%d users created' % loadtest.seed_users(
+                options['seed_users'], options['password']))
+
+        if options['url']:
+            transport_factory = lambda: loadtest.HTTPTransport(
+                options['url'])
+            stats, elapsed = self.run(transport_factory, options)
+        else:
+            from shopping_cart.wsgi import application
+
+            transport_factory = lambda: loadtest.WSGITransport(application)
+            # The errors are counted, their tracebacks would flood the
+            # output
+            logger = logging.getLogger('django.request')
+            level = logger.level
+            logger.setLevel(logging.CRITICAL)
+            try:
+                with override_settings(ALLOWED_HOSTS=['localhost']):
+                    stats, elapsed = self.run(transport_factory, options)
+            finally:
+                logger.setLevel(level)
+
+        rows = stats.summary(elapsed)
+        self.stdout.write('%d visits (%d failed) in %.1f s, concurrency %d' % (
+            stats.sessions, stats.failed_sessions, elapsed,
+            options['concurrency']))
+        self.stdout.write('%-18s %8s %8s %9s %9s %9s %7s' % (
+            'url', 'requests', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms',
+            'errors'))
+        for row in rows:
+            self.stdout.write(
+                '%-18s %8d %8.1f %9.2f %9.2f %9.2f %6.1f%%' % (
+                    row['url_name'], row['requests'], row['throughput'],
+                    row['p50'], row['p95'], row['p99'],
+                    row['error_rate'] * 100))
+        requests = sum(row['requests'] for row in rows)
+        self.stdout.write('total: %.1f req/s' % (requests / elapsed))
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as stream:
+                json.dump({'elapsed': elapsed, 'visits': stats.sessions,
+                           'failed_visits': stats.failed_sessions,
+                           'concurrency': options['concurrency'],
+                           'urls': rows}, stream, indent=2)
+
+    def run(self, transport_factory, options):
+        try:
+            return loadtest.run(
+                transport_factory, mix=options['mix'],
+                concurrency=options['concurrency'],
+                duration=options['duration'], visits=options['visits'],
+                think_time=options['think_time'], seed=options['seed'],
+                password=options['password'])
+        except loadtest.ScenarioError as error:
+            raise CommandError(error)
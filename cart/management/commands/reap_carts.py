@@ -0,0 +1,191 @@
+import signal
+import threading
+import time
+from datetime import timedelta
+from importlib import import_module
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, Exists, OuterRef
+from django.utils import timezone
+
+from cart import snapshot
+from cart.models import Cart, CartLine
+from cart.utils import Progress
+
+
+def idle_carts(active, since):
+    """ Carts without activity since a date
+
+    :param active: True for active carts, False for inactive carts
+    :param since: datetime
+    :return: QuerySet
+    """
+
+    recent_lines = CartLine.objects.filter(cart=OuterRef('pk'),
+                                           date_added__gte=since)
+    return Cart.objects.filter(active=active, date_created__lt=since).filter(
+        ~Exists(recent_lines))
+
+
+class StopOnSignals(object):
+    """ Turn SIGINT and SIGTERM into the interrupted flag of the command
+    while it runs, in the main thread only """
+
+    SIGNALS = (signal.SIGINT, signal.SIGTERM)
+
+    def __init__(self, command):
+        self.command = command
+        self.handlers = {}
+
+    def stop(self, signum, frame):
+        self.command.interrupted = True
+        self.command.stderr.write('Stopping after the current batch')
+
+    def __enter__(self):
+        if threading.current_thread() is threading.main_thread():
+            for signum in self.SIGNALS:
+                self.handlers[signum] = signal.signal(signum, self.stop)
+
+    def __exit__(self, *exc_info):
+        for signum, handler in self.handlers.items():
+            signal.signal(signum, handler)
+
+
+class Command(BaseCommand):
+    """ Archive abandoned carts and delete old inactive carts in batches
+
+    Active carts without activity (creation or an added line) for
+    --stale-days are archived as inactive, so their users start a new cart.
+    Inactive carts, closed by logout or payment, are deleted with their
+    lines once they have no activity for --inactive-days; their orders keep
+    their own copy of the lines, and the archived carts are deleted in the
+    same run when they are idle for that long too. Expired sessions, which
+    hold the carts of anonymous users, are deleted at the end.
+
+    Every phase walks the ids in order and works on --batch-size rows per
+    transaction, so no lock is held for long. Ctrl-C or SIGTERM stops the
+    command after the current batch, leaving everything consistent; running
+    it again continues the work.
+    """
+
+    help = 'Archive abandoned carts, delete old inactive carts and sessions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stale-days', type=int, default=90,
+                            help='Days without activity to archive an '
+                                 'active cart')
+        parser.add_argument('--inactive-days', type=int, default=30,
+                            help='Days without activity to delete an '
+                                 'inactive cart')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of rows changed per transaction')
+        parser.add_argument('--pause', type=float, default=0,
+                            help='Seconds to wait between batches')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count the rows of each phase')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        self.batch_size = options['batch_size']
+        self.pause = options['pause']
+        self.interrupted = False
+
+        now = timezone.now()
+        stale = idle_carts(True, now - timedelta(days=options['stale_days']))
+        inactive = idle_carts(False,
+                              now - timedelta(days=options['inactive_days']))
+
+        if options['dry_run']:
+            self.stdout.write('%d carts to archive, %d carts to delete' % (
+                stale.count(), inactive.count()))
+            return
+
+        with StopOnSignals(self):
+            archived = self.run('archive', stale, self.archive)
+            deleted = self.run('delete', inactive, self.delete)
+            sessions = self.clear_sessions()
+
+        summary = ('%d carts archived, %d carts deleted, %s sessions deleted'
+                   % (archived, deleted, sessions))
+        if self.interrupted:
+            self.stdout.write(self.style.WARNING('Interrupted: ' + summary))
+        else:
+            self.stdout.write(self.style.SUCCESS(summary))
+
+    def run(self, name, queryset, process):
+        """ Apply process to the rows of queryset in batches of ids
+
+        :param name: name of the phase in the progress
+        :param queryset: rows to process, filtered again in each batch
+        :param process: function that receives the queryset of a batch
+        :return: number of rows processed
+        """
+
+        progress = Progress(self.stdout.write, name)
+        last_id = 0
+        while not self.interrupted:
+            ids = list(queryset.filter(id__gt=last_id).order_by('id')
+                       .values_list('id', flat=True)[:self.batch_size])
+            if not ids:
+                break
+            with transaction.atomic():
+                # The conditions are checked again when writing, a cart
+                # used since it was selected is left alone
+                count = process(queryset.filter(id__in=ids))
+            progress.add(count)
+            last_id = ids[-1]
+            if self.pause:
+                time.sleep(self.pause)
+        return progress.rows
+
+    def archive(self, queryset):
+        user_ids = list(queryset.select_for_update()
+                        .values_list('user_id', flat=True))
+        # The new version makes pending mutations of the carts fail, see
+        # Cart.mutate
+        count = queryset.update(active=False, version=F('version') + 1)
+        # Once committed, a request in between would cache the cart again
+        transaction.on_commit(lambda: snapshot.invalidate_many(user_ids))
+        return count
+
+    def delete(self, queryset):
+        deleted, rows = queryset.delete()
+        return rows.get(Cart._meta.label, 0)
+
+    def clear_sessions(self):
+        """ Delete the expired sessions in batches
+
+        :return: number of sessions deleted, or 'expired' when the session
+            engine deletes them by itself
+        """
+
+        engine = import_module(settings.SESSION_ENGINE)
+        if not hasattr(engine.SessionStore, 'get_model_class'):
+            try:
+                # Cache and file sessions, signed cookies expire by
+                # themselves
+                engine.SessionStore.clear_expired()
+            except NotImplementedError:
+                pass
+            return 'expired'
+
+        model = engine.SessionStore.get_model_class()
+        expired = model.objects.filter(expire_date__lt=timezone.now())
+        progress = Progress(self.stdout.write, 'sessions')
+        last_key = ''
+        while not self.interrupted:
+            keys = list(expired.filter(session_key__gt=last_key)
+                        .order_by('session_key')
+                        .values_list('session_key', flat=True)
+                        [:self.batch_size])
+            if not keys:
+                break
+            deleted, rows = expired.filter(session_key__in=keys).delete()
+            progress.add(deleted)
+            last_key = keys[-1]
+            if self.pause:
+                time.sleep(self.pause)
+        return progress.rows
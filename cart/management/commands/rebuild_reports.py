@@ -0,0 +1,101 @@
+import datetime
+import multiprocessing
+import os
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+
+from cart import reports
+from cart.utils import Progress
+
+
+def _start_worker():
+    """ Initializer of the worker processes """
+
+    # Processes started with spawn import the project from scratch
+    django.setup()
+
+
+def _rebuild(days):
+    try:
+        return reports.rebuild(*days)
+    finally:
+        connections.close_all()
+
+
+def parse_date(value):
+    try:
+        return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError('Invalid date %r, use YYYY-MM-DD' % value)
+
+
+class Command(BaseCommand):
+    """ Calculate again the daily rollups of the reports from the orders
+
+    The rollups are maintained when orders are completed and carts are
+    created, this command fills them for the history, e.g. after the
+    migration or after rows were written with bulk_create or SQL; the days
+    that have a summary keep their count of carts, see reports.rebuild.
+    The days are split in chunks of --chunk-days, each one replaced in its own
+    transaction by --workers processes. Orders completed while the chunk of
+    their day is rebuilt can be left out, rebuild the current days when
+    the checkout is idle.
+    """
+
+    help = 'Rebuild the daily rollups of the sales reports'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day, YYYY-MM-DD, by '
+                                            'default the first order or cart')
+        parser.add_argument('--end', help='Last day, YYYY-MM-DD, by default '
+                                          'today')
+        parser.add_argument('--chunk-days', type=int, default=7,
+                            help='Number of days rebuilt per transaction')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Number of processes, 1 on SQLite')
+
+    def handle(self, *args, **options):
+        if options['chunk_days'] < 1:
+            raise CommandError('--chunk-days must be positive')
+
+        start, end = reports.history_range()
+        if options['start']:
+            start = parse_date(options['start'])
+        if options['end']:
+            end = parse_date(options['end']) + datetime.timedelta(days=1)
+        if start >= end:
+            raise CommandError('--start must not be after --end')
+
+        workers = max(options['workers'] or 1, 1)
+        if connection.vendor == 'sqlite' and workers > 1:
+            # SQLite takes one writer at a time, more processes only wait
+            self.stdout.write('SQLite allows a single writer, using 1 worker')
+            workers = 1
+
+        progress = Progress(self.stdout.write, 'orders')
+        for orders in self.run(reports.chunks(start, end,
+                                              options['chunk_days']),
+                               workers):
+            progress.add(orders)
+        self.stdout.write(self.style.SUCCESS(
+            'Reports of %d days rebuilt from %d orders' % (
+                (end - start).days, progress.rows)))
+
+    def run(self, chunks, workers):
+        """ Rebuild the chunks, in this process or in a pool of processes
+
+        :return: iterator of the number of orders of each chunk
+        """
+
+        if workers == 1:
+            for days in chunks:
+                yield reports.rebuild(*days)
+            return
+
+        # The children must not share the connection of the parent
+        connections.close_all()
+        with multiprocessing.Pool(workers, _start_worker) as pool:
+            for orders in pool.imap_unordered(_rebuild, chunks):
+                yield orders
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from cart import catalogue, search
+
+
+class Command(BaseCommand):
+    """ Build the search index of the items from scratch
+
+    The index is kept up to date by the item signals and by import_items,
+    this command repairs it after items were written in other ways (raw
+    SQL, QuerySet.update). It runs in one transaction, so searches keep
+    seeing the old index until it finishes.
+    """
+
+    help = 'Rebuild the full text search index of the items'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of items indexed per query')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            indexed = search.rebuild(options['batch_size'])
+        catalogue.invalidate()
+        self.stdout.write(self.style.SUCCESS('%d items indexed' % indexed))
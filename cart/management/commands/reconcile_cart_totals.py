@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import (Count, DecimalField, F, OuterRef, Q, Subquery,
+                              Sum, Value)
+from django.db.models.functions import Coalesce
+
+from cart.counters import item_count_subquery
+from cart.models import Cart, CartLine
+
+
+class Command(BaseCommand):
+    """ Find carts whose stored total drifted from the sum of their lines
+
+    Totals are maintained incrementally by Cart.add_item and
+    Cart.remove_item from the prices stored in the lines, this command is
+    the safety net that repairs any cart modified outside of them (admin,
+    raw SQL). The item count is repaired too.
+    """
+
+    help = ('Recalculate the total and item count of carts that drifted '
+            'from their lines')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of carts repaired per UPDATE')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report the drifted carts')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        drifted = list(
+            Cart.objects.order_by()
+            .annotate(computed=Coalesce(Sum('lines__price'), Value(0),
+                                        output_field=DecimalField()),
+                      computed_count=Count('lines'))
+            .filter(~Q(total=F('computed')) |
+                    ~Q(item_count=F('computed_count')))
+            .values_list('id', flat=True)
+        )
+
+        if options['dry_run']:
+            self.stdout.write('%d carts with a drifted total' % len(drifted))
+            return
+
+        lines_total = (
+            CartLine.objects.filter(cart=OuterRef('pk')).order_by()
+            .values('cart').annotate(total=Sum('price')).values('total')
+        )
+        for start in range(0, len(drifted), batch_size):
+            batch = drifted[start:start + batch_size]
+            with transaction.atomic():
+                Cart.objects.filter(pk__in=batch).update(
+                    total=Coalesce(Subquery(lines_total,
+                                            output_field=DecimalField()),
+                                   Value(0), output_field=DecimalField()),
+                    item_count=item_count_subquery(),
+                    version=F('version') + 1)
+
+        self.stdout.write(self.style.SUCCESS(
+            '%d carts reconciled' % len(drifted)))
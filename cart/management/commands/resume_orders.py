@@ -0,0 +1,42 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from cart import checkout
+from cart.models import Order
+
+
+class Command(BaseCommand):
+    """ Process again the orders that were not finished
+
+    Orders are processed by threads of the web process, so a restart loses
+    the orders in the queue, and an order whose receipt or reports kept
+    failing stays authorized with its error. Every step is recorded, so
+    resuming an order only runs the steps it is missing. Schedule it, e.g.
+    with cron.
+    """
+
+    help = 'Process again the pending and authorized orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age', type=int, default=300,
+                            help='Seconds since the last change of an '
+                                 'order, the newer ones may be in process')
+
+    def handle(self, *args, **options):
+        order_ids = list(checkout.unfinished_orders(
+            datetime.timedelta(seconds=options['min_age']))
+            .order_by('id').values_list('id', flat=True))
+
+        for order_id in order_ids:
+            checkout.process_order(order_id)
+
+        finished = Order.objects.filter(id__in=order_ids)
+        completed = finished.filter(
+            status=Order.Status.get_value('completed')).count()
+        failed = finished.filter(
+            status=Order.Status.get_value('failed')).count()
+        self.stdout.write(self.style.SUCCESS(
+            '%d orders resumed: %d completed, %d failed, %d unfinished' % (
+                len(order_ids), completed, failed,
+                len(order_ids) - completed - failed)))
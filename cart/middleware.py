@@ -0,0 +1,215 @@
+import random
+import threading
+import time
+
+from asgiref.local import Local
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.base import Template
+
+# Context local, so concurrent async requests do not mix their measures
+_local = Local()
+_lock = threading.Lock()
+_stats = {}
+
+METRICS = ('wall', 'sql', 'template', 'session')
+
+
+def _active():
+    return getattr(_local, 'measures', None) is not None
+
+
+def _instrument_templates():
+    """ Time Template._render, counting only the outermost template """
+
+    if getattr(Template, '_performance_instrumented', False):
+        return
+    original = Template._render
+
+    def _render(self, context):
+        if not _active():
+            return original(self, context)
+        _local.depth += 1
+        start = time.perf_counter()
+        try:
+            return original(self, context)
+        finally:
+            _local.depth -= 1
+            if _local.depth == 0:
+                _local.measures['template'] += time.perf_counter() - start
+
+    Template._render = _render
+    Template._performance_instrumented = True
+
+
+def _time_query(execute, sql, params, many, context):
+    """ Database execute wrapper that times the queries of sampled requests """
+
+    if not _active():
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        _local.measures['sql'] += time.perf_counter() - start
+        _local.measures['queries'] += 1
+
+
+@receiver(connection_created)
+def _install_query_timer(sender, connection, **kwargs):
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+def _timed(method):
+    """ Wrap a session method so its time adds to the current request """
+
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            if _active():
+                _local.measures['session'] += time.perf_counter() - start
+    return wrapper
+
+
+def _atimed(method):
+    """ Async version of _timed """
+
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            if _active():
+                _local.measures['session'] += time.perf_counter() - start
+    return wrapper
+
+
+def record(url_name, measures):
+    """ Add the measures of a request to the stats of its url name """
+
+    with _lock:
+        stats = _stats.setdefault(url_name, dict(
+            {'requests': 0, 'queries': 0},
+            **{metric: 0.0 for metric in METRICS}))
+        stats['requests'] += 1
+        stats['queries'] += measures['queries']
+        for metric in METRICS:
+            stats[metric] += measures[metric]
+
+
+def get_stats():
+    """ Average time in milliseconds by url name since the process started
+
+    :return: dict with the stats of each url name
+    """
+
+    with _lock:
+        snapshot = {name: dict(stats) for name, stats in _stats.items()}
+    result = {}
+    for url_name, stats in snapshot.items():
+        requests = stats['requests']
+        result[url_name] = {
+            'requests': requests,
+            'queries': round(stats['queries'] / float(requests), 2),
+        }
+        for metric in METRICS:
+            result[url_name][metric + '_ms'] = round(
+                stats[metric] * 1000 / requests, 3)
+    return result
+
+
+def reset_stats():
+    with _lock:
+        _stats.clear()
+
+
+class PerformanceMiddleware:
+    """ Measure where the time of a request goes
+
+    A sample of the requests, PERFORMANCE_SAMPLE_RATE between 0 and 1,
+    records wall time, number and time of SQL queries, template render time
+    and session load/save time. The measures are grouped by url name, sent
+    back in a Server-Timing header and exposed by the performance_stats
+    view. It must be the first middleware so the session save is included.
+    It works under WSGI and ASGI without forcing async views into threads.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        _instrument_templates()
+        for connection in connections.all(initialized_only=True):
+            _install_query_timer(None, connection)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self._sampled():
+            return self.get_response(request)
+
+        start = self._start()
+        try:
+            response = self.get_response(request)
+        finally:
+            measures = self._stop(start)
+        return self._finish(request, response, measures)
+
+    async def __acall__(self, request):
+        if not self._sampled():
+            return await self.get_response(request)
+
+        start = self._start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            measures = self._stop(start)
+        return self._finish(request, response, measures)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        session = getattr(request, 'session', None)
+        if _active() and session is not None:
+            session.load = _timed(session.load)
+            session.save = _timed(session.save)
+            if hasattr(session, 'aload'):
+                session.aload = _atimed(session.aload)
+                session.asave = _atimed(session.asave)
+
+    def _sampled(self):
+        sample_rate = getattr(settings, 'PERFORMANCE_SAMPLE_RATE', 0)
+        return sample_rate > 0 and random.random() < sample_rate
+
+    def _start(self):
+        _local.depth = 0
+        _local.measures = {'queries': 0, 'sql': 0.0, 'template': 0.0,
+                           'session': 0.0}
+        return time.perf_counter()
+
+    def _stop(self, start):
+        measures = _local.measures
+        measures['wall'] = time.perf_counter() - start
+        _local.measures = None
+        return measures
+
+    def _finish(self, request, response, measures):
+        match = getattr(request, 'resolver_match', None)
+        record(match.url_name if match else None, measures)
+
+        response['Server-Timing'] = ', '.join([
+            'total;dur=%.2f' % (measures['wall'] * 1000),
+            'sql;dur=%.2f;desc="%d queries"' % (measures['sql'] * 1000,
+                                                measures['queries']),
+            'template;dur=%.2f' % (measures['template'] * 1000),
+            'session;dur=%.2f' % (measures['session'] * 1000),
+        ])
+        return response
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def deactivate_duplicate_carts(apps, schema_editor):
+    """ Keep only the newest active cart of each user """
+
+    Cart = apps.get_model('cart', 'Cart')
+    newest = (Cart.objects.filter(active=True).order_by()
+              .values('user').annotate(newest=Max('id'))
+              .values_list('newest', flat=True))
+    (Cart.objects.filter(active=True)
+     .exclude(id__in=list(newest)).update(active=False))
+
+
+def create_active_cart_index(apps, schema_editor):
+    """ At most one active cart per user, as a partial unique index """
+
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute(
+            'CREATE UNIQUE INDEX cart_one_active_per_user '
+            'ON cart_cart (user_id) WHERE active')
+
+
+def drop_active_cart_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute('DROP INDEX cart_one_active_per_user')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='cart',
+            options={'verbose_name': 'Cart', 'verbose_name_plural': 'Carts'},
+        ),
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['user', 'active'], name='cart_user_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['category', 'level', 'name'], name='item_cat_level_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['name', 'id'], name='item_name_id_idx'),
+        ),
+        migrations.RunPython(deactivate_duplicate_carts,
+                             migrations.RunPython.noop),
+        migrations.RunPython(create_active_cart_index,
+                             drop_active_cart_index),
+    ]
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.1 on 2026-10-18 18:16
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('cart', '0003_item_image_renditions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseAccess',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cart.Item', verbose_name='Item')),
+            ],
+            options={
+                'verbose_name': 'Course access',
+                'verbose_name_plural': 'Course accesses',
+            },
+        ),
+        migrations.CreateModel(
+            name='Order',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('idempotency_key', models.CharField(max_length=100, unique=True)),
+                ('status', models.CharField(choices=[('p', 'Pendiente'), ('a', 'Autorizado'), ('c', 'Completado'), ('f', 'Fallido')], default='p', max_length=1, verbose_name='Status')),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=8, verbose_name='Total')),
+                ('payment_reference', models.CharField(blank=True, max_length=100)),
+                ('access_granted', models.BooleanField(default=False)),
+                ('receipt_sent', models.BooleanField(default=False)),
+                ('error', models.TextField(blank=True)),
+                ('date_created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('date_updated', models.DateTimeField(auto_now=True)),
+                ('cart', models.OneToOneField(null=True, on_delete=django.db.models.deletion.SET_NULL, to='cart.Cart', verbose_name='Cart')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Order',
+                'verbose_name_plural': 'Orders',
+            },
+        ),
+        migrations.CreateModel(
+            name='OrderLine',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=300, verbose_name='Item')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=8, verbose_name='Price')),
+                ('item', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='cart.Item', verbose_name='Item')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='cart.Order', verbose_name='Order')),
+            ],
+            options={
+                'verbose_name': 'Order line',
+                'verbose_name_plural': 'Order lines',
+            },
+        ),
+        migrations.AddField(
+            model_name='courseaccess',
+            name='order',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='cart.Order', verbose_name='Order'),
+        ),
+        migrations.AddField(
+            model_name='courseaccess',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='User'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='courseaccess',
+            unique_together=set([('user', 'item')]),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:30
+
+from django.db import migrations, models
+from django.db.models import F, Func, OuterRef, Subquery
+
+
+def drop_active_cart_index(apps, schema_editor):
+    """ Drop the index created with SQL by 0002, it becomes a constraint
+
+    SQLite rebuilds the table to add a column and would lose it anyway.
+    """
+
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute('DROP INDEX IF EXISTS cart_one_active_per_user')
+
+
+def create_active_cart_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute(
+            'CREATE UNIQUE INDEX cart_one_active_per_user '
+            'ON cart_cart (user_id) WHERE active')
+
+
+def count_cart_items(apps, schema_editor):
+    """ Fill item_count of the existing carts in a single UPDATE """
+
+    Cart = apps.get_model('cart', 'Cart')
+    CartItem = Cart.items.through
+    Cart.objects.update(item_count=Subquery(
+        CartItem.objects.filter(cart_id=OuterRef('pk')).order_by()
+        .annotate(count=Func(F('id'), function='COUNT')).values('count')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0004_checkout'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_active_cart_index,
+                             create_active_cart_index),
+        migrations.AddField(
+            model_name='cart',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Items'),
+        ),
+        migrations.RunPython(count_cart_items, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(condition=models.Q(('active', True)), fields=('user',), name='cart_one_active_per_user'),
+        ),
+    ]
@@ -0,0 +1,94 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:05
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def copy_items_to_lines(apps, schema_editor):
+    """ Create a line for each row of the old M2M table, in batches
+
+    The lines take the current price of the item, which is the one the
+    totals were calculated with, and the date of the cart.
+    """
+
+    Cart = apps.get_model('cart', 'Cart')
+    CartLine = apps.get_model('cart', 'CartLine')
+    CartItem = Cart.items.through
+
+    last_id = 0
+    while True:
+        rows = list(
+            CartItem.objects.filter(id__gt=last_id).order_by('id')
+            .values_list('id', 'cart_id', 'item_id', 'item__price',
+                         'cart__date_created')[:BATCH_SIZE])
+        if not rows:
+            break
+        CartLine.objects.bulk_create([
+            CartLine(cart_id=cart_id, item_id=item_id, price=price,
+                     date_added=date_added)
+            for row_id, cart_id, item_id, price, date_added in rows
+        ])
+        last_id = rows[-1][0]
+
+
+def copy_lines_to_items(apps, schema_editor):
+    """ Fill the old M2M table back from the lines, in batches """
+
+    Cart = apps.get_model('cart', 'Cart')
+    CartLine = apps.get_model('cart', 'CartLine')
+    CartItem = Cart.items.through
+
+    last_id = 0
+    while True:
+        rows = list(
+            CartLine.objects.filter(id__gt=last_id).order_by('id')
+            .values_list('id', 'cart_id', 'item_id')[:BATCH_SIZE])
+        if not rows:
+            break
+        CartItem.objects.bulk_create([
+            CartItem(cart_id=cart_id, item_id=item_id)
+            for line_id, cart_id, item_id in rows
+        ])
+        last_id = rows[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0005_cart_item_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CartLine',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=8, verbose_name='Price')),
+                ('date_added', models.DateTimeField(default=django.utils.timezone.now)),
+                ('cart', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='cart.cart', verbose_name='Cart')),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cart.item', verbose_name='Item')),
+            ],
+            options={
+                'verbose_name': 'Cart line',
+                'verbose_name_plural': 'Cart lines',
+                'unique_together': {('cart', 'item')},
+            },
+        ),
+        migrations.RunPython(copy_items_to_lines, copy_lines_to_items),
+        # The old table is dropped and Cart.items points to the lines
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RemoveField(model_name='cart', name='items'),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='cart',
+                    name='items',
+                    field=models.ManyToManyField(through='cart.CartLine', to='cart.item', verbose_name='Items'),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import unicodedata
+
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+CREATE_SQL = {
+    'sqlite': [
+        "CREATE VIRTUAL TABLE cart_item_search USING fts5("
+        "name, facets, tokenize='unicode61 remove_diacritics 2')",
+    ],
+    'postgresql': [
+        'CREATE TABLE cart_item_search (item_id integer PRIMARY KEY, '
+        'document tsvector NOT NULL, category varchar(200) NOT NULL, '
+        'level varchar(150) NOT NULL)',
+        'CREATE INDEX cart_item_search_document_idx '
+        'ON cart_item_search USING GIN (document)',
+    ],
+}
+
+# The SQL of the index when this migration was written, later changes of
+# cart.search must not change what it does
+INSERT_SQL = {
+    'sqlite': 'INSERT INTO cart_item_search (rowid, name, facets) '
+              'VALUES (%s, %s, %s)',
+    'postgresql': 'INSERT INTO cart_item_search '
+                  '(item_id, document, category, level) '
+                  "VALUES (%s, to_tsvector('simple', %s), %s, %s)",
+}
+
+
+def normalize(text):
+    """ Lower case text without accents, see cart.search.normalize """
+
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(char for char in decomposed
+                   if not unicodedata.combining(char)).lower()
+
+
+def entry(vendor, item):
+    """ Parameters of INSERT_SQL for an item """
+
+    if vendor == 'sqlite':
+        return item.id, normalize(item.name), 'c%s l%s' % (item.category,
+                                                          item.level)
+    return item.id, normalize(item.name), item.category, item.level
+
+
+def create_search_index(apps, schema_editor):
+    """ Create the full text index of the item names and fill it in batches
+    """
+
+    vendor = schema_editor.connection.vendor
+    if vendor not in CREATE_SQL:
+        return
+    for sql in CREATE_SQL[vendor]:
+        schema_editor.execute(sql)
+
+    Item = apps.get_model('cart', 'Item')
+    last_id = 0
+    while True:
+        items = list(Item.objects.filter(id__gt=last_id).order_by('id')
+                     .only('id', 'name', 'category', 'level')[:BATCH_SIZE])
+        if not items:
+            break
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(INSERT_SQL[vendor],
+                               [entry(vendor, item) for item in items])
+        last_id = items[-1].id
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in CREATE_SQL:
+        schema_editor.execute('DROP TABLE cart_item_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0006_cartline'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
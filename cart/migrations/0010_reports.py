@@ -0,0 +1,110 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def freeze_line_categories(apps, schema_editor):
+    """ Copy the category and level of the items to the order lines """
+
+    Item = apps.get_model('cart', 'Item')
+    OrderLine = apps.get_model('cart', 'OrderLine')
+    items = Item.objects.filter(pk=OuterRef('item'))
+    OrderLine.objects.exclude(item=None).update(
+        category=Subquery(items.values('category')[:1]),
+        level=Subquery(items.values('level')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0009_admin_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyItemSales',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Date')),
+                ('quantity', models.PositiveIntegerField(default=0, verbose_name='Quantity')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Revenue')),
+            ],
+            options={
+                'verbose_name': 'Daily item sales',
+                'verbose_name_plural': 'Daily item sales',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Date')),
+                ('category', models.CharField(blank=True, choices=[('an', 'Animación'), ('des', 'Diseño'), ('wdes', 'Diseño Web'), ('phot', 'Fotografía'), ('un', 'Unity')], max_length=200, verbose_name='Category')),
+                ('level', models.CharField(blank=True, choices=[('b', 'Curso Básico'), ('a', 'Curso Avanzado'), ('c', 'Curso Completo')], max_length=150, verbose_name='Level')),
+                ('orders', models.PositiveIntegerField(default=0, verbose_name='Orders')),
+                ('items', models.PositiveIntegerField(default=0, verbose_name='Items')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Revenue')),
+            ],
+            options={
+                'verbose_name': 'Daily sales',
+                'verbose_name_plural': 'Daily sales',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailySummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True, verbose_name='Date')),
+                ('carts', models.PositiveIntegerField(default=0, verbose_name='Carts')),
+                ('orders', models.PositiveIntegerField(default=0, verbose_name='Orders')),
+                ('items', models.PositiveIntegerField(default=0, verbose_name='Items')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Revenue')),
+            ],
+            options={
+                'verbose_name': 'Daily summary',
+                'verbose_name_plural': 'Daily summaries',
+            },
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='reported',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='orderline',
+            name='category',
+            field=models.CharField(blank=True, choices=[('an', 'Animación'), ('des', 'Diseño'), ('wdes', 'Diseño Web'), ('phot', 'Fotografía'), ('un', 'Unity')], max_length=200, verbose_name='Category'),
+        ),
+        migrations.AddField(
+            model_name='orderline',
+            name='level',
+            field=models.CharField(blank=True, choices=[('b', 'Curso Básico'), ('a', 'Curso Avanzado'), ('c', 'Curso Completo')], max_length=150, verbose_name='Level'),
+        ),
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['date_created'], name='cart_date_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['date_created'], name='order_date_created_idx'),
+        ),
+        migrations.AddField(
+            model_name='dailyitemsales',
+            name='item',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cart.item', verbose_name='Item'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailysales',
+            unique_together={('date', 'category', 'level')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailyitemsales',
+            unique_together={('date', 'item')},
+        ),
+        migrations.RunPython(freeze_line_categories,
+                             migrations.RunPython.noop),
+    ]
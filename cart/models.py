@@ -1,10 +1,18 @@
+import random
+import time
 from enum import Enum
 
-from django.db import models
+from django.conf import settings
+from django.db import (IntegrityError, OperationalError, connection, models,
+                       transaction)
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Coalesce
 from django.utils import timezone
-from django.utils.translation import ugettext_lazy as _
+from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.models import User
 
+from .utils import RENDITION_SIZES, rendition_name
+
 
 class Item(models.Model):
     """ Item represents each course or other product of the cart """
@@ -43,9 +51,21 @@ class Item(models.Model):
                              verbose_name='Level')
     date_created = models.DateTimeField(default=timezone.now)
     image = models.FileField(upload_to='items/', blank=True, null=True)
+    image_hash = models.CharField(max_length=40, blank=True, editable=False)
+    image_formats = models.CharField(max_length=50, blank=True,
+                                     editable=False)
 
     class Meta:
         ordering = ['name', 'date_created']
+        indexes = [
+            models.Index(fields=['category', 'level', 'name'],
+                         name='item_cat_level_name_idx'),
+            models.Index(fields=['name', 'id'], name='item_name_id_idx'),
+            # Filters of the admin, newest first
+            models.Index(fields=['category', 'id'],
+                         name='item_category_id_idx'),
+            models.Index(fields=['level', 'id'], name='item_level_id_idx'),
+        ]
         verbose_name = _('Item')
         verbose_name_plural = _('Items')
 
@@ -55,19 +75,81 @@ class Item(models.Model):
     def __unicode__(self):
         return u'Item %s - %s' % (self.name, self.price)
 
+    @property
+    def image_url(self):
+        """ Url of the image, empty if the item has none """
+
+        return self.image.url if self.image else ''
+
+    def rendition_url(self, width, extension):
+        """ Url of a resized copy of the image made by cart.images
+
+        :param width: width of the rendition, one of RENDITION_SIZES
+        :param extension: format of the rendition, e.g. 'webp' or 'jpg'
+        :return: url of the rendition, empty if it was not generated
+        """
+
+        if not self.image or extension not in self.image_formats.split(','):
+            return ''
+        return self.image.storage.url(rendition_name(
+            self.image.name, self.image_hash, width, extension))
+
+    @property
+    def thumbnail_url(self):
+        return (self.rendition_url(RENDITION_SIZES['thumbnail'], 'jpg') or
+                self.image_url)
+
+    @property
+    def thumbnail_webp_url(self):
+        return self.rendition_url(RENDITION_SIZES['thumbnail'], 'webp')
+
+    @property
+    def card_url(self):
+        return (self.rendition_url(RENDITION_SIZES['card'], 'jpg') or
+                self.image_url)
+
+    @property
+    def card_webp_url(self):
+        return self.rendition_url(RENDITION_SIZES['card'], 'webp')
+
 
 class Cart(models.Model):
     """ This model represents the shopping cart """
 
-    user = models.ForeignKey(User, verbose_name='User')
-    items = models.ManyToManyField(Item, verbose_name='Items')
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             verbose_name='User')
+    items = models.ManyToManyField(Item, through='CartLine',
+                                   verbose_name='Items')
     total = models.DecimalField(blank=True, default=0, max_digits=8,
                                 decimal_places=2, verbose_name='Total')
+    # Maintained by the methods below, and by cart.counters for changes
+    # made through the items manager
+    item_count = models.PositiveIntegerField(default=0, editable=False,
+                                             verbose_name='Items')
     date_created = models.DateTimeField(default=timezone.now)
     active = models.BooleanField(default=True)
+    # Incremented by every write of the totals, see mutate
+    version = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
-        ordering = ['user', 'date_created']
+        indexes = [
+            models.Index(fields=['user', 'active'],
+                         name='cart_user_active_idx'),
+            # Filters of the admin, newest first. Boolean filters are
+            # written as bare conditions, which match partial indexes only
+            models.Index(fields=['id'], condition=models.Q(active=True),
+                         name='cart_active_id_idx'),
+            models.Index(fields=['id'], condition=models.Q(active=False),
+                         name='cart_inactive_id_idx'),
+            # Days of the reports, see cart.reports
+            models.Index(fields=['date_created'],
+                         name='cart_date_created_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user'],
+                                    condition=models.Q(active=True),
+                                    name='cart_one_active_per_user'),
+        ]
         verbose_name = _('Cart')
         verbose_name_plural = _('Carts')
 
@@ -78,9 +160,365 @@ class Cart(models.Model):
         return u'Cart %s - %s' % (self.id, self.user.username)
 
     def set_total(self):
-        """ This method calculates the total of the shopping cart """
+        """ This method calculates the total of the shopping cart
+
+        The sum of the prices stored in the lines is resolved by the
+        database, without reading the items, and the item count is rebuilt
+        with it. Use it only to rebuild them from scratch; regular mutations
+        go through add_item and remove_item.
+        """
+
+        totals = self.lines.aggregate(
+            total=Coalesce(Sum('price'), Value(0),
+                           output_field=models.DecimalField()),
+            count=Count('id'))
+        self.total = totals['total']
+        self.item_count = totals['count']
+        # The new version makes concurrent mutations start over, this
+        # instance too: its version is stale and mutate will read it again
+        Cart.objects.filter(pk=self.pk).update(
+            total=self.total, item_count=self.item_count,
+            version=F('version') + 1)
+
+    def mutate(self, change):
+        """ Change the lines of the cart and write the new totals with a
+        compare-and-swap on the version
+
+        change(cart) reads and writes the lines and returns the difference
+        of the total and of the item count, or None when there is nothing
+        to do. It runs in a transaction and the totals are written only if
+        the cart is still active with the version it was read with; every
+        deactivation moves the version forward too, and a cart found closed
+        is not tried again. Otherwise, or if a concurrent request inserted
+        the same line, the transaction is rolled back, the cart is read
+        again and change runs again, up to CART_MAX_RETRIES times. On SQLite
+        a concurrent writer is retried the same way. No row lock is held
+        while change runs, so concurrent requests on a cart do not wait for
+        each other.
+        :param change: function that receives the cart
+        :return: True if the cart changed, False if there was nothing to do
+        :raise CartConflict: if every attempt lost against another request
+        """
+
+        for attempt in range(settings.CART_MAX_RETRIES):
+            if attempt:
+                # A random pause, so the requests that collided do not
+                # collide again
+                time.sleep(random.uniform(0, 0.005 * attempt))
+                self.refresh_from_db(fields=['total', 'item_count',
+                                             'version', 'active'])
+                if not self.active:
+                    # Paid or closed since it was read
+                    raise CartConflict(self)
+            try:
+                with transaction.atomic():
+                    delta = change(self)
+                    if delta is None:
+                        return False
+                    amount, count = delta
+                    swapped = Cart.objects.filter(
+                        pk=self.pk, version=self.version,
+                        active=True).update(
+                        total=self.total + amount,
+                        item_count=self.item_count + count,
+                        version=self.version + 1)
+                    if not swapped:
+                        raise CartConflict(self)
+            except (CartConflict, IntegrityError):
+                continue
+            except OperationalError as error:
+                # SQLite does not wait for a concurrent writer when the
+                # transaction already read, the attempt is retried
+                if not _locked(error):
+                    raise
+                continue
+            self.total += amount
+            self.item_count += count
+            self.version += 1
+            return True
+        raise CartConflict(self)
+
+    def add_item(self, item):
+        """ Add an item to the cart and increase the total by its price
+
+        The line keeps the price of the item at this moment.
+        :param item: Item instance
+        :return: True if the item was added, False if it was already there
+        """
+
+        def change(cart):
+            if cart.lines.filter(item=item).exists():
+                return None
+            CartLine.objects.create(cart=cart, item=item, price=item.price)
+            return item.price, 1
+
+        return self.mutate(change)
+
+    def remove_item(self, item):
+        """ Remove an item from the cart and decrease the total by its price
+
+        The price subtracted is the one stored in the line.
+        :param item: Item instance
+        :return: True if the item was removed, False if it was not in the cart
+        """
+
+        def change(cart):
+            line = cart.lines.filter(item=item).first()
+            if line is None:
+                return None
+            if not CartLine.objects.filter(pk=line.pk).delete()[0]:
+                # Removed by a concurrent request since it was read
+                raise CartConflict(cart)
+            return -line.price, -1
+
+        return self.mutate(change)
+
+    def change_items(self, add=(), remove=()):
+        """ Add and remove many items in bulk
+
+        Meant to be called from the change function of mutate, which checks
+        the membership of the items and writes the totals.
+        :param add: list of Item instances that are not in the cart
+        :param remove: list of CartLine instances of the cart
+        :return: difference of the total and of the item count, None if
+            there is nothing to change
+        """
+
+        if not add and not remove:
+            return None
+        if add:
+            CartLine.objects.bulk_create([
+                CartLine(cart=self, item=item, price=item.price)
+                for item in add])
+        if remove:
+            deleted, rows = CartLine.objects.filter(
+                pk__in=[line.pk for line in remove]).delete()
+            if deleted != len(remove):
+                raise CartConflict(self)
+        return (sum(item.price for item in add) -
+                sum(line.price for line in remove),
+                len(add) - len(remove))
+
+
+class CartConflict(Exception):
+    """ A cart was changed by another request while it was mutated """
+
+
+def _locked(error):
+    return connection.vendor == 'sqlite' and 'locked' in str(error)
+
+
+class CartLine(models.Model):
+    """ Item inside a cart, with its price when it was added """
+
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE,
+                             related_name='lines', verbose_name='Cart')
+    item = models.ForeignKey(Item, on_delete=models.CASCADE,
+                             verbose_name='Item')
+    price = models.DecimalField(max_digits=8, decimal_places=2,
+                                verbose_name='Price')
+    date_added = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = [('cart', 'item')]
+        verbose_name = _('Cart line')
+        verbose_name_plural = _('Cart lines')
+
+    def __str__(self):
+        return 'CartLine %s - %s' % (self.cart_id, self.item_id)
+
+    def __unicode__(self):
+        return u'CartLine %s - %s' % (self.cart_id, self.item_id)
+
+
+class Order(models.Model):
+    """ Order created when a cart is paid, with the prices of that moment """
+
+    class Status(Enum):
+        """ This class represents the steps of the checkout """
+
+        pending = ('p', 'Pendiente')
+        authorized = ('a', 'Autorizado')
+        completed = ('c', 'Completado')
+        failed = ('f', 'Fallido')
+
+        @classmethod
+        def get_value(cls, member):
+            return cls[member].value[0]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             verbose_name='User')
+    cart = models.OneToOneField(Cart, null=True, on_delete=models.SET_NULL,
+                                verbose_name='Cart')
+    idempotency_key = models.CharField(max_length=100, unique=True)
+    status = models.CharField(max_length=1,
+                              choices=[x.value for x in Status],
+                              default=Status.pending.value[0],
+                              verbose_name='Status')
+    total = models.DecimalField(default=0, max_digits=8, decimal_places=2,
+                                verbose_name='Total')
+    payment_reference = models.CharField(max_length=100, blank=True)
+    access_granted = models.BooleanField(default=False)
+    receipt_sent = models.BooleanField(default=False)
+    reported = models.BooleanField(default=False)
+    error = models.TextField(blank=True)
+    date_created = models.DateTimeField(default=timezone.now)
+    date_updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Days of the reports, see cart.reports
+            models.Index(fields=['date_created'],
+                         name='order_date_created_idx'),
+            # Pending and authorized orders, see checkout.unfinished_orders
+            models.Index(fields=['date_updated'],
+                         condition=models.Q(status__in=['p', 'a']),
+                         name='order_unfinished_idx'),
+        ]
+        verbose_name = _('Order')
+        verbose_name_plural = _('Orders')
+
+    def __str__(self):
+        return 'Order %s - %s' % (self.id, self.get_status_display())
+
+    def __unicode__(self):
+        return u'Order %s - %s' % (self.id, self.get_status_display())
+
+    @property
+    def is_finished(self):
+        return self.status in (Order.Status.get_value('completed'),
+                               Order.Status.get_value('failed'))
+
+
+class OrderLine(models.Model):
+    """ Item of an order, frozen when the order is created """
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE,
+                              related_name='lines',
+                              verbose_name='Order')
+    item = models.ForeignKey(Item, null=True, on_delete=models.SET_NULL,
+                             verbose_name='Item')
+    name = models.CharField(max_length=300, verbose_name='Item')
+    # Frozen with the name, the reports group the sales by them
+    category = models.CharField(max_length=200, blank=True,
+                                choices=Item._meta.get_field('category')
+                                .choices,
+                                verbose_name='Category')
+    level = models.CharField(max_length=150, blank=True,
+                             choices=Item._meta.get_field('level').choices,
+                             verbose_name='Level')
+    price = models.DecimalField(max_digits=8, decimal_places=2,
+                                verbose_name='Price')
+
+    class Meta:
+        verbose_name = _('Order line')
+        verbose_name_plural = _('Order lines')
+
+    def __str__(self):
+        return 'OrderLine %s - %s' % (self.name, self.price)
+
+    def __unicode__(self):
+        return u'OrderLine %s - %s' % (self.name, self.price)
+
+
+class CourseAccess(models.Model):
+    """ Access of a user to a course, granted by a completed order """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             verbose_name='User')
+    item = models.ForeignKey(Item, on_delete=models.CASCADE,
+                             verbose_name='Item')
+    order = models.ForeignKey(Order, null=True, on_delete=models.SET_NULL,
+                              verbose_name='Order')
+    date_created = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = [('user', 'item')]
+        verbose_name = _('Course access')
+        verbose_name_plural = _('Course accesses')
+
+    def __str__(self):
+        return 'CourseAccess %s - %s' % (self.user_id, self.item_id)
+
+    def __unicode__(self):
+        return u'CourseAccess %s - %s' % (self.user_id, self.item_id)
+
+
+class DailySummary(models.Model):
+    """ Carts created and orders completed in a day, see cart.reports """
 
-        self.total = 0
-        for item in self.items.all():
-            self.total += item.price
-        self.save()
+    date = models.DateField(unique=True, verbose_name='Date')
+    carts = models.PositiveIntegerField(default=0, verbose_name='Carts')
+    orders = models.PositiveIntegerField(default=0, verbose_name='Orders')
+    items = models.PositiveIntegerField(default=0, verbose_name='Items')
+    revenue = models.DecimalField(default=0, max_digits=14,
+                                  decimal_places=2, verbose_name='Revenue')
+
+    class Meta:
+        verbose_name = _('Daily summary')
+        verbose_name_plural = _('Daily summaries')
+
+    def __str__(self):
+        return 'DailySummary %s' % self.date
+
+    def __unicode__(self):
+        return u'DailySummary %s' % self.date
+
+    @property
+    def conversion(self):
+        """ Orders completed for each cart created, None without carts """
+
+        return self.orders / self.carts if self.carts else None
+
+
+class DailySales(models.Model):
+    """ Sales of a category and level in a day, see cart.reports """
+
+    date = models.DateField(verbose_name='Date')
+    category = models.CharField(max_length=200, blank=True,
+                                choices=Item._meta.get_field('category')
+                                .choices,
+                                verbose_name='Category')
+    level = models.CharField(max_length=150, blank=True,
+                             choices=Item._meta.get_field('level').choices,
+                             verbose_name='Level')
+    orders = models.PositiveIntegerField(default=0, verbose_name='Orders')
+    items = models.PositiveIntegerField(default=0, verbose_name='Items')
+    revenue = models.DecimalField(default=0, max_digits=14,
+                                  decimal_places=2, verbose_name='Revenue')
+
+    class Meta:
+        unique_together = [('date', 'category', 'level')]
+        verbose_name = _('Daily sales')
+        verbose_name_plural = _('Daily sales')
+
+    def __str__(self):
+        return 'DailySales %s - %s %s' % (self.date, self.category,
+                                          self.level)
+
+    def __unicode__(self):
+        return u'DailySales %s - %s %s' % (self.date, self.category,
+                                           self.level)
+
+
+class DailyItemSales(models.Model):
+    """ Sales of an item in a day, see cart.reports """
+
+    date = models.DateField(verbose_name='Date')
+    item = models.ForeignKey(Item, on_delete=models.CASCADE,
+                             verbose_name='Item')
+    quantity = models.PositiveIntegerField(default=0,
+                                           verbose_name='Quantity')
+    revenue = models.DecimalField(default=0, max_digits=14,
+                                  decimal_places=2, verbose_name='Revenue')
+
+    class Meta:
+        unique_together = [('date', 'item')]
+        verbose_name = _('Daily item sales')
+        verbose_name_plural = _('Daily item sales')
+
+    def __str__(self):
+        return 'DailyItemSales %s - %s' % (self.date, self.item_id)
+
+    def __unicode__(self):
+        return u'DailyItemSales %s - %s' % (self.date, self.item_id)
@@ -0,0 +1,209 @@
+import datetime
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Min, OuterRef, Subquery, Sum
+from django.db.models.functions import TruncDate
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import (Cart, DailyItemSales, DailySales, DailySummary, Item,
+                     Order, OrderLine)
+
+# Number of items of the dashboard, the best sold
+TOP_ITEMS = 10
+
+CATEGORY_NAMES = dict(Item._meta.get_field('category').choices)
+LEVEL_NAMES = dict(Item._meta.get_field('level').choices)
+
+
+def _increment(model, key, **counters):
+    """ Add to the counters of the rollup row of a key, creating it first
+    if it is missing
+
+    The row is inserted with its counters in zero, a conflict with a
+    concurrent insert is ignored, and updated again.
+    :param model: rollup model
+    :param key: dict of the fields that identify the row
+    :param counters: amounts to add to each field
+    """
+
+    rows = model.objects.filter(**key)
+    changes = {name: F(name) + amount for name, amount in counters.items()}
+    if not rows.update(**changes):
+        model.objects.bulk_create([model(**key)], ignore_conflicts=True)
+        rows.update(**changes)
+
+
+@receiver(post_save, sender=Cart)
+def record_cart(sender, instance, created, raw=False, **kwargs):
+    """ Count the new carts in the summary of their day """
+
+    if created and not raw:
+        _increment(DailySummary,
+                   {'date': timezone.localdate(instance.date_created)},
+                   carts=1)
+
+
+def record_order(order):
+    """ Add a completed order to the rollups of the day it was placed
+
+    Call it once per order, in the transaction that completes it. The
+    lines are grouped by the database and the items are added with one
+    INSERT and one UPDATE, whatever the size of the order.
+    :param order: Order instance
+    """
+
+    day = timezone.localdate(order.date_created)
+    items = 0
+    for sales in (order.lines.order_by().values('category', 'level')
+                  .annotate(count=Count('id'), total=Sum('price'))):
+        _increment(DailySales, {'date': day, 'category': sales['category'],
+                                'level': sales['level']},
+                   orders=1, items=sales['count'], revenue=sales['total'])
+        items += sales['count']
+    _increment(DailySummary, {'date': day}, orders=1, items=items,
+               revenue=order.total)
+
+    lines = order.lines.exclude(item=None)
+    DailyItemSales.objects.bulk_create(
+        [DailyItemSales(date=day, item_id=item_id)
+         for item_id in lines.values_list('item_id', flat=True)],
+        ignore_conflicts=True)
+    price = lines.filter(item=OuterRef('item')).values('price')[:1]
+    DailyItemSales.objects.filter(date=day, item__in=lines.values('item')) \
+        .update(quantity=F('quantity') + 1,
+                revenue=F('revenue') + Subquery(price))
+
+
+def day_start(day):
+    """ First moment of a day in the current time zone """
+
+    return timezone.make_aware(datetime.datetime.combine(day,
+                                                         datetime.time.min))
+
+
+def history_range():
+    """ Days from the first cart or order to today
+
+    :return: tuple of the first day and the day after today
+    """
+
+    firsts = [first for first in (
+        Cart.objects.aggregate(first=Min('date_created'))['first'],
+        Order.objects.aggregate(first=Min('date_created'))['first'])
+        if first is not None]
+    today = timezone.localdate()
+    start = timezone.localdate(min(firsts)) if firsts else today
+    return start, today + datetime.timedelta(days=1)
+
+
+def chunks(start, end, days):
+    """ Split the days from start to end, end excluded, in ranges
+
+    :return: list of (start, end) tuples
+    """
+
+    step = datetime.timedelta(days=days)
+    ranges = []
+    while start < end:
+        ranges.append((start, min(start + step, end)))
+        start += step
+    return ranges
+
+
+def rebuild(start, end, batch_size=1000):
+    """ Calculate again the rollups of the days from start to end, end
+    excluded, from the completed orders
+
+    The carts are deleted by reap_carts, so the days that already have a
+    summary keep their count of carts, and only the days without one, e.g.
+    loaded with bulk_create, count the carts that still exist. The rows of
+    the days are replaced in a single transaction, so ranges that do not
+    overlap can be rebuilt at the same time.
+    :return: number of orders
+    """
+
+    since, until = day_start(start), day_start(end)
+    day = TruncDate('date_created')
+    carts = Cart.objects.filter(date_created__gte=since,
+                                date_created__lt=until)
+    orders = Order.objects.filter(status=Order.Status.get_value('completed'),
+                                  date_created__gte=since,
+                                  date_created__lt=until)
+    lines = (OrderLine.objects.filter(order__in=orders)
+             .annotate(day=TruncDate('order__date_created')))
+    days = DailySummary.objects.filter(date__gte=start, date__lt=end)
+
+    summaries = defaultdict(dict)
+    for row in (carts.order_by().annotate(day=day).values('day')
+                .annotate(carts=Count('id'))):
+        summaries[row.pop('day')].update(row)
+    for row in (orders.order_by().annotate(day=day).values('day')
+                .annotate(orders=Count('id'), revenue=Sum('total'))):
+        summaries[row.pop('day')].update(row)
+    for row in (lines.order_by().values('day')
+                .annotate(items=Count('id'))):
+        summaries[row.pop('day')].update(row)
+
+    with transaction.atomic():
+        for date, count in days.values_list('date', 'carts'):
+            summaries[date]['carts'] = count
+        for model in (DailySummary, DailySales, DailyItemSales):
+            model.objects.filter(date__gte=start, date__lt=end).delete()
+        DailySummary.objects.bulk_create(
+            [DailySummary(date=date, **counters)
+             for date, counters in summaries.items()],
+            batch_size=batch_size)
+        DailySales.objects.bulk_create(
+            [DailySales(date=row['day'], category=row['category'],
+                        level=row['level'], orders=row['orders'],
+                        items=row['items'], revenue=row['revenue'])
+             for row in lines.order_by().values('day', 'category', 'level')
+             .annotate(orders=Count('order', distinct=True),
+                       items=Count('id'), revenue=Sum('price'))],
+            batch_size=batch_size)
+        DailyItemSales.objects.bulk_create(
+            [DailyItemSales(date=row['day'], item_id=row['item'],
+                            quantity=row['quantity'], revenue=row['revenue'])
+             for row in lines.exclude(item=None).order_by()
+             .values('day', 'item')
+             .annotate(quantity=Count('id'), revenue=Sum('price'))
+             .iterator()],
+            batch_size=batch_size)
+    return sum(counters.get('orders', 0) for counters in summaries.values())
+
+
+def summarize(summaries):
+    """ Totals, sales by category and level and best sold items of the
+    days of a queryset of DailySummary
+
+    Only the rollups are read, so the cost depends on the number of days
+    and not on the number of orders.
+    :param summaries: queryset of DailySummary
+    :return: dict
+    """
+
+    dates = summaries.order_by().values('date')
+    totals = summaries.aggregate(carts=Sum('carts'), orders=Sum('orders'),
+                                 items=Sum('items'), revenue=Sum('revenue'))
+    totals['conversion'] = (totals['orders'] / totals['carts']
+                            if totals['carts'] else None)
+
+    sales = list(DailySales.objects.filter(date__in=dates).order_by()
+                 .values('category', 'level')
+                 .annotate(orders=Sum('orders'), items=Sum('items'),
+                           revenue=Sum('revenue'))
+                 .order_by('-revenue', 'category', 'level'))
+    for row in sales:
+        row['category_name'] = CATEGORY_NAMES.get(row['category'], '-')
+        row['level_name'] = LEVEL_NAMES.get(row['level'], '-')
+
+    top_items = list(DailyItemSales.objects.filter(date__in=dates).order_by()
+                     .values('item', 'item__name')
+                     .annotate(quantity=Sum('quantity'),
+                               revenue=Sum('revenue'))
+                     .order_by('-revenue', 'item')[:TOP_ITEMS])
+
+    return {'totals': totals, 'sales': sales, 'top_items': top_items}
@@ -0,0 +1,387 @@
+import hashlib
+import re
+import unicodedata
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .catalogue import (CATEGORIES, LEVELS, PAGE_SIZE, PAGE_TIMEOUT,
+                        VERSION_KEY)
+from .models import Item
+from .utils import get_cache_version
+
+# Words of a query that are used, the rest are ignored
+MAX_TERMS = 8
+
+# Queries of benchmark_search and of the load test: words of the catalogue,
+# prefixes and rare words of the synthetic items of cart.datagen
+SAMPLE_QUERIES = ['diseño', 'blen', 'adobe photoshop', 'fotografia avanzada',
+                  'animación 3d unity', 'rabedi', 'tocemu lar']
+
+
+def normalize(text):
+    """ Lower case text without accents, 'Diseño' becomes 'diseno'
+
+    Both the index and the queries are normalized, so the matching does not
+    depend on accents on any database.
+    """
+
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(char for char in decomposed
+                   if not unicodedata.combining(char)).lower()
+
+
+def search_terms(query):
+    """ Normalized words of a query
+
+    :param query: text typed by the user
+    :return: list of strings, empty if the query has no words
+    """
+
+    return re.findall(r'\w+', normalize(query or ''))[:MAX_TERMS]
+
+
+class SearchBackend(object):
+    """ Index of the item names in the table cart_item_search
+
+    The table is created by the migrations for each database and keeps the
+    category and level of the item, so that the results are filtered and
+    the facets counted from the index alone. Every term of a query must
+    match the beginning of a word of the name.
+    """
+
+    id_column = None
+    upsert_sql = None
+    match_sql = None
+    rank_sql = None
+    optimize_sql = None
+
+    def __init__(self, db_connection=connection):
+        self.connection = db_connection
+
+    def entry(self, item):
+        """ Parameters of upsert_sql for an item """
+
+        return item.id, normalize(item.name), item.category, item.level
+
+    def match_params(self, terms, category=None, level=None):
+        """ Parameters of match_sql for the terms and the filters """
+
+        raise NotImplementedError
+
+    def rank_params(self, terms):
+        """ Parameters of rank_sql for the terms """
+
+        return []
+
+    def index(self, items):
+        """ Add or replace the entries of some items
+
+        :param items: list of Item instances
+        """
+
+        if not items:
+            return
+        with self.connection.cursor() as cursor:
+            cursor.executemany(self.upsert_sql,
+                               [self.entry(item) for item in items])
+
+    def remove(self, item_ids):
+        """ Remove the entries of some items
+
+        :param item_ids: list of ids
+        """
+
+        if not item_ids:
+            return
+        with self.connection.cursor() as cursor:
+            cursor.execute('DELETE FROM cart_item_search WHERE %s IN (%s)' % (
+                self.id_column, ', '.join(['%s'] * len(item_ids))),
+                list(item_ids))
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute('DELETE FROM cart_item_search')
+
+    def optimize(self):
+        """ Compact the index after many items were indexed """
+
+        with self.connection.cursor() as cursor:
+            cursor.execute(self.optimize_sql)
+
+    def search(self, terms, category, level, limit, offset=0):
+        """ Ids of the items that match, the best ranked first
+
+        :param terms: list of normalized words, see search_terms
+        :param category: value of Item.Category or None for any
+        :param level: value of Item.Level or None for any
+        :param limit: maximum number of ids
+        :param offset: number of ids skipped
+        :return: list of ids
+        """
+
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT %s FROM cart_item_search WHERE %s ORDER BY %s '
+                'LIMIT %%s OFFSET %%s' % (
+                    self.id_column, self.match_sql, self.rank_sql),
+                self.match_params(terms, category, level) +
+                self.rank_params(terms) + [limit, offset])
+            return [row[0] for row in cursor.fetchall()]
+
+    def facet_counts(self, terms):
+        """ Number of matches of the terms for each category and level
+
+        A single query answers the facets of any combination of filters.
+        :param terms: list of normalized words
+        :return: dict of (category, level) and count
+        """
+
+        raise NotImplementedError
+
+
+class SqliteSearchBackend(SearchBackend):
+    """ FTS5 virtual table, ranked with bm25
+
+    The category and level are indexed as the words of the column facets,
+    e.g. 'cdes la', so filters are intersections with their lists in the
+    index instead of reads of every matching row.
+    """
+
+    id_column = 'rowid'
+    upsert_sql = ('INSERT OR REPLACE INTO cart_item_search '
+                  '(rowid, name, facets) VALUES (%s, %s, %s)')
+    match_sql = 'cart_item_search MATCH %s'
+    rank_sql = 'rank, rowid'
+    # Merge the segments written by each batch in a single b-tree
+    optimize_sql = ("INSERT INTO cart_item_search (cart_item_search) "
+                    "VALUES ('optimize')")
+
+    def entry(self, item):
+        return item.id, normalize(item.name), 'c%s l%s' % (item.category,
+                                                          item.level)
+
+    def match_params(self, terms, category=None, level=None):
+        match = ' '.join('name:"%s"*' % term for term in terms)
+        if category:
+            match += ' facets:c%s' % category
+        if level:
+            match += ' facets:l%s' % level
+        return [match]
+
+    def facet_counts(self, terms):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT facets, COUNT(*) FROM cart_item_search WHERE %s '
+                'GROUP BY facets' % self.match_sql, self.match_params(terms))
+            return {tuple(word[1:] for word in facets.split()): count
+                    for facets, count in cursor.fetchall()}
+
+
+class PostgresSearchBackend(SearchBackend):
+    """ tsvector column with a GIN index, ranked with ts_rank """
+
+    id_column = 'item_id'
+    upsert_sql = (
+        'INSERT INTO cart_item_search (item_id, document, category, level) '
+        "VALUES (%s, to_tsvector('simple', %s), %s, %s) "
+        'ON CONFLICT (item_id) DO UPDATE SET document = EXCLUDED.document, '
+        'category = EXCLUDED.category, level = EXCLUDED.level')
+    match_sql = ("document @@ to_tsquery('simple', %s) "
+                 'AND category = COALESCE(%s, category) '
+                 'AND level = COALESCE(%s, level)')
+    rank_sql = "ts_rank(document, to_tsquery('simple', %s)) DESC, item_id"
+    optimize_sql = 'ANALYZE cart_item_search'
+
+    def tsquery(self, terms):
+        return ' & '.join('%s:*' % term for term in terms)
+
+    def match_params(self, terms, category=None, level=None):
+        return [self.tsquery(terms), category, level]
+
+    def rank_params(self, terms):
+        return [self.tsquery(terms)]
+
+    def facet_counts(self, terms):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT category, level, COUNT(*) FROM cart_item_search '
+                'WHERE %s GROUP BY category, level' % self.match_sql,
+                self.match_params(terms))
+            return {(category, level): count
+                    for category, level, count in cursor.fetchall()}
+
+
+class BasicSearchBackend(SearchBackend):
+    """ Search with LIKE on the items, for databases without an index
+
+    Accents are not ignored and the results are ordered by name.
+    """
+
+    def index(self, items):
+        pass
+
+    def remove(self, item_ids):
+        pass
+
+    def clear(self):
+        pass
+
+    def optimize(self):
+        pass
+
+    def _queryset(self, terms):
+        queryset = Item.objects.all()
+        for term in terms:
+            queryset = queryset.filter(name__icontains=term)
+        return queryset
+
+    def search(self, terms, category, level, limit, offset=0):
+        queryset = self._queryset(terms)
+        if category:
+            queryset = queryset.filter(category=category)
+        if level:
+            queryset = queryset.filter(level=level)
+        return list(queryset.order_by('name', 'id')
+                    .values_list('id', flat=True)[offset:offset + limit])
+
+    def facet_counts(self, terms):
+        return {(category, level): count for category, level, count in
+                self._queryset(terms).order_by()
+                .values_list('category', 'level').annotate(Count('id'))}
+
+
+BACKENDS = {
+    'sqlite': SqliteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_backend():
+    """ Search backend of the database of the default connection """
+
+    return BACKENDS.get(connection.vendor, BasicSearchBackend)()
+
+
+def index_items(items):
+    """ Update the index after items were saved without signals, e.g. with
+    bulk_create or bulk_update """
+
+    get_backend().index(items)
+
+
+def rebuild(batch_size=1000):
+    """ Build the whole index again from the items
+
+    :param batch_size: number of items indexed per query
+    :return: number of items indexed
+    """
+
+    backend = get_backend()
+    backend.clear()
+    indexed, last_id = 0, 0
+    while True:
+        items = list(Item.objects.filter(id__gt=last_id).order_by('id')
+                     .only('id', 'name', 'category', 'level')[:batch_size])
+        if not items:
+            backend.optimize()
+            return indexed
+        backend.index(items)
+        indexed += len(items)
+        last_id = items[-1].id
+
+
+def search(query, category=None, level=None, page=1, page_size=PAGE_SIZE):
+    """ Page of the items whose name matches a query, best matches first
+
+    Results are cached with the pages of the catalogue and expire with them
+    when an item changes. The facets count the matches of each category
+    for the selected level and of each level for the selected category.
+    Unknown filters and pages are ignored.
+    :param query: text typed by the user
+    :param category: value of Item.Category
+    :param level: value of Item.Level
+    :param page: number of the page, from 1
+    :param page_size: number of items of the page
+    :return: dict with the items, the count of matches, the facets and the
+        number of the next page
+    """
+
+    terms = search_terms(query)
+    category = category if category in CATEGORIES else None
+    level = level if level in LEVELS else None
+    try:
+        page = max(int(page), 1)
+    except (TypeError, ValueError):
+        page = 1
+
+    version = get_cache_version(VERSION_KEY)
+    key = 'search:%s:%s' % (version, _digest(
+        terms, category, level, page, page_size))
+    result = cache.get(key)
+    if result is None:
+        # The counts only depend on the terms, they are shared by the pages
+        # and filters of a query
+        counts_key = 'search:counts:%s:%s' % (version, _digest(terms))
+        counts = cache.get(counts_key)
+        if counts is None:
+            counts = get_backend().facet_counts(terms) if terms else {}
+            cache.set(counts_key, counts, PAGE_TIMEOUT)
+        result = search_index(terms, category, level, page, page_size,
+                              counts)
+        cache.set(key, result, PAGE_TIMEOUT)
+    return result
+
+
+def _digest(*args):
+    return hashlib.md5(repr(args).encode('utf-8')).hexdigest()
+
+
+def search_index(terms, category, level, page, page_size, counts=None):
+    """ Query the index for one page of results and its facets, without the
+    cache of search
+
+    :param counts: facet_counts of the terms, queried if not given
+    """
+
+    facets = {'category': {}, 'level': {}}
+    if not terms:
+        return {'items': [], 'count': 0, 'next': None, 'facets': facets}
+
+    backend = get_backend()
+    ids = backend.search(terms, category, level, page_size + 1,
+                         (page - 1) * page_size)
+    if counts is None:
+        counts = backend.facet_counts(terms)
+    count = 0
+    for (item_category, item_level), matches in counts.items():
+        if level in (None, item_level):
+            facets['category'][item_category] = (
+                facets['category'].get(item_category, 0) + matches)
+        if category in (None, item_category):
+            facets['level'][item_level] = (
+                facets['level'].get(item_level, 0) + matches)
+        if category in (None, item_category) and level in (None, item_level):
+            count += matches
+
+    items = Item.objects.in_bulk(ids[:page_size])
+    return {
+        'items': [items[item_id] for item_id in ids[:page_size]
+                  if item_id in items],
+        'count': count,
+        'next': page + 1 if len(ids) > page_size else None,
+        'facets': facets,
+    }
+
+
+@receiver(post_save, sender=Item)
+def index_item(sender, instance, **kwargs):
+    get_backend().index([instance])
+
+
+@receiver(post_delete, sender=Item)
+def remove_item(sender, instance, **kwargs):
+    get_backend().remove([instance.id])
@@ -0,0 +1,172 @@
+from decimal import Decimal
+
+from . import snapshot
+from .models import Item, Cart
+from .session import SessionCart
+
+BATCH_OPERATIONS = ('add', 'remove')
+BATCH_MAX_OPERATIONS = 100
+
+
+def merge_cart(user, item_ids):
+    """ Merge a list of item ids into the active cart of the user
+
+    Entry point for every flow that turns a guest cart into a database cart
+    (session login, API login, SSO). The ids and their prices are read with
+    one query, and in one Cart.mutate the lines already in the cart are
+    skipped, the missing ones are inserted in bulk and the totals are
+    increased by them.
+    :param user: User instance
+    :param item_ids: list of item ids
+    :return: Cart
+    :raise CartConflict: if the cart kept changing or was closed meanwhile
+    """
+
+    cart, created = Cart.objects.get_or_create(user=user, active=True)
+
+    items = list(Item.objects.filter(id__in=item_ids).order_by()
+                 .only('id', 'price'))
+
+    def change(cart):
+        present = set(cart.lines.filter(item__in=items)
+                      .values_list('item_id', flat=True))
+        return cart.change_items(
+            add=[item for item in items if item.id not in present])
+
+    if items and cart.mutate(change):
+        snapshot.invalidate(user)
+    return cart
+
+
+def parse_operations(data):
+    """ Validate the body of a batch request
+
+    The body is {"operations": [{"op": "add", "item": 1}, ...]} with at most
+    BATCH_MAX_OPERATIONS operations, which are applied in order.
+    :param data: decoded JSON body
+    :return: list of (op, item_id) tuples
+    :raise ValueError: if the body is not valid
+    """
+
+    if not isinstance(data, dict) or \
+            not isinstance(data.get('operations'), list):
+        raise ValueError('operations must be a list')
+    if len(data['operations']) > BATCH_MAX_OPERATIONS:
+        raise ValueError('at most %s operations are allowed'
+                         % BATCH_MAX_OPERATIONS)
+
+    operations = []
+    for operation in data['operations']:
+        if not isinstance(operation, dict) or \
+                operation.get('op') not in BATCH_OPERATIONS:
+            raise ValueError('op must be one of %s' % ', '.join(
+                BATCH_OPERATIONS))
+        item_id = operation.get('item')
+        if isinstance(item_id, bool) or not isinstance(item_id, int):
+            raise ValueError('item must be an integer')
+        operations.append((operation['op'], item_id))
+    return operations
+
+
+def apply_session_operations(session, operations):
+    """ Apply a batch of operations to the cart of an anonymous user
+
+    Unknown items are validated with one query and ignored, the session is
+    written once.
+    :param session: session of the request
+    :param operations: list of (op, item_id) tuples
+    :return: dict with the state of the cart
+    """
+
+    cart = SessionCart(session)
+    added = {item_id for op, item_id in operations if op == 'add'}
+    valid = set(Item.objects.filter(id__in=added).order_by()
+                .values_list('id', flat=True)) if added else set()
+
+    for op, item_id in operations:
+        if op == 'add':
+            if item_id in valid:
+                cart.add(item_id)
+        else:
+            cart.remove(item_id)
+    cart.save()
+
+    return cart_state(cart.item_ids, cart.total())
+
+
+def apply_cart_operations(user, operations):
+    """ Apply a batch of operations to the active cart of the user
+
+    The operations are replayed in memory over the lines of the batch that
+    are already in the cart, so the database receives one INSERT, one DELETE
+    and one update of the total whatever the size of the batch, all of them
+    in the same transaction of Cart.mutate. The cart is only created when
+    an item that exists is added.
+    :param user: User instance
+    :param operations: list of (op, item_id) tuples
+    :return: dict with the state of the cart
+    """
+
+    item_ids = {item_id for op, item_id in operations}
+    items = {item.id: item for item in
+             Item.objects.filter(id__in=item_ids).order_by()
+             .only('id', 'price')}
+    if any(op == 'add' and item_id in items for op, item_id in operations):
+        cart, created = Cart.objects.get_or_create(user=user, active=True)
+    else:
+        cart = Cart.objects.filter(user=user, active=True).first()
+        if cart is None:
+            return cart_state([], 0)
+
+    def change(cart):
+        lines = {}
+        if items:
+            lines = {line.item_id: line for line in cart.lines.filter(
+                item_id__in=items).only('cart_id', 'item_id', 'price')}
+
+        current = set(lines)
+        final = set(current)
+        for op, item_id in operations:
+            if item_id not in items:
+                continue
+            if op == 'add':
+                final.add(item_id)
+            else:
+                final.discard(item_id)
+
+        return cart.change_items(
+            add=[items[item_id] for item_id in final - current],
+            remove=[lines[item_id] for item_id in current - final])
+
+    changed = cart.mutate(change)
+    cart_ids = list(cart.lines.order_by('item_id')
+                    .values_list('item_id', flat=True))
+
+    if changed:
+        snapshot.invalidate(user)
+    return cart_state(cart_ids, cart.total)
+
+
+def cart_state(item_ids, total):
+    """ Compact representation of a cart for the JSON responses
+
+    :param item_ids: list of item ids
+    :param total: total of the cart
+    :return: dict
+    """
+
+    state = {'items': item_ids}
+    state.update(cart_summary(len(item_ids), total))
+    return state
+
+
+def cart_summary(count, total):
+    """ Badge count and total of a cart for the JSON and fragment responses
+
+    :param count: number of items in the cart
+    :param total: total of the cart
+    :return: dict
+    """
+
+    return {'count': count,
+            'total': str(Decimal(total).quantize(Decimal('0.01')))}
@@ -0,0 +1,214 @@
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.sessions.backends import cached_db
+from django.db.models import DecimalField, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Item
+
+
+def resolve_items(item_ids):
+    """ Load the items of an anonymous cart in a constant number of queries
+
+    The items keep the order of item_ids and ids that no longer exist are
+    dropped silently, the total is calculated by the database.
+    :param item_ids: list of item ids
+    :return: tuple with the list of items and the total
+    """
+
+    if not item_ids:
+        return [], 0
+
+    # A single IN query, in_bulk would split big carts in batches on SQLite
+    found = {item.id: item for item in Item.objects.filter(id__in=item_ids)}
+    items = [found[item_id] for item_id in item_ids if item_id in found]
+    return items, items_total(found)
+
+
+async def aresolve_items(item_ids):
+    """ Async version of resolve_items """
+
+    if not item_ids:
+        return [], 0
+
+    found = {item.id: item
+             async for item in Item.objects.filter(id__in=item_ids)}
+    items = [found[item_id] for item_id in item_ids if item_id in found]
+    return items, await aitems_total(found)
+
+
+def items_total(item_ids):
+    """ Sum of the prices of the items, calculated by the database
+
+    :param item_ids: list of item ids
+    :return: Decimal
+    """
+
+    if not item_ids:
+        return 0
+    return Item.objects.filter(id__in=item_ids).aggregate(
+        total=Coalesce(Sum('price'), Value(0),
+                       output_field=DecimalField()))['total']
+
+
+async def aitems_total(item_ids):
+    """ Async version of items_total """
+
+    if not item_ids:
+        return 0
+    return (await Item.objects.filter(id__in=item_ids).aaggregate(
+        total=Coalesce(Sum('price'), Value(0),
+                       output_field=DecimalField())))['total']
+
+
+class SessionCart(object):
+    """ Cart of an anonymous user stored in the session
+
+    The session keeps a plain list of item ids under 'cart', which the
+    session serializer stores as is, and its length under 'count_items' for
+    the badge. In memory the ids are an ordered set, so membership is O(1).
+    The session is only written by save() when the cart changed. Carts
+    stored by older versions as a JSON string are read transparently and
+    rewritten in the new format on their next change. Async views build it
+    with aload() and write it with asave().
+    """
+
+    SESSION_KEY = 'cart'
+    COUNT_KEY = 'count_items'
+
+    def __init__(self, session, data=None):
+        self.session = session
+        if data is None:
+            data = session.get(self.SESSION_KEY) or []
+        if isinstance(data, str):
+            data = json.loads(data)['items']
+        self._ids = OrderedDict.fromkeys(int(item_id) for item_id in data)
+        self.modified = False
+
+    @classmethod
+    async def aload(cls, session):
+        """ Build the cart reading the session asynchronously """
+
+        return cls(session, await session.aget(cls.SESSION_KEY, []))
+
+    def __contains__(self, item_id):
+        return int(item_id) in self._ids
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def __len__(self):
+        return len(self._ids)
+
+    @property
+    def item_ids(self):
+        return list(self._ids)
+
+    def add(self, item_id):
+        """ Add an item id, return False if it was already in the cart """
+
+        item_id = int(item_id)
+        if item_id in self._ids:
+            return False
+        self._ids[item_id] = None
+        self.modified = True
+        return True
+
+    def remove(self, item_id):
+        """ Remove an item id, return False if it was not in the cart """
+
+        item_id = int(item_id)
+        if item_id not in self._ids:
+            return False
+        del self._ids[item_id]
+        self.modified = True
+        return True
+
+    def resolve(self):
+        """ Load the items of the cart
+
+        :return: tuple with the list of items and the total
+        """
+
+        return resolve_items(self.item_ids)
+
+    async def aresolve(self):
+        return await aresolve_items(self.item_ids)
+
+    def total(self):
+        """ Total of the cart without loading its items """
+
+        return items_total(self.item_ids)
+
+    async def atotal(self):
+        return await aitems_total(self.item_ids)
+
+    def save(self):
+        """ Write the cart into the session if it changed """
+
+        if self.modified:
+            self.session[self.SESSION_KEY] = self.item_ids
+            self.session[self.COUNT_KEY] = len(self._ids)
+            self.modified = False
+
+    async def asave(self):
+        if self.modified:
+            await self.session.aset(self.SESSION_KEY, self.item_ids)
+            await self.session.aset(self.COUNT_KEY, len(self._ids))
+            self.modified = False
+
+    def clear(self):
+        """ Remove the cart from the session """
+
+        self._ids.clear()
+        self.modified = False
+        for key in (self.SESSION_KEY, self.COUNT_KEY):
+            if key in self.session:
+                del self.session[key]
+
+
+class SessionStore(cached_db.SessionStore):
+    """ Session engine of the project, cached_db without useless writes
+
+    Sessions are read from the cache and written to the database and the
+    cache, like cached_db, but a save that would store the same data that
+    was loaded is skipped: setting a key to the value it already has marks
+    the session modified and would UPDATE django_session anyway. The data
+    is compared serialized. With SESSION_SAVE_EVERY_REQUEST every save is
+    done, so that the expiry date keeps moving.
+    """
+
+    _loaded = None
+
+    def _dump(self, data):
+        return self.serializer().dumps(data)
+
+    def _unchanged(self, must_create):
+        return (not must_create and self._loaded is not None and
+                not settings.SESSION_SAVE_EVERY_REQUEST and
+                hasattr(self, '_session_cache') and
+                self._dump(self._session_cache) == self._loaded)
+
+    def load(self):
+        data = super(SessionStore, self).load()
+        self._loaded = self._dump(data)
+        return data
+
+    async def aload(self):
+        data = await super(SessionStore, self).aload()
+        self._loaded = self._dump(data)
+        return data
+
+    def save(self, must_create=False):
+        if self._unchanged(must_create):
+            return
+        super(SessionStore, self).save(must_create)
+        self._loaded = self._dump(self._session_cache)
+
+    async def asave(self, must_create=False):
+        if self._unchanged(must_create):
+            return
+        await super(SessionStore, self).asave(must_create)
+        self._loaded = self._dump(self._session_cache)
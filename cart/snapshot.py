@@ -0,0 +1,165 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Cart
+from .utils import (aget_cache_version, abump_cache_version,
+                    get_cache_version, bump_cache_version)
+
+
+def _version_key(user_id):
+    return 'cart:version:%s' % user_id
+
+
+def build_snapshot(user):
+    """ Read the active cart of the user from the database
+
+    :param user: User instance
+    :return: dict with the cart id, its items and the total
+    """
+
+    try:
+        cart = Cart.objects.get(user=user, active=True)
+    except Cart.DoesNotExist:
+        return {'id': None, 'items': [], 'total': 0}
+
+    items = [_item_data(line) for line in _lines(cart)]
+    return {'id': cart.id, 'items': items, 'total': cart.total}
+
+
+async def abuild_snapshot(user):
+    """ Async version of build_snapshot """
+
+    try:
+        cart = await Cart.objects.aget(user=user, active=True)
+    except Cart.DoesNotExist:
+        return {'id': None, 'items': [], 'total': 0}
+
+    items = [_item_data(line) async for line in _lines(cart)]
+    return {'id': cart.id, 'items': items, 'total': cart.total}
+
+
+def _lines(cart):
+    """ Lines of the cart with their items, in the order of the catalogue """
+
+    return (cart.lines.select_related('item')
+            .order_by('item__name', 'item__date_created'))
+
+
+def _item_data(line):
+    """ Data of an item of the cart, with the price stored in its line """
+
+    item = line.item
+    return {'id': item.id, 'name': item.name, 'price': line.price,
+            'thumbnail_url': item.thumbnail_url,
+            'thumbnail_webp_url': item.thumbnail_webp_url}
+
+
+def get_snapshot(user):
+    """ Return the active cart of the user, read through the cache
+
+    Entries are keyed by user id and version, so invalidate() makes every
+    previous entry unreachable in one atomic cache operation. A user
+    without an active cart is cached too. The version lives in the cache
+    as well, so with a cache per process the other processes serve their
+    entry until CART_SNAPSHOT_TIMEOUT expires it.
+    :param user: User instance
+    :return: dict with the cart id, its items and the total, or None if
+        the user has no active cart
+    """
+
+    key = _snapshot_key(user, get_cache_version(_version_key(user.id)))
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = build_snapshot(user)
+        cache.set(key, snapshot, settings.CART_SNAPSHOT_TIMEOUT)
+    return snapshot if snapshot['id'] else None
+
+
+async def aget_snapshot(user):
+    """ Async version of get_snapshot """
+
+    key = _snapshot_key(
+        user, await aget_cache_version(_version_key(user.id)))
+    snapshot = await cache.aget(key)
+    if snapshot is None:
+        snapshot = await abuild_snapshot(user)
+        await cache.aset(key, snapshot, settings.CART_SNAPSHOT_TIMEOUT)
+    return snapshot if snapshot['id'] else None
+
+
+def _snapshot_key(user, version):
+    return 'cart:snapshot:%s:%s' % (user.id, version)
+
+
+def get_item_count(user):
+    """ Number of items of the active cart of the user, for the badge
+
+    Reads Cart.item_count through the cache with the version of the
+    snapshot, so it is discarded by the same invalidate(), and counts the
+    cached snapshot instead when there is one.
+    :param user: User instance
+    :return: int
+    """
+
+    version = get_cache_version(_version_key(user.id))
+    key = _count_key(user, version)
+    snapshot_key = _snapshot_key(user, version)
+    cached = cache.get_many([key, snapshot_key])
+    count = _cached_count(cached, key, snapshot_key)
+    if count is None:
+        count = (Cart.objects.filter(user=user, active=True)
+                 .values_list('item_count', flat=True).first()) or 0
+        cache.set(key, count, settings.CART_SNAPSHOT_TIMEOUT)
+    return count
+
+
+async def aget_item_count(user):
+    """ Async version of get_item_count """
+
+    version = await aget_cache_version(_version_key(user.id))
+    key = _count_key(user, version)
+    snapshot_key = _snapshot_key(user, version)
+    cached = await cache.aget_many([key, snapshot_key])
+    count = _cached_count(cached, key, snapshot_key)
+    if count is None:
+        count = (await Cart.objects.filter(user=user, active=True)
+                 .values_list('item_count', flat=True).afirst()) or 0
+        await cache.aset(key, count, settings.CART_SNAPSHOT_TIMEOUT)
+    return count
+
+
+def _cached_count(cached, count_key, snapshot_key):
+    if count_key in cached:
+        return cached[count_key]
+    if snapshot_key in cached:
+        return len(cached[snapshot_key]['items'])
+    return None
+
+
+def _count_key(user, version):
+    return 'cart:count:%s:%s' % (user.id, version)
+
+
+def invalidate(user):
+    """ Discard the cached cart of the user after changing it
+
+    :param user: User instance
+    """
+
+    bump_cache_version(_version_key(user.id))
+
+
+def invalidate_many(user_ids):
+    """ Discard the cached carts of many users, see invalidate
+
+    :param user_ids: list of ids of User
+    """
+
+    for user_id in user_ids:
+        bump_cache_version(_version_key(user_id))
+
+
+async def ainvalidate(user):
+    """ Async version of invalidate """
+
+    await abump_cache_version(_version_key(user.id))
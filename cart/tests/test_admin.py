@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from cart.admin import EstimatedCountPaginator
+from cart.models import Item, Cart, CartLine
+
+
+class AdminTest(TestCase):
+    """ Test the admin of items and carts scales with the tables
+
+    1.- The changelists run the same queries for any number of rows
+    2.- Large unfiltered tables are counted from an estimate
+    3.- Items are searched with the index and filtered
+    4.- Carts are filtered by active and searched by username
+    5.- The lines of a cart are listed with their items and added
+    """
+
+    fixtures = ['cart/fixtures/item.json', 'cart/fixtures/user.json', ]
+
+    def setUp(self):
+        self.client.login(username='admin', password='shop_1234')
+        self.user = User.objects.get(username='norma')
+
+    def create_carts(self, count):
+        users = User.objects.bulk_create([
+            User(username='admin_test%d' % number)
+            for number in range(User.objects.count(),
+                                User.objects.count() + count)])
+        carts = Cart.objects.bulk_create([Cart(user=user) for user in users])
+        item = Item.objects.first()
+        CartLine.objects.bulk_create([CartLine(cart=cart, item=item,
+                                               price=item.price)
+                                      for cart in carts])
+
+    def count_queries(self, url, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_queries(self):
+        """ The changelists run the same queries for any number of rows - 1 """
+
+        for name in ('admin:cart_cart_changelist',
+                     'admin:cart_item_changelist'):
+            self.create_carts(3)
+            few = self.count_queries(reverse(name))
+            self.create_carts(30)
+            Item.objects.bulk_create([
+                Item(name='Curso %d' % number, category='des', level='b',
+                     price=10) for number in range(30)])
+            self.assertEqual(self.count_queries(reverse(name)), few)
+
+    def test_estimated_count(self):
+        """ Large unfiltered tables are counted from an estimate - 2 """
+
+        class SmallPaginator(EstimatedCountPaginator):
+            ESTIMATE_THRESHOLD = 2
+            MAX_COUNT = 3
+
+        last = Item.objects.order_by('id').last()
+        Item.objects.exclude(id=last.id).order_by('id')[:1].get().delete()
+        count = Item.objects.count()
+
+        paginator = SmallPaginator(Item.objects.order_by('-id'), 2)
+        # SQLite estimates with the last rowid, deleted rows included
+        if connection.vendor == 'sqlite':
+            self.assertEqual(paginator.count, last.id)
+        self.assertNotEqual(paginator.count, 0)
+
+        filtered = SmallPaginator(Item.objects.filter(id__lte=last.id), 2)
+        self.assertEqual(filtered.count, min(count, 3))
+
+        exact = EstimatedCountPaginator(Item.objects.order_by('-id'), 2)
+        self.assertEqual(exact.count, count)
+
+    def test_items(self):
+        """ Items are searched with the index and filtered - 3 """
+
+        item = Item.objects.get(id=1)
+        url = reverse('admin:cart_item_changelist')
+
+        response = self.client.get(url, {'q': item.name.split()[0]})
+        self.assertIn(item, response.context['cl'].result_list)
+        response = self.client.get(url, {'q': 'zzzz'})
+        self.assertEqual(list(response.context['cl'].result_list), [])
+
+        response = self.client.get(url, {'category': item.category,
+                                         'level': item.level})
+        results = list(response.context['cl'].result_list)
+        self.assertIn(item, results)
+        self.assertEqual({(result.category, result.level)
+                          for result in results},
+                         {(item.category, item.level)})
+
+    def test_carts(self):
+        """ Carts are filtered by active and searched by username - 4 """
+
+        active = Cart.objects.create(user=self.user)
+        closed = Cart.objects.create(user=self.user, active=False)
+        url = reverse('admin:cart_cart_changelist')
+
+        response = self.client.get(url, {'active__exact': '0'})
+        self.assertEqual(list(response.context['cl'].result_list), [closed])
+        response = self.client.get(url, {'q': 'norma'})
+        self.assertEqual(list(response.context['cl'].result_list),
+                         [closed, active])
+        response = self.client.get(url, {'q': 'norm'})
+        self.assertEqual(list(response.context['cl'].result_list), [])
+
+    def test_cart_lines(self):
+        """ The lines of a cart are listed with their items and added - 5 """
+
+        cart = Cart.objects.create(user=self.user)
+        items = list(Item.objects.order_by('id'))
+        url = reverse('admin:cart_cart_change', args=[cart.id])
+
+        cart.add_item(items[0])
+        # The first request caches the content types
+        self.client.get(url)
+        few = self.count_queries(url)
+        for item in items[1:]:
+            cart.add_item(item)
+        self.assertEqual(self.count_queries(url), few)
+
+        response = self.client.get(url)
+        self.assertContains(response, items[-1].name)
+
+        cart.remove_item(items[-1])
+        lines = list(cart.lines.order_by('id'))
+        data = {
+            'user': self.user.id,
+            'date_created_0': '2018-02-07',
+            'date_created_1': '00:00:00',
+            'active': 'on',
+            'total': '0',
+            'lines-TOTAL_FORMS': len(lines),
+            'lines-INITIAL_FORMS': len(lines),
+            'lines-2-TOTAL_FORMS': 1,
+            'lines-2-INITIAL_FORMS': 0,
+            'lines-2-0-item': items[-1].id,
+            'lines-2-0-price': '5.00',
+            'lines-2-0-cart': cart.id,
+        }
+        for number, line in enumerate(lines):
+            data.update({
+                'lines-%d-id' % number: line.id,
+                'lines-%d-cart' % number: cart.id,
+                'lines-%d-price' % number: line.price,
+            })
+        data['lines-0-DELETE'] = 'on'
+
+        response = self.client.post(url, data)
+
+        self.assertEqual(response.status_code, 302)
+        cart.refresh_from_db()
+        self.assertEqual(set(cart.lines.values_list('item_id', flat=True)),
+                         {item.id for item in items[1:]})
+        self.assertEqual(cart.item_count, len(items) - 1)
+        self.assertEqual(cart.total, sum(line.price for line in lines[1:]) +
+                         5)
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from cart.models import Item, Cart
+
+
+@override_settings(ROOT_URLCONF='cart.async_urls')
+class AsyncViewsTest(TestCase):
+    """ Test the async versions of the cart endpoints
+
+    1.- Item list
+    2.- Add item to cart with user anonymous and user login
+    3.- Cart detail
+    4.- Remove item of the cart
+    """
+
+    fixtures = ['cart/fixtures/item.json', 'cart/fixtures/user.json', ]
+
+    def setUp(self):
+        cache.clear()
+
+    async def test_item_list(self):
+        """ Item list - 1 """
+
+        response = await self.async_client.get(reverse('item_list'),
+                                               {'category': 'an'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item.id for item in response.context['item_list']],
+                         [4])
+
+        response = await self.async_client.get(reverse('item_list'),
+                                               {'q': 'animación'})
+
+        self.assertEqual([item.id for item in response.context['item_list']],
+                         [4])
+
+    async def test_anonymous_add_item_cart(self):
+        """ Add item to cart with user anonymous - 2 """
+
+        await self.async_client.get(reverse('item_add',
+                                            kwargs={'item_id': 1}))
+        await self.async_client.get(reverse('item_add',
+                                            kwargs={'item_id': 2}))
+        response = await self.async_client.get(reverse('cart_detail'))
+
+        self.assertEqual([item.id for item in response.context['items']],
+                         [1, 2])
+
+    async def test_user_add_item_cart(self):
+        """ Add item to cart with user login - 2 """
+
+        user = await User.objects.aget(id=2)
+        await self.async_client.aforce_login(user)
+
+        await self.async_client.get(reverse('item_add',
+                                            kwargs={'item_id': 1}))
+        response = await self.async_client.get(reverse('cart_detail'))
+
+        cart = await Cart.objects.aget(user=user, active=True)
+        item = await Item.objects.aget(id=1)
+        self.assertEqual(cart.total, item.price)
+        self.assertEqual(len(response.context['items']), 1)
+        self.assertEqual(response.context['total'], item.price)
+
+    async def test_remove_item(self):
+        """ Remove item of the cart - 4 """
+
+        user = await User.objects.aget(id=2)
+        await self.async_client.aforce_login(user)
+        await self.async_client.get(reverse('item_add',
+                                            kwargs={'item_id': 1}))
+        await self.async_client.get(reverse('item_add',
+                                            kwargs={'item_id': 2}))
+
+        response = await self.async_client.get(
+            reverse('cart_remove_item', kwargs={'item_id': 1}), follow=True)
+
+        self.assertEqual([item['id'] for item in
+                          response.context['cart']['items']], [2])
+        self.assertEqual(response.context['cart']['total'],
+                         (await Item.objects.aget(id=2)).price)
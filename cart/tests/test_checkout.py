@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import time
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from cart import checkout
+from cart.models import Item, Cart, CartConflict, CourseAccess, Order
+
+
+class FlakyGateway(checkout.LocalGateway):
+    """ Gateway that fails the first authorization """
+
+    calls = 0
+
+    def authorize(self, amount, idempotency_key):
+        FlakyGateway.calls += 1
+        if FlakyGateway.calls == 1:
+            raise IOError('Connection reset')
+        return super(FlakyGateway, self).authorize(amount, idempotency_key)
+
+
+class DecliningGateway(checkout.LocalGateway):
+
+    def authorize(self, amount, idempotency_key):
+        raise checkout.PaymentDeclined('Insufficient funds')
+
+
+class BrokenEmailBackend(BaseEmailBackend):
+
+    def send_messages(self, email_messages):
+        raise IOError('Connection refused')
+
+
+@override_settings(CHECKOUT_EAGER=True, CHECKOUT_RETRY_DELAY=0)
+class CheckoutTest(TestCase):
+    """ Test the checkout of a cart
+
+    1.- Pay the cart creates an order with frozen prices
+    2.- Fulfilment authorizes, grants access and sends the receipt
+    3.- Paying twice returns the same order
+    4.- Errors are retried
+    5.- Declined payments fail the order
+    6.- A cart changed since it was read is not paid
+    7.- Errors after the payment keep the order authorized until resumed
+    """
+
+    fixtures = ['cart/fixtures/item.json', 'cart/fixtures/user.json', ]
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.get(id=2)
+        self.cart = Cart.objects.create(user=self.user)
+        self.cart.add_item(Item.objects.get(id=1))
+        self.cart.add_item(Item.objects.get(id=2))
+
+    def test_pay_cart(self):
+        """ Pay the cart creates an order with frozen prices - 1 """
+
+        # The order takes the prices stored in the cart
+        Item.objects.filter(id=2).update(price=50)
+        self.client.login(username='norma', password='n_123456')
+
+        response = self.client.get(reverse('cart_pay_method'))
+
+        order = Order.objects.get(user=self.user)
+        self.assertRedirects(response, reverse('order_detail',
+                                               kwargs={'order_id': order.id}))
+        self.assertFalse(Cart.objects.get(id=self.cart.id).active)
+        self.assertEqual(order.total, self.cart.total)
+
+        Item.objects.filter(id=1).update(price=99)
+        self.assertEqual(sorted(order.lines.values_list('price', flat=True)),
+                         [12, 29])
+
+        status = self.client.get(reverse('order_status',
+                                         kwargs={'order_id': order.id}))
+        self.assertEqual(status.json()['status'], 'c')
+
+    def test_fulfilment(self):
+        """ Fulfilment authorizes, grants access and sends receipt - 2 """
+
+        order = checkout.place_order(self.cart)
+        checkout.process_order(order.id)
+
+        order = Order.objects.get(id=order.id)
+        self.assertEqual(order.status, Order.Status.get_value('completed'))
+        self.assertTrue(order.payment_reference.startswith('local-'))
+        self.assertEqual(CourseAccess.objects.filter(user=self.user).count(),
+                         2)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, [self.user.email])
+
+    def test_idempotent(self):
+        """ Paying twice returns the same order - 3 """
+
+        order = checkout.place_order(self.cart)
+        checkout.process_order(order.id)
+        Order.objects.filter(id=order.id).update(
+            status=Order.Status.get_value('pending'))
+
+        self.assertEqual(checkout.place_order(self.cart), order)
+        checkout.process_order(order.id)
+        self.assertEqual(order.lines.count(), 2)
+        self.assertEqual(CourseAccess.objects.filter(user=self.user).count(),
+                         2)
+        self.assertEqual(len(mail.outbox), 1)
+
+    @override_settings(
+        CHECKOUT_PAYMENT_GATEWAY='cart.tests.test_checkout.FlakyGateway')
+    def test_retry(self):
+        """ Errors are retried - 4 """
+
+        FlakyGateway.calls = 0
+        order = checkout.place_order(self.cart)
+        with self.assertLogs('cart.checkout', 'ERROR'):
+            checkout.process_order(order.id)
+
+        self.assertEqual(FlakyGateway.calls, 2)
+        self.assertEqual(Order.objects.get(id=order.id).status,
+                         Order.Status.get_value('completed'))
+
+    @override_settings(
+        CHECKOUT_PAYMENT_GATEWAY='cart.tests.test_checkout.DecliningGateway')
+    def test_declined(self):
+        """ Declined payments fail the order - 5 """
+
+        order = checkout.place_order(self.cart)
+        checkout.process_order(order.id)
+
+        order = Order.objects.get(id=order.id)
+        self.assertEqual(order.status, Order.Status.get_value('failed'))
+        self.assertFalse(CourseAccess.objects.exists())
+
+    def test_changed_cart(self):
+        """ A cart changed since it was read is not paid - 6 """
+
+        stale = Cart.objects.get(id=self.cart.id)
+        self.cart.add_item(Item.objects.get(id=3))
+
+        with self.assertRaises(CartConflict):
+            checkout.place_order(stale)
+        self.assertFalse(Order.objects.exists())
+        self.assertTrue(Cart.objects.get(id=self.cart.id).active)
+
+        order = checkout.place_order(Cart.objects.get(id=self.cart.id))
+        self.assertEqual(order.lines.count(), 3)
+        self.assertEqual(order.total,
+                         sum(order.lines.values_list('price', flat=True)))
+        self.assertEqual(order.total, self.cart.total)
+
+    def test_resume(self):
+        """ Errors after the payment keep the order authorized until
+        resumed - 7 """
+
+        order = checkout.place_order(self.cart)
+        with override_settings(
+                EMAIL_BACKEND='cart.tests.test_checkout.BrokenEmailBackend'):
+            with self.assertLogs('cart.checkout', 'ERROR'):
+                checkout.process_order(order.id)
+
+        order = Order.objects.get(id=order.id)
+        self.assertEqual(order.status, Order.Status.get_value('authorized'))
+        self.assertIn('Connection refused', order.error)
+        self.assertTrue(order.access_granted)
+
+        output = StringIO()
+        call_command('resume_orders', min_age=60, stdout=output)
+        self.assertIn('0 orders resumed', output.getvalue())
+
+        call_command('resume_orders', min_age=0, stdout=output)
+        order = Order.objects.get(id=order.id)
+        self.assertEqual(order.status, Order.Status.get_value('completed'))
+        self.assertEqual(order.error, '')
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('1 orders resumed: 1 completed', output.getvalue())
+
+
+@override_settings(CHECKOUT_EAGER=False)
+class CheckoutWorkerTest(TransactionTestCase):
+    """ Test orders are fulfilled by the worker pool """
+
+    fixtures = ['cart/fixtures/item.json', 'cart/fixtures/user.json', ]
+
+    def test_worker(self):
+        cache.clear()
+        user = User.objects.get(id=2)
+        cart = Cart.objects.create(user=user)
+        cart.add_item(Item.objects.get(id=1))
+
+        order = checkout.place_order(cart)
+        checkout.enqueue(order)
+
+        deadline = time.time() + 10
+        while not Order.objects.get(id=order.id).is_finished:
+            self.assertLess(time.time(), deadline)
+            time.sleep(0.05)
+        self.assertEqual(Order.objects.get(id=order.id).status,
+                         Order.Status.get_value('completed'))
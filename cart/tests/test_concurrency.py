@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import threading
+
+from django.contrib.auth.models import User
+from django.db import connection, connections
+from django.db.models import Count, Sum
+from django.test import TransactionTestCase, override_settings
+
+from cart import services
+from cart.models import Cart, CartConflict, Item
+
+THREADS = 8
+ROUNDS = 5
+
+
+@override_settings(CART_MAX_RETRIES=50)
+class CartConcurrencyTest(TransactionTestCase):
+    """ Stress the mutations of one cart from many threads
+
+    1.- Concurrent additions of different items are all kept
+    2.- Concurrent additions and removals of the same items
+    3.- A conflict is retried until the version matches
+    """
+
+    fixtures = ['cart/fixtures/user.json', 'cart/fixtures/item.json']
+
+    def setUp(self):
+        self.user = User.objects.get(username='norma')
+        self.items = list(Item.objects.order_by('id'))
+        self.cart = Cart.objects.create(user=self.user)
+
+    def run_threads(self, target):
+        """ Start THREADS threads together and collect their errors """
+
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            # The connections of an in-memory database share its cache and
+            # lock whole tables, even to read
+            self.skipTest('Needs a database file or server, e.g. '
+                          'DJANGO_TEST_DATABASE=test_db.sqlite3')
+        barrier = threading.Barrier(THREADS)
+        errors = []
+
+        def run(number):
+            try:
+                barrier.wait()
+                target(number)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=run, args=(number,))
+                   for number in range(THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def assertConsistent(self):
+        cart = Cart.objects.annotate(lines_total=Sum('lines__price'),
+                                     lines_count=Count('lines')).get()
+        self.assertEqual(cart.total, cart.lines_total or 0)
+        self.assertEqual(cart.item_count, cart.lines_count)
+        return cart
+
+    def test_concurrent_additions(self):
+        """ Concurrent additions of different items are all kept - 1 """
+
+        extra = Item.objects.bulk_create([
+            Item(name='Curso %d' % number, category='des', level='b',
+                 price=number + 1)
+            for number in range(THREADS * ROUNDS)])
+
+        def add(number):
+            cart = Cart.objects.get(pk=self.cart.pk)
+            for item in extra[number::THREADS]:
+                self.assertTrue(cart.add_item(item))
+
+        self.run_threads(add)
+
+        cart = self.assertConsistent()
+        self.assertEqual(cart.item_count, len(extra))
+        self.assertEqual(cart.total, sum(item.price for item in extra))
+        self.assertEqual(cart.version, len(extra))
+
+    def test_same_items(self):
+        """ Concurrent additions and removals of the same items - 2 """
+
+        def toggle(number):
+            cart = Cart.objects.get(pk=self.cart.pk)
+            for round_number in range(ROUNDS):
+                for item in self.items:
+                    if (number + round_number) % 2:
+                        cart.add_item(item)
+                    else:
+                        cart.remove_item(item)
+            # Every thread ends adding all the items
+            services.apply_cart_operations(
+                self.user, [('add', item.id) for item in self.items])
+
+        self.run_threads(toggle)
+
+        cart = self.assertConsistent()
+        self.assertEqual(cart.item_count, len(self.items))
+        self.assertEqual(cart.total, sum(item.price for item in self.items))
+
+    def test_retry(self):
+        """ A conflict is retried until the version matches - 3 """
+
+        stale = Cart.objects.get(pk=self.cart.pk)
+        self.cart.add_item(self.items[0])
+
+        # The stale copy reads the cart again and keeps both lines
+        self.assertTrue(stale.add_item(self.items[1]))
+        self.assertEqual(stale.version, 2)
+        self.assertEqual(stale.total, self.items[0].price +
+                         self.items[1].price)
+        self.assertConsistent()
+
+        with override_settings(CART_MAX_RETRIES=1):
+            stale = Cart.objects.get(pk=self.cart.pk)
+            self.cart.refresh_from_db()
+            self.cart.remove_item(self.items[0])
+            with self.assertRaises(CartConflict):
+                stale.add_item(self.items[2])
+        self.assertFalse(self.cart.lines.filter(item=self.items[2]).exists())
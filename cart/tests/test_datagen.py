@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import random
+from io import StringIO
+
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.models import Count, Sum
+from django.test import TestCase
+
+from cart import datagen, search
+from cart.models import Cart, CartLine, Item
+from cart.session import SessionCart
+
+
+class GenerateDataTest(TestCase):
+    """ Test the generate_data command
+
+    1.- The same seed generates the same data
+    2.- Carts, lines and sessions are consistent
+    3.- Size distributions of the carts
+    """
+
+    fixtures = ['cart/fixtures/item.json', ]
+
+    def generate(self, **options):
+        options.setdefault('stdout', StringIO())
+        call_command('generate_data', items=300, users=100, sessions=50,
+                     workers=1, batch_size=40, **options)
+
+    def snapshot(self, first_item, first_user):
+        """ Rows created by a run, without the ids """
+
+        items = list(Item.objects.filter(id__gte=first_item).order_by('id')
+                     .values_list('name', 'category', 'level', 'price'))
+        carts = [(cart.user_id - first_user, cart.total, cart.item_count,
+                  [line.item_id for line in cart.lines.order_by('item_id')])
+                 for cart in Cart.objects.filter(user_id__gte=first_user)
+                 .order_by('user_id')]
+        sessions = sorted((session.session_key,
+                           session.get_decoded()['count_items'])
+                          for session in Session.objects.all())
+        return items, carts, sessions
+
+    def clear(self, first_item, first_user):
+        Session.objects.all().delete()
+        Cart.objects.filter(user_id__gte=first_user).delete()
+        User.objects.filter(id__gte=first_user).delete()
+        Item.objects.filter(id__gte=first_item).delete()
+
+    def test_deterministic(self):
+        """ The same seed generates the same data - 1 """
+
+        first_item = Item.objects.order_by('-id').first().id + 1
+        first_user = (User.objects.order_by('-id').first() or
+                      User(id=0)).id + 1
+
+        self.generate(seed=7)
+        first = self.snapshot(first_item, first_user)
+        self.clear(first_item, first_user)
+        self.generate(seed=7)
+        second = self.snapshot(first_item, first_user)
+        self.clear(first_item, first_user)
+        self.generate(seed=8)
+        other = self.snapshot(first_item, first_user)
+
+        self.assertEqual(len(first[0]), 300)
+        self.assertEqual(first, second)
+        self.assertNotEqual(first[0], other[0])
+
+    def test_consistent(self):
+        """ Carts, lines and sessions are consistent - 2 """
+
+        self.generate(password='secret_1234')
+
+        self.assertEqual(User.objects.filter(
+            username__startswith=datagen.USER_PREFIX).count(), 100)
+        username = User.objects.filter(
+            username__startswith=datagen.USER_PREFIX).first().username
+        self.assertIsNotNone(authenticate(username=username,
+                                          password='secret_1234'))
+
+        carts = Cart.objects.annotate(lines_total=Sum('lines__price'),
+                                      lines_count=Count('lines'))
+        self.assertTrue(carts.exists())
+        for cart in carts:
+            self.assertTrue(cart.active)
+            self.assertEqual(cart.total, cart.lines_total or 0)
+            self.assertEqual(cart.item_count, cart.lines_count)
+            for line in cart.lines.all():
+                self.assertGreaterEqual(line.date_added, cart.date_created)
+        self.assertFalse(CartLine.objects.exclude(
+            cart__user__username__startswith=datagen.USER_PREFIX).exists())
+
+        self.assertEqual(Session.objects.count(), 50)
+        for session in Session.objects.all()[:10]:
+            cart = SessionCart(session.get_decoded())
+            items, total = cart.resolve()
+            self.assertEqual(len(items), len(cart))
+            self.assertGreater(len(cart), 0)
+
+        # The new items are searchable
+        name = Item.objects.order_by('-id').first().name
+        self.assertIn(name, [item.name for item in
+                             search.search(name, page_size=50)['items']])
+
+    def test_cart_size(self):
+        """ Size distributions of the carts - 3 """
+
+        generator = random.Random(0)
+        sizes = [datagen.SizeDistribution('geometric:4').sample(generator)
+                 for _ in range(2000)]
+        self.assertAlmostEqual(sum(sizes) / 2000.0, 4, delta=0.5)
+        self.assertEqual(min(sizes), 1)
+        self.assertEqual(
+            {datagen.SizeDistribution('uniform:2:3').sample(generator)
+             for _ in range(100)}, {2, 3})
+        self.assertEqual(
+            datagen.SizeDistribution('fixed:2000', 1000).sample(generator),
+            1000)
+
+        self.generate(cart_size='fixed:2', cart_ratio=1)
+        self.assertEqual(set(Cart.objects.values_list('item_count',
+                                                      flat=True)), {2})
+        with self.assertRaises(CommandError):
+            self.generate(cart_size='normal:3')
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from cart.images import available_formats
+from cart.models import Item
+
+
+def png(width, height):
+    """ Content of a transparent PNG image """
+
+    buffer = BytesIO()
+    Image.new('RGBA', (width, height), (255, 0, 0, 128)).save(buffer, 'PNG')
+    return ContentFile(buffer.getvalue())
+
+
+class RenditionTest(TestCase):
+    """ Test the renditions of the item images
+
+    1.- Renditions are created when an item is saved
+    2.- Items without renditions fall back to the original image
+    3.- The command backfills existing items
+    4.- The command reports the images it cannot render
+    5.- Saving an item whose file is not an image keeps the item
+    """
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.media_root)
+
+    def create_item(self):
+        item = Item(name='Blender', category='des', level='b', price=12)
+        item.image.save('blender.png', png(1000, 500), save=False)
+        item.save()
+        return item
+
+    def test_save_item(self):
+        """ Renditions are created when an item is saved - 1 """
+
+        item = Item.objects.get(id=self.create_item().id)
+
+        self.assertEqual(len(item.image_hash), 12)
+        self.assertIn(item.image_hash, item.thumbnail_url)
+        self.assertTrue(item.thumbnail_url.endswith('.80.jpg'))
+        self.assertTrue(item.card_url.endswith('.640.jpg'))
+
+        name = item.thumbnail_url[len('/media/'):]
+        with item.image.storage.open(name) as rendition:
+            self.assertEqual(Image.open(rendition).size, (80, 40))
+        if 'webp' in [fmt[0] for fmt in available_formats()]:
+            self.assertTrue(item.thumbnail_webp_url.endswith('.80.webp'))
+        else:
+            self.assertEqual(item.thumbnail_webp_url, '')
+
+    def test_fallback(self):
+        """ Items without renditions fall back to the original image - 2 """
+
+        item = Item(name='Blender', image='items/blender.png')
+
+        self.assertEqual(item.thumbnail_url, '/media/items/blender.png')
+        self.assertEqual(item.card_webp_url, '')
+
+    def test_command(self):
+        """ The command backfills existing items - 3 """
+
+        item = self.create_item()
+        Item.objects.filter(id=item.id).update(image_hash='',
+                                               image_formats='')
+
+        call_command('generate_renditions', workers=1, stdout=StringIO())
+
+        self.assertEqual(Item.objects.get(id=item.id).image_hash,
+                         item.image_hash)
+
+    def test_command_failure(self):
+        """ The command reports the images it cannot render - 4 """
+
+        item = self.create_item()
+        Item.objects.filter(id=item.id).update(image_hash='',
+                                               image_formats='')
+        broken = Item.objects.create(name='Roto', category='des', level='b',
+                                     price=12, image='items/roto.png')
+        default_storage.save('items/roto.png', ContentFile(b'not an image'))
+        output, errors = StringIO(), StringIO()
+
+        call_command('generate_renditions', workers=2, stdout=output,
+                     stderr=errors)
+
+        self.assertEqual(Item.objects.get(id=item.id).image_hash,
+                         item.image_hash)
+        self.assertEqual(Item.objects.get(id=broken.id).image_hash, '')
+        self.assertIn('1 items processed, 1 failed', output.getvalue())
+        self.assertIn('%s items/roto.png' % broken.id, errors.getvalue())
+
+    def test_save_not_image(self):
+        """ Saving an item whose file is not an image keeps the item - 5 """
+
+        item = Item(name='Roto', category='des', level='b', price=12)
+        item.image.save('roto.png', ContentFile(b'not an image'), save=False)
+
+        with self.assertLogs('cart.images', 'ERROR'):
+            item.save()
+
+        item = Item.objects.get(id=item.id)
+        self.assertEqual((item.image_hash, item.image_formats), ('', ''))
+        self.assertEqual(item.thumbnail_url, item.image.url)
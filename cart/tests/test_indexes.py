@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from unittest import skipUnless
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction, IntegrityError
+from django.test import TestCase
+
+from cart import catalogue
+from cart.models import Item, Cart
+
+
+def explain(queryset):
+    """ Return the query plan of a queryset as a single string """
+
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        else:
+            # Small test tables are always cheaper to scan sequentially
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('EXPLAIN ' + sql, params)
+        return '\n'.join(str(row) for row in cursor.fetchall())
+
+
+@skipUnless(connection.vendor in ('sqlite', 'postgresql'),
+            'Query plans are only checked on SQLite and PostgreSQL')
+class QueryPlanTest(TestCase):
+    """ Test the hot queries use their indexes
+
+    1.- Active cart of the user
+    2.- Catalogue filtered by category and level
+    3.- Catalogue ordered by name
+    4.- Only one active cart per user
+    5.- Filters of the admin ordered by id
+    """
+
+    fixtures = ['cart/fixtures/item.json', 'cart/fixtures/user.json', ]
+
+    def setUp(self):
+        self.user = User.objects.get(id=2)
+
+    def test_active_cart(self):
+        """ Active cart of the user - 1 """
+
+        plan = explain(Cart.objects.filter(user=self.user, active=True))
+
+        self.assertRegex(plan,
+                         'cart_user_active_idx|cart_one_active_per_user')
+
+    def test_catalogue_filter(self):
+        """ Catalogue filtered by category and level - 2 """
+
+        plan = explain(catalogue.page_queryset(category='des', level='a'))
+
+        self.assertIn('item_cat_level_name_idx', plan)
+
+    def test_catalogue_order(self):
+        """ Catalogue ordered by name - 3 """
+
+        item = Item.objects.get(id=1)
+        plan = explain(catalogue.page_queryset(after=(item.name, item.id))
+                       [:catalogue.PAGE_SIZE + 1])
+
+        self.assertIn('item_name_id_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_one_active_cart(self):
+        """ Only one active cart per user - 4 """
+
+        Cart.objects.create(user=self.user)
+        Cart.objects.create(user=self.user, active=False)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Cart.objects.create(user=self.user)
+
+    def test_admin_filters(self):
+        """ Filters of the admin ordered by id - 5 """
+
+        plan = explain(Cart.objects.filter(active=True).order_by('-id'))
+        self.assertIn('cart_active_id_idx', plan)
+        plan = explain(Cart.objects.filter(active=False).order_by('-id'))
+        self.assertIn('cart_inactive_id_idx', plan)
+
+        plan = explain(Item.objects.filter(level='a').order_by('-id'))
+        self.assertIn('item_level_id_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from cart.models import Item
+
+
+class ItemImportExportTest(TestCase):
+    """ Test the import_items and export_items commands
+
+    1.- Export and import back, CSV and JSONL
+    2.- Invalid rows are skipped
+    3.- Rows with an existing id update the item
+    4.- JSON arrays are refused by their extension
+    """
+
+    fixtures = ['cart/fixtures/item.json', ]
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def path(self, name, content=None):
+        path = os.path.join(self.directory.name, name)
+        if content is not None:
+            with open(path, 'w', encoding='utf-8') as stream:
+                stream.write(content)
+        return path
+
+    def call(self, command, *args, **options):
+        stdout, stderr = StringIO(), StringIO()
+        call_command(command, *args, stdout=stdout, stderr=stderr, **options)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_round_trip(self):
+        """ Export and import back, CSV and JSONL - 1 """
+
+        items = list(Item.objects.order_by('id').values_list(
+            'name', 'category', 'level', 'price', 'image'))
+
+        for name in ('items.csv', 'items.jsonl'):
+            path = self.path(name)
+            self.call('export_items', path, batch_size=3)
+            Item.objects.all().delete()
+
+            stdout, stderr = self.call('import_items', path, batch_size=3)
+
+            self.assertIn('4 created, 0 updated, 0 skipped', stdout)
+            self.assertEqual(list(Item.objects.order_by('id').values_list(
+                'name', 'category', 'level', 'price', 'image')), items)
+
+        # The sequence continues after the imported ids
+        self.assertEqual(Item.objects.create(
+            name='Nuevo', category='des', level='b', price=1).id, 5)
+
+    def test_invalid_rows(self):
+        """ Invalid rows are skipped - 2 """
+
+        path = self.path('items.csv', (
+            'name,category,level,price\n'
+            'Blender avanzado,design,avanced,10\n'
+            'Sin categoria,xx,b,10\n'
+            'Precio,des,b,abc\n'
+            ',des,b,10\n'))
+
+        stdout, stderr = self.call('import_items', path)
+
+        self.assertIn('1 created, 0 updated, 3 skipped', stdout)
+        self.assertIn('Line 3:', stderr)
+        self.assertIn('Line 5:', stderr)
+        item = Item.objects.get(name='Blender avanzado')
+        self.assertEqual((item.category, item.level), ('des', 'a'))
+
+    def test_update(self):
+        """ Rows with an existing id update the item - 3 """
+
+        path = self.path('items.jsonl', (
+            '{"id": 1, "name": "Illustrator", "category": "des", '
+            '"level": "b", "price": "9.50"}\n'
+            'not json\n'))
+
+        stdout, stderr = self.call('import_items', path)
+
+        self.assertIn('0 created, 1 updated, 1 skipped', stdout)
+        self.assertEqual(Item.objects.count(), 4)
+        self.assertEqual(Item.objects.get(id=1).name, 'Illustrator')
+
+    def test_json_array(self):
+        """ JSON arrays are refused by their extension - 4 """
+
+        path = self.path('items.json', '[{"name": "Blender"}]')
+
+        for command in ('import_items', 'export_items'):
+            with self.assertRaisesMessage(CommandError, '.jsonl'):
+                self.call(command, path)
+        self.assertEqual(Item.objects.count(), 4)
+        with open(path, encoding='utf-8') as stream:
+            self.assertEqual(stream.read(), '[{"name": "Blender"}]')
+
+        stdout, stderr = self.call('import_items', self.path(
+            'items.ndjson', '{"name": "Blender", "category": "des", '
+                            '"level": "b", "price": "9"}\n'))
+        self.assertIn('1 created', stdout)
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import tempfile
+
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections
+from django.test import TestCase, override_settings
+
+from cart import loadtest
+from cart.models import Item, Order
+
+
+@override_settings(MEDIA_ROOT=tempfile.gettempdir(),
+                   ALLOWED_HOSTS=['localhost'])
+class LoadTestTest(TestCase):
+    """ Test the scenarios of the load test
+
+    1.- The seeded users can log in and are not created twice
+    2.- Scenarios of guests
+    3.- A buyer logs in, the session cart is merged and paid
+    4.- Stats by url name
+    """
+
+    fixtures = ['cart/fixtures/item.json', ]
+
+    def setUp(self):
+        cache.clear()
+        # Like the test client, keep the connection of the test transaction
+        # open across requests
+        for signal in (request_started, request_finished):
+            signal.disconnect(close_old_connections)
+            self.addCleanup(signal.connect, close_old_connections)
+        self.stats = loadtest.Stats()
+        self.browser = loadtest.Browser(
+            loadtest.WSGITransport(WSGIHandler()), self.stats)
+        item_ids = list(Item.objects.values_list('id', flat=True))
+        self.context = loadtest.Context(0, 1, item_ids, ['loadtest0'],
+                                        loadtest.PASSWORD, 0, 0)
+
+    def test_seed_users(self):
+        """ The seeded users can log in and are not created twice - 1 """
+
+        self.assertEqual(loadtest.seed_users(3), 3)
+        self.assertEqual(loadtest.seed_users(5), 2)
+
+        self.assertEqual(User.objects.filter(
+            username__startswith=loadtest.USER_PREFIX).count(), 5)
+        self.assertIsNotNone(authenticate(username='loadtest4',
+                                          password=loadtest.PASSWORD))
+
+    def test_guests(self):
+        """ Scenarios of guests - 2 """
+
+        loadtest.browse(self.browser, self.context)
+        loadtest.shop(self.browser, self.context)
+
+        self.assertEqual(sorted(self.stats.latencies), [
+            'cart_detail', 'cart_remove_item', 'item_add', 'item_list'])
+        self.assertEqual(sum(self.stats.errors.values()), 0)
+        self.assertIn('sessionid', self.browser.cookies)
+
+    def test_buy(self):
+        """ A buyer logs in, the session cart is merged and paid - 3 """
+
+        loadtest.seed_users(1)
+
+        loadtest.buy(self.browser, self.context)
+
+        self.assertEqual(sum(self.stats.errors.values()), 0)
+        self.assertIn('login', self.stats.latencies)
+        self.assertIn('cart_pay_method', self.stats.latencies)
+        order = Order.objects.get(user__username='loadtest0')
+        self.assertTrue(order.lines.exists())
+        # Logged out at the end
+        self.assertNotIn('sessionid', self.browser.cookies)
+
+    def test_stats(self):
+        """ Stats by url name - 4 """
+
+        for milliseconds in range(1, 101):
+            self.stats.record('item_list', 200, milliseconds / 1000.0)
+        self.stats.record('item_add', 500, 0.5, True)
+        self.stats.record('item_add', None, 0.1)
+
+        rows = {row['url_name']: row for row in self.stats.summary(2)}
+        self.assertEqual(rows['item_list']['requests'], 100)
+        self.assertEqual(rows['item_list']['throughput'], 50)
+        self.assertAlmostEqual(rows['item_list']['p95'], 95)
+        self.assertEqual(rows['item_list']['errors'], 0)
+        self.assertEqual(rows['item_add']['errors'], 2)
+        self.assertEqual(rows['item_add']['error_rate'], 1)
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from cart import middleware
+
+
+class PerformanceMiddlewareTest(TestCase):
+    """ Test the measures of PerformanceMiddleware
+
+    1.- Sampled requests send a Server-Timing header
+    2.- Measures are grouped by url name
+    3.- Requests out of the sample are not measured
+    """
+
+    fixtures = ['cart/fixtures/item.json', 'cart/fixtures/user.json', ]
+
+    def setUp(self):
+        middleware.reset_stats()
+
+    @override_settings(PERFORMANCE_SAMPLE_RATE=1)
+    def test_server_timing(self):
+        """ Sampled requests send a Server-Timing header - 1 """
+
+        session = self.client.session
+        session['cart'] = '{"items":[1]}'
+        session.save()
+
+        response = self.client.get(reverse('cart_detail'))
+
+        timing = response['Server-Timing']
+        for metric in ('total;dur=', 'sql;dur=', 'template;dur=',
+                       'session;dur='):
+            self.assertIn(metric, timing)
+        self.assertIn('3 queries', timing)
+
+    @override_settings(PERFORMANCE_SAMPLE_RATE=1)
+    def test_stats(self):
+        """ Measures are grouped by url name - 2 """
+
+        self.client.get(reverse('item_list'))
+        self.client.get(reverse('item_list'))
+        self.client.get(reverse('cart_detail'))
+
+        stats = middleware.get_stats()
+        self.assertEqual(stats['item_list']['requests'], 2)
+        self.assertEqual(stats['cart_detail']['requests'], 1)
+        self.assertGreater(stats['item_list']['template_ms'], 0)
+
+        User.objects.filter(id=1).update(is_staff=True)
+        self.client.login(username='admin', password='shop_1234')
+        response = self.client.get(reverse('performance_stats'))
+        self.assertIn('item_list', response.json())
+
+    @override_settings(PERFORMANCE_SAMPLE_RATE=0)
+    def test_not_sampled(self):
+        """ Requests out of the sample are not measured - 3 """
+
+        response = self.client.get(reverse('item_list'))
+
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(middleware.get_stats(), {})
@@ -1,11 +1,19 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from django.test import TestCase
+import tempfile
+from io import StringIO
 
-from cart.models import Item, Cart
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
 
+from cart import checkout, snapshot
+from cart.models import Item, Cart, CartConflict
 
+
+@override_settings(MEDIA_ROOT=tempfile.gettempdir())
 class ItemTest(TestCase):
     """ Test for objects Item """
 
@@ -37,3 +45,162 @@ class ItemTest(TestCase):
         item.delete()
 
         self.assertEqual(Item.objects.count(), 0 )
+
+
+class CartTotalTest(TestCase):
+    """ Test the incremental total of the cart
+
+    1.- Add item increases the total
+    2.- Add an item already in the cart keeps the total
+    3.- Remove item decreases the total
+    4.- Reconcile drifted totals
+    5.- Price changes do not affect the cart
+    6.- A cart closed since it was read is not changed
+    """
+
+    fixtures = ['cart/fixtures/item.json', 'cart/fixtures/user.json', ]
+
+    def setUp(self):
+        self.cart = Cart.objects.create(user=User.objects.get(id=2))
+        self.item1 = Item.objects.get(id=1)
+        self.item2 = Item.objects.get(id=2)
+
+    def test_add_item(self):
+        """ Total increases with the price of the item - 1 """
+
+        self.assertTrue(self.cart.add_item(self.item1))
+        self.assertTrue(self.cart.add_item(self.item2))
+
+        self.assertEqual(self.cart.total, self.item1.price + self.item2.price)
+        self.assertEqual(Cart.objects.get(id=self.cart.id).total,
+                         self.cart.total)
+
+    def test_add_item_exist(self):
+        """ Adding an item twice does not change the total - 2 """
+
+        self.cart.add_item(self.item1)
+
+        self.assertFalse(self.cart.add_item(self.item1))
+        self.assertEqual(self.cart.items.count(), 1)
+        self.assertEqual(self.cart.total, self.item1.price)
+
+    def test_remove_item(self):
+        """ Total decreases with the price of the item - 3 """
+
+        self.cart.add_item(self.item1)
+        self.cart.add_item(self.item2)
+
+        self.assertTrue(self.cart.remove_item(self.item1))
+        self.assertFalse(self.cart.remove_item(self.item1))
+        self.assertEqual(self.cart.total, self.item2.price)
+
+    def test_reconcile_cart_totals(self):
+        """ The command repairs totals that drifted - 4 """
+
+        self.cart.items.add(self.item1, self.item2,
+                            through_defaults={'price': 10})
+        empty = Cart.objects.create(user=self.cart.user, active=False,
+                                    total=10, item_count=3)
+
+        call_command('reconcile_cart_totals', stdout=StringIO())
+
+        self.assertEqual(Cart.objects.get(id=self.cart.id).total, 20)
+        self.assertEqual(Cart.objects.get(id=empty.id).total, 0)
+        self.assertEqual(Cart.objects.get(id=empty.id).item_count, 0)
+
+    def test_price_change(self):
+        """ Price changes do not affect the cart - 5 """
+
+        self.cart.add_item(self.item1)
+        self.cart.add_item(self.item2)
+        price = self.item1.price
+        Item.objects.filter(id=self.item1.id).update(price=price + 100)
+
+        self.cart.set_total()
+        self.assertEqual(self.cart.total, price + self.item2.price)
+
+        self.assertTrue(self.cart.remove_item(Item.objects.get(id=1)))
+        self.assertEqual(self.cart.total, self.item2.price)
+        self.assertEqual(self.cart.lines.get().price, self.item2.price)
+
+    def test_closed_cart(self):
+        """ A cart closed since it was read is not changed - 6 """
+
+        self.cart.add_item(self.item1)
+        stale = Cart.objects.get(id=self.cart.id)
+        checkout.place_order(self.cart)
+
+        with self.assertRaises(CartConflict):
+            stale.add_item(self.item2)
+        self.assertFalse(stale.lines.filter(item=self.item2).exists())
+        self.assertEqual(Cart.objects.get(id=self.cart.id).total,
+                         self.item1.price)
+
+
+PRICE = {'price': 10}
+
+
+class ItemCountTest(TestCase):
+    """ Test the item count maintained by m2m_changed
+
+    1.- Add, remove and clear items of the cart
+    2.- Add, remove and clear carts of the item
+    3.- Delete an item, the cached cart is discarded
+    """
+
+    fixtures = ['cart/fixtures/item.json', 'cart/fixtures/user.json', ]
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.get(id=2)
+        self.cart = Cart.objects.create(user=self.user)
+        self.item1 = Item.objects.get(id=1)
+        self.item2 = Item.objects.get(id=2)
+
+    def item_count(self, cart):
+        return Cart.objects.get(id=cart.id).item_count
+
+    def test_forward(self):
+        """ Add, remove and clear items of the cart - 1 """
+
+        self.cart.items.add(self.item1, self.item2, through_defaults=PRICE)
+        self.cart.items.add(self.item1, through_defaults=PRICE)
+        self.assertEqual(self.item_count(self.cart), 2)
+
+        self.cart.items.remove(self.item1, Item.objects.get(id=3))
+        self.assertEqual(self.item_count(self.cart), 1)
+
+        self.cart.items.clear()
+        self.assertEqual(self.item_count(self.cart), 0)
+
+    def test_reverse(self):
+        """ Add, remove and clear carts of the item - 2 """
+
+        other = Cart.objects.create(user=self.user, active=False)
+        self.cart.items.add(self.item2, through_defaults=PRICE)
+        self.item1.cart_set.add(self.cart, other, through_defaults=PRICE)
+        self.assertEqual(self.item_count(self.cart), 2)
+        self.assertEqual(self.item_count(other), 1)
+
+        self.item1.cart_set.remove(other)
+        self.assertEqual(self.item_count(other), 0)
+
+        self.item1.cart_set.clear()
+        self.assertEqual(self.item_count(self.cart), 1)
+
+    def test_delete_item(self):
+        """ Delete an item, the cached cart is discarded - 3 """
+
+        self.cart.add_item(self.item1)
+        self.cart.add_item(self.item2)
+        self.assertEqual(self.cart.item_count, 2)
+        self.assertEqual(len(snapshot.get_snapshot(self.user)['items']), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item1.delete()
+        cart = Cart.objects.get(id=self.cart.id)
+        self.assertEqual(cart.item_count, 1)
+        self.assertEqual(cart.total, self.item2.price)
+        self.assertEqual(snapshot.get_snapshot(self.user)['items'][0]['id'],
+                         self.item2.id)
+        self.assertEqual(snapshot.get_item_count(self.user), 1)
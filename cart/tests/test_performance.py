@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+import os
+import time
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from cart import snapshot
+from cart.models import Item, Cart, CartLine
+from cart.utils import percentile
+
+# Set CART_PERF_REPORT to a file path to write the measurements as JSON
+REPORT_PATH = os.environ.get('CART_PERF_REPORT')
+# Set CART_PERF_LATENCY=1 to check the latency budgets too, they depend on
+# the machine and its load, so they are only measured by default
+CHECK_LATENCY = bool(os.environ.get('CART_PERF_LATENCY'))
+# Scale the latency budgets on slow machines, e.g. CART_PERF_SLOWDOWN=3
+SLOWDOWN = float(os.environ.get('CART_PERF_SLOWDOWN', 1))
+
+CART_SIZES = [1, 10, 100, 1000]
+RUNS = 5
+
+# Maximum number of queries (savepoints included) by url name and user, the
+# same for every cart size. The session is one query, read from
+# django_session when no shared cache is configured, see
+# cart.session.SessionStore
+QUERY_BUDGET = {
+    'item_list': {'anonymous': 2, 'user': 3},
+    'item_add': {'anonymous': 5, 'user': 9},
+    'cart_detail': {'anonymous': 3, 'user': 4},
+    'cart_pay': {'anonymous': 4, 'user': 4},
+    'cart_pay_method': {'anonymous': 1, 'user': 14},
+    'cart_remove_item': {'anonymous': 4, 'user': 9},
+}
+
+# p95 latency budget in milliseconds by cart size
+LATENCY_BUDGET = {1: 50, 10: 50, 100: 150, 1000: 1000}
+
+
+class PerformanceTest(TestCase):
+    """ Query count and latency budgets of every cart endpoint
+
+    Each url of cart/urls.py is requested as anonymous and logged in user
+    with carts of 1, 10, 100 and 1000 items. The number of queries must not
+    exceed QUERY_BUDGET, and with CHECK_LATENCY the p95 latency must not
+    exceed LATENCY_BUDGET.
+    """
+
+    fixtures = ['cart/fixtures/user.json', ]
+
+    results = []
+
+    @classmethod
+    def setUpTestData(cls):
+        Item.objects.bulk_create([
+            Item(name='Curso %04d' % number, category='des', level='b',
+                 price=10, image='items/blender.png')
+            for number in range(max(CART_SIZES) + 1)
+        ])
+
+    @classmethod
+    def tearDownClass(cls):
+        super(PerformanceTest, cls).tearDownClass()
+        if REPORT_PATH:
+            with open(REPORT_PATH, 'w') as report:
+                json.dump({'results': cls.results}, report, indent=2)
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.get(id=2)
+        self.item_ids = list(Item.objects.order_by('id')
+                             .values_list('id', flat=True))
+
+    def fill_cart(self, anonymous, size):
+        """ Leave a cart with the first size items """
+
+        item_ids = self.item_ids[:size]
+        if anonymous:
+            self.client.logout()
+            session = self.client.session
+            session['cart'] = item_ids
+            session['count_items'] = size
+            session.save()
+        else:
+            self.client.force_login(self.user)
+            Cart.objects.filter(user=self.user).delete()
+            cart = Cart.objects.create(user=self.user, total=10 * size,
+                                       item_count=size)
+            CartLine.objects.bulk_create([
+                CartLine(cart_id=cart.id, item_id=item_id, price=10)
+                for item_id in item_ids
+            ])
+            snapshot.invalidate(self.user)
+
+    def measure(self, url_name, kwargs=None):
+        """ Request the url in every scenario and check the budgets """
+
+        for anonymous in (True, False):
+            user_type = 'anonymous' if anonymous else 'user'
+            for size in CART_SIZES:
+                samples = []
+                queries = 0
+                for run in range(RUNS):
+                    self.fill_cart(anonymous, size)
+                    url = reverse(url_name, kwargs=kwargs)
+                    with CaptureQueriesContext(connection) as context:
+                        start = time.perf_counter()
+                        response = self.client.get(url)
+                        samples.append((time.perf_counter() - start) * 1000)
+                    queries = max(queries, len(context.captured_queries))
+                    self.assertLess(response.status_code, 400)
+
+                p95 = percentile(samples, 95)
+                budget_queries = QUERY_BUDGET[url_name][user_type]
+                budget_ms = LATENCY_BUDGET[size] * SLOWDOWN
+                self.results.append({
+                    'url_name': url_name, 'user': user_type, 'size': size,
+                    'queries': queries, 'budget_queries': budget_queries,
+                    'p95_ms': round(p95, 3), 'budget_ms': budget_ms,
+                })
+                with self.subTest(user=user_type, size=size):
+                    self.assertLessEqual(queries, budget_queries)
+                    if CHECK_LATENCY:
+                        self.assertLessEqual(p95, budget_ms)
+
+    def test_item_list(self):
+        self.measure('item_list')
+
+    def test_item_add(self):
+        self.measure('item_add', {'item_id': self.item_ids[-1]})
+
+    def test_cart_detail(self):
+        self.measure('cart_detail')
+
+    def test_cart_pay(self):
+        self.measure('cart_pay')
+
+    def test_cart_pay_method(self):
+        self.measure('cart_pay_method')
+
+    def test_cart_remove_item(self):
+        self.measure('cart_remove_item', {'item_id': self.item_ids[0]})
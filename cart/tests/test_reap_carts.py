@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import os
+import signal
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from cart import snapshot
+from cart.management.commands.reap_carts import Command
+from cart.models import Cart, CartLine, Item, Order
+
+
+class InterruptedCommand(Command):
+    """ Receives SIGINT while archiving the first batch """
+
+    def archive(self, queryset):
+        os.kill(os.getpid(), signal.SIGINT)
+        return super(InterruptedCommand, self).archive(queryset)
+
+
+class ReapCartsTest(TestCase):
+    """ Test the reap_carts command
+
+    1.- Archive the active carts without activity
+    2.- Delete the old inactive carts, keeping their orders
+    3.- Delete the expired sessions
+    4.- Dry run
+    5.- Stop after the current batch when interrupted
+    """
+
+    fixtures = ['cart/fixtures/item.json', ]
+
+    def setUp(self):
+        self.old = timezone.now() - timedelta(days=100)
+        self.item = Item.objects.get(id=1)
+
+    def cart(self, active, date_created, line_date=None):
+        user = User.objects.create(username='user%d' % User.objects.count())
+        cart = Cart.objects.create(user=user, active=active,
+                                   date_created=date_created)
+        if line_date:
+            CartLine.objects.create(cart=cart, item=self.item, price=10,
+                                    date_added=line_date)
+        return cart
+
+    def call(self, *args, **options):
+        stdout = StringIO()
+        call_command(*args, stdout=stdout, stderr=StringIO(), **options)
+        return stdout.getvalue()
+
+    def test_archive(self):
+        """ Archive the active carts without activity - 1 """
+
+        stale = self.cart(True, self.old, self.old)
+        recent = self.cart(True, timezone.now())
+        used = self.cart(True, self.old, timezone.now())
+        snapshot.get_snapshot(stale.user)
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            output = self.call('reap_carts', batch_size=1)
+
+        self.assertEqual(len(callbacks), 1)
+        self.assertIn('1 carts archived', output)
+        self.assertEqual(
+            set(Cart.objects.filter(active=True).values_list('id', flat=True)),
+            {recent.id, used.id})
+        self.assertIsNone(snapshot.get_snapshot(stale.user))
+
+        # Pending mutations of an archived cart fail
+        kept = self.cart(True, self.old, self.old)
+        self.call('reap_carts', inactive_days=1000)
+        self.assertEqual(Cart.objects.get(id=kept.id).version,
+                         kept.version + 1)
+
+    def test_delete(self):
+        """ Delete the old inactive carts, keeping their orders - 2 """
+
+        old = [self.cart(False, self.old, self.old) for number in range(3)]
+        recent = self.cart(False, self.old, timezone.now())
+        order = Order.objects.create(user=old[0].user, cart=old[0],
+                                     idempotency_key='cart-%s' % old[0].id)
+
+        output = self.call('reap_carts', batch_size=2)
+
+        self.assertIn('3 carts deleted', output)
+        self.assertEqual(list(Cart.objects.values_list('id', flat=True)),
+                         [recent.id])
+        self.assertEqual(CartLine.objects.count(), 1)
+        order.refresh_from_db()
+        self.assertIsNone(order.cart)
+
+    def test_sessions(self):
+        """ Delete the expired sessions - 3 """
+
+        for number in range(3):
+            session = SessionStore()
+            session['cart'] = [1]
+            session.set_expiry(-60 if number else 60)
+            session.save()
+
+        output = self.call('reap_carts', batch_size=1)
+
+        self.assertIn('2 sessions deleted', output)
+        self.assertEqual(Session.objects.count(), 1)
+
+    def test_dry_run(self):
+        """ Dry run - 4 """
+
+        self.cart(True, self.old)
+        self.cart(False, self.old)
+
+        output = self.call('reap_carts', dry_run=True)
+
+        self.assertIn('1 carts to archive, 1 carts to delete', output)
+        self.assertEqual(Cart.objects.filter(active=True).count(), 1)
+
+    def test_interrupted(self):
+        """ Stop after the current batch when interrupted - 5 """
+
+        for number in range(3):
+            self.cart(True, self.old)
+        self.cart(False, self.old)
+        handler = signal.getsignal(signal.SIGINT)
+
+        output = self.call(InterruptedCommand(), batch_size=2)
+
+        self.assertIn('Interrupted: 2 carts archived, 0 carts deleted',
+                      output)
+        self.assertEqual(Cart.objects.filter(active=True).count(), 1)
+        self.assertEqual(Cart.objects.count(), 4)
+        self.assertEqual(signal.getsignal(signal.SIGINT), handler)
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import datetime
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from cart import checkout
+from cart.models import (Cart, DailyItemSales, DailySales, DailySummary, Item,
+                         Order)
+
+
+@override_settings(CHECKOUT_EAGER=True, CHECKOUT_RETRY_DELAY=0)
+class ReportsTest(TestCase):
+    """ Test the daily rollups of the reports
+
+    1.- A completed order is added to the rollups of its day
+    2.- An order completed by two workers is added once
+    3.- The rebuild calculates the same rollups by chunks of days and
+        keeps the carts counted
+    4.- The dashboard reads only the rollups
+    """
+
+    fixtures = ['cart/fixtures/item.json', 'cart/fixtures/user.json', ]
+
+    def setUp(self):
+        self.user = User.objects.get(username='norma')
+        self.items = list(Item.objects.order_by('id'))
+
+    def pay(self, items, days_ago=0, process=True):
+        """ Pay a cart of the items, placed some days ago """
+
+        date = timezone.now() - datetime.timedelta(days=days_ago)
+        cart = Cart.objects.create(user=self.user, date_created=date)
+        for item in items:
+            cart.add_item(item)
+        order = checkout.place_order(cart)
+        Order.objects.filter(pk=order.pk).update(date_created=date)
+        if process:
+            checkout.process_order(order.id)
+        return order
+
+    def rollups(self):
+        return (
+            list(DailySummary.objects.order_by('date').values_list(
+                'date', 'carts', 'orders', 'items', 'revenue')),
+            list(DailySales.objects.order_by('date', 'category', 'level')
+                 .values_list('date', 'category', 'level', 'orders',
+                              'items', 'revenue')),
+            list(DailyItemSales.objects.order_by('date', 'item')
+                 .values_list('date', 'item', 'quantity', 'revenue')))
+
+    def test_record_order(self):
+        """ A completed order is added to the rollups of its day - 1 """
+
+        self.pay(self.items[:2])
+        self.pay(self.items[1:3])
+        Cart.objects.create(user=self.user, active=False)
+        # Failed orders are not sales
+        Order.objects.filter(pk=self.pay(self.items, process=False).pk) \
+            .update(status=Order.Status.get_value('failed'))
+
+        today = timezone.localdate()
+        summary = DailySummary.objects.get()
+        self.assertEqual(summary.date, today)
+        self.assertEqual((summary.carts, summary.orders, summary.items),
+                         (4, 2, 4))
+        prices = [item.price for item in self.items]
+        self.assertEqual(summary.revenue, prices[0] + 2 * prices[1] +
+                         prices[2])
+        self.assertEqual(summary.conversion, 0.5)
+
+        for item in self.items[:3]:
+            sales = DailySales.objects.get(date=today, category=item.category,
+                                           level=item.level)
+            self.assertGreaterEqual(sales.revenue, item.price)
+        self.assertEqual(sum(DailySales.objects.values_list('items',
+                                                            flat=True)), 4)
+        item_sales = DailyItemSales.objects.get(item=self.items[1])
+        self.assertEqual((item_sales.quantity, item_sales.revenue),
+                         (2, 2 * prices[1]))
+        self.assertFalse(DailyItemSales.objects.filter(
+            item=self.items[3]).exists())
+
+    def test_record_once(self):
+        """ An order completed by two workers is added once - 2 """
+
+        order = self.pay(self.items[:2], process=False)
+        first = Order.objects.get(pk=order.pk)
+        second = Order.objects.get(pk=order.pk)
+
+        checkout._fulfil(first)
+        checkout._fulfil(second)
+
+        self.assertEqual(DailySummary.objects.get().orders, 1)
+        self.assertEqual(
+            list(DailyItemSales.objects.values_list('quantity', flat=True)),
+            [1, 1])
+
+    def test_rebuild(self):
+        """ The rebuild calculates the same rollups by chunks of days and
+        keeps the carts counted - 3 """
+
+        self.pay(self.items[:2], days_ago=9)
+        self.pay(self.items[1:], days_ago=3)
+        self.pay(self.items[:1], days_ago=3)
+        self.pay(self.items[2:])
+        incremental = self.rollups()
+        self.assertEqual(len(incremental[0]), 3)
+
+        for model in (DailySummary, DailySales, DailyItemSales):
+            model.objects.all().delete()
+        output = StringIO()
+        call_command('rebuild_reports', chunk_days=2, workers=2,
+                     stdout=output)
+
+        self.assertEqual(self.rollups(), incremental)
+        self.assertIn('from 4 orders', output.getvalue())
+
+        # Only the days of the range are replaced, and the carts counted
+        # are kept when reap_carts deletes them
+        DailySummary.objects.update(carts=5, orders=0)
+        Cart.objects.all().delete()
+        today = timezone.localdate()
+        call_command('rebuild_reports', start=today.isoformat(),
+                     stdout=StringIO())
+        self.assertEqual(
+            list(DailySummary.objects.filter(orders__gt=0)
+                 .values_list('date', flat=True)), [today])
+        self.assertEqual(set(DailySummary.objects.values_list('carts',
+                                                              flat=True)),
+                         {5})
+        self.assertEqual(self.rollups()[1:], incremental[1:])
+        with self.assertRaises(CommandError):
+            call_command('rebuild_reports', start=today.isoformat(),
+                         end=(today - datetime.timedelta(days=1)).isoformat(),
+                         stdout=StringIO())
+
+    def test_dashboard(self):
+        """ The dashboard reads only the rollups - 4 """
+
+        self.client.login(username='admin', password='shop_1234')
+        url = reverse('admin:cart_dailysummary_changelist')
+        self.pay(self.items[:2], days_ago=1)
+        # The first request caches the content types
+        self.client.get(url)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        few = len(queries)
+        for query in queries:
+            for table in ('cart_order', 'cart_cart"', 'cart_cartline'):
+                self.assertNotIn(table, query['sql'])
+
+        self.assertEqual(response.context['totals']['orders'], 1)
+        self.assertEqual(response.context['top_items'][0]['quantity'], 1)
+        self.assertContains(response, self.items[0].name)
+
+        for days_ago in range(3):
+            self.pay(self.items, days_ago=1)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(len(queries), few)
+        self.assertEqual(response.context['totals']['revenue'],
+                         sum(item.price for item in self.items) * 3 +
+                         self.items[0].price + self.items[1].price)
+
+        # The days are filtered with the date hierarchy
+        yesterday = timezone.localdate() - datetime.timedelta(days=1)
+        response = self.client.get(url, {'date__year': yesterday.year + 1})
+        self.assertIsNone(response.context['totals']['orders'])
+        self.assertIsNone(response.context['totals']['conversion'])
+        self.assertEqual(response.context['sales'], [])
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import tempfile
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from cart import search
+from cart.models import Item
+
+
+@override_settings(MEDIA_ROOT=tempfile.gettempdir())
+class SearchTest(TestCase):
+    """ Test the full text search of the items
+
+    1.- Accents and case are ignored
+    2.- Every word must match the beginning of a word of the name
+    3.- Facets and filters
+    4.- The index follows the changes of the items
+    5.- Pagination
+    6.- Item list with a query
+    """
+
+    fixtures = ['cart/fixtures/item.json', ]
+
+    def setUp(self):
+        cache.clear()
+
+    def ids(self, query, **kwargs):
+        return [item.id for item in search.search(query, **kwargs)['items']]
+
+    def test_accents(self):
+        """ Accents and case are ignored - 1 """
+
+        self.assertEqual(self.ids('DISEÑA'), [2])
+        self.assertEqual(self.ids('disena'), [2])
+        self.assertEqual(self.ids('ilustración'), [1])
+        self.assertEqual(search.search_terms('Fotografía 3D!'),
+                         ['fotografia', '3d'])
+
+    def test_terms(self):
+        """ Every word must match the beginning of a word of the name - 2 """
+
+        self.assertEqual(sorted(self.ids('adobe')), [1, 3])
+        self.assertEqual(self.ids('ado phot'), [3])
+        self.assertEqual(self.ids('dobe'), [])
+        self.assertEqual(self.ids('adobe blender'), [])
+        self.assertEqual(self.ids('  ¿?  '), [])
+
+    def test_facets(self):
+        """ Facets and filters - 3 """
+
+        result = search.search('en')
+        self.assertEqual(result['count'], 4)
+        self.assertEqual(result['facets'], {
+            'category': {'des': 3, 'an': 1},
+            'level': {'a': 2, 'c': 2}})
+
+        result = search.search('en', category='des', level='c')
+        self.assertEqual([item.id for item in result['items']], [1])
+        self.assertEqual(result['count'], 1)
+        # Each facet counts the matches of the filter of the other one
+        self.assertEqual(result['facets'], {
+            'category': {'des': 1, 'an': 1},
+            'level': {'a': 2, 'c': 1}})
+
+        # Unknown filters are ignored
+        self.assertEqual(search.search('en', category='xx')['count'], 4)
+
+    def test_index_updates(self):
+        """ The index follows the changes of the items - 4 """
+
+        self.assertEqual(self.ids('zbrush'), [])
+        item = Item.objects.create(name='Esculpido en ZBrush',
+                                   category='an', level='b', price=10)
+        self.assertEqual(self.ids('zbrush'), [item.id])
+
+        item.name = 'Esculpido digital'
+        item.save()
+        self.assertEqual(self.ids('zbrush'), [])
+        self.assertEqual(self.ids('esculpido', level='b'), [item.id])
+
+        item.delete()
+        self.assertEqual(self.ids('esculpido'), [])
+
+        Item.objects.all().delete()
+        self.assertEqual(search.rebuild(), 0)
+        self.assertEqual(search.search('adobe')['count'], 0)
+
+    def test_pagination(self):
+        """ Pagination - 5 """
+
+        first = search.search('en', page_size=3)
+        second = search.search('en', page=first['next'], page_size=3)
+
+        self.assertEqual(first['next'], 2)
+        self.assertIsNone(second['next'])
+        ids = [item.id for item in first['items'] + second['items']]
+        self.assertEqual(sorted(ids), [1, 2, 3, 4])
+        self.assertEqual(self.ids('en', page='x'), self.ids('en'))
+
+    def test_item_list(self):
+        """ Item list with a query - 6 """
+
+        response = self.client.get(reverse('item_list'),
+                                   {'q': 'fotografía adobe'})
+        self.assertEqual(list(response.context['item_list']), [])
+
+        response = self.client.get(reverse('item_list'),
+                                   {'q': 'adobe', 'level': 'a'})
+        self.assertEqual([item.id for item in response.context['item_list']],
+                         [3])
+        self.assertEqual(response.context['count'], 1)
+        self.assertIn(('des', 'Diseño', 1), response.context['categories'])
+        self.assertContains(response, 'Curso Completo (1)')
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from django.urls import reverse
+
+from cart.models import Item, Cart
+from cart.services import (apply_cart_operations, apply_session_operations,
+                           merge_cart, parse_operations)
+
+
+class MergeCartTest(TestCase):
+    """ Test merge of the session cart into the database cart
+
+    1.- Merge into a new cart
+    2.- Merge into a cart with items, skipping duplicates and unknown ids
+    3.- Merge on login
+    4.- Logout closes the cart without writing its totals
+    5.- A conflict on login keeps the session cart
+    """
+
+    fixtures = ['cart/fixtures/item.json', 'cart/fixtures/user.json', ]
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.get(id=2)
+        self.item1 = Item.objects.get(id=1)
+        self.item2 = Item.objects.get(id=2)
+
+    def test_merge_new_cart(self):
+        """ Merge into a new cart - 1 """
+
+        cart = merge_cart(self.user, [1, 2])
+
+        self.assertEqual(set(cart.items.values_list('id', flat=True)), {1, 2})
+        self.assertEqual(cart.total, self.item1.price + self.item2.price)
+
+    def test_merge_existing_cart(self):
+        """ Merge into a cart with items - 2 """
+
+        cart = Cart.objects.create(user=self.user)
+        cart.add_item(self.item1)
+
+        cart = merge_cart(self.user, [1, 2, 99])
+
+        self.assertEqual(Cart.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(cart.items.count(), 2)
+        self.assertEqual(Cart.objects.get(id=cart.id).total,
+                         self.item1.price + self.item2.price)
+
+    def test_merge_queries(self):
+        """ The number of queries does not depend on the number of items """
+
+        Cart.objects.create(user=self.user)
+
+        # get cart, read prices, and in a savepoint read the lines already
+        # in the cart, insert the missing ones and swap the totals
+        with self.assertNumQueries(7):
+            merge_cart(self.user, [1, 2, 3, 4])
+
+    def test_merge_on_login(self):
+        """ Merge on login - 3 """
+
+        session = self.client.session
+        session['count_items'] = 2
+        session['cart'] = '{"items":[1,2]}'
+        session.save()
+
+        self.client.post(reverse('login'),
+                         {'username': 'norma', 'password': 'n_123456'})
+
+        cart = Cart.objects.get(user=self.user, active=True)
+        self.assertEqual(cart.items.count(), 2)
+        self.assertNotIn('cart', self.client.session)
+
+    def test_logout(self):
+        """ Logout closes the cart without writing its totals - 4 """
+
+        cart = merge_cart(self.user, [1])
+        self.client.login(username='norma', password='n_123456')
+        # A mutation of another request, committed after the cart was read
+        cart.add_item(self.item2)
+
+        self.client.post(reverse('logout'))
+
+        closed = Cart.objects.get(id=cart.id)
+        self.assertFalse(closed.active)
+        self.assertEqual(closed.version, cart.version + 1)
+        self.assertEqual(closed.total, self.item1.price + self.item2.price)
+        self.assertEqual(closed.item_count, 2)
+
+    @override_settings(CART_MAX_RETRIES=0)
+    def test_login_conflict(self):
+        """ A conflict on login keeps the session cart - 5 """
+
+        session = self.client.session
+        session['count_items'] = 2
+        session['cart'] = [1, 2]
+        session.save()
+
+        response = self.client.post(
+            reverse('login'), {'username': 'norma', 'password': 'n_123456'},
+            follow=True)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(int(self.client.session['_auth_user_id']),
+                         self.user.id)
+        self.assertEqual(self.client.session['cart'], [1, 2])
+        self.assertFalse(Cart.objects.filter(user=self.user,
+                                             lines__isnull=False).exists())
+        self.assertIn('intente nuevamente',
+                      [str(message) for message in
+                       response.context['messages']][0])
+
+
+class BatchOperationsTest(TestCase):
+    """ Test batches of add and remove operations
+
+    1.- Parse the body of the request
+    2.- Apply to the cart of a user, in order and skipping unknown items,
+        which do not create a cart
+    3.- Apply to the session cart
+    """
+
+    fixtures = ['cart/fixtures/item.json', 'cart/fixtures/user.json', ]
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.get(id=2)
+        self.item1 = Item.objects.get(id=1)
+        self.item2 = Item.objects.get(id=2)
+        self.item3 = Item.objects.get(id=3)
+
+    def test_parse_operations(self):
+        """ Parse the body of the request - 1 """
+
+        operations = parse_operations({'operations': [
+            {'op': 'add', 'item': 1}, {'op': 'remove', 'item': 2}]})
+        self.assertEqual(operations, [('add', 1), ('remove', 2)])
+
+        for data in ([], {}, {'operations': [{'op': 'clear', 'item': 1}]},
+                     {'operations': [{'op': 'add', 'item': '1'}]},
+                     {'operations': [{'op': 'add'}] * 101}):
+            with self.assertRaises(ValueError):
+                parse_operations(data)
+
+    def test_apply_cart_operations(self):
+        """ Apply to the cart of a user - 2 """
+
+        cart = Cart.objects.create(user=self.user)
+        cart.add_item(self.item1)
+
+        state = apply_cart_operations(self.user, [
+            ('add', 2), ('add', 3), ('remove', 1), ('remove', 3), ('add', 99)])
+
+        self.assertEqual(state['items'], [2])
+        self.assertEqual(state['count'], 1)
+        self.assertEqual(state['total'], str(self.item2.price))
+        self.assertEqual(Cart.objects.get(id=cart.id).total, self.item2.price)
+
+        # Unknown items do not create a cart
+        Cart.objects.all().delete()
+        state = apply_cart_operations(self.user, [('add', 99),
+                                                  ('remove', 1)])
+        self.assertEqual((state['items'], state['count']), ([], 0))
+        self.assertFalse(Cart.objects.exists())
+
+    def test_apply_cart_operations_queries(self):
+        """ The number of queries does not depend on the size of the batch """
+
+        cart = Cart.objects.create(user=self.user)
+        cart.add_item(self.item1)
+
+        # load items, get cart, savepoint, lines of the batch, insert,
+        # delete, compare-and-swap of the total and count, release and ids
+        # of the cart
+        with self.assertNumQueries(9):
+            apply_cart_operations(self.user, [
+                ('add', 2), ('add', 3), ('add', 4), ('remove', 1)])
+
+    def test_apply_session_operations(self):
+        """ Apply to the session cart - 3 """
+
+        session = self.client.session
+        session['cart'] = [1]
+
+        state = apply_session_operations(session, [
+            ('add', 3), ('add', 2), ('remove', 1), ('add', 99)])
+
+        self.assertEqual(state['items'], [3, 2])
+        self.assertEqual(state['total'],
+                         str(self.item2.price + self.item3.price))
+        self.assertEqual(session['cart'], [3, 2])
+        self.assertEqual(session['count_items'], 2)
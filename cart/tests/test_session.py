@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.contrib.sessions.backends.db import SessionStore
+from django.test import TestCase, override_settings
+
+from cart import session as cart_session
+from cart.session import SessionCart
+
+
+class SessionCartTest(TestCase):
+    """ Test the cart of anonymous users
+
+    1.- Read carts stored as a JSON string by older versions
+    2.- Add and remove items
+    3.- The session is only modified when the cart changes
+    4.- Resolve the items
+    """
+
+    fixtures = ['cart/fixtures/item.json', ]
+
+    def setUp(self):
+        self.session = SessionStore()
+
+    def test_old_format(self):
+        """ Read carts stored as a JSON string - 1 """
+
+        self.session['cart'] = '{"items":[2,1]}'
+
+        cart = SessionCart(self.session)
+
+        self.assertEqual(cart.item_ids, [2, 1])
+        self.assertIn(1, cart)
+
+    def test_add_remove(self):
+        """ Add and remove items - 2 """
+
+        cart = SessionCart(self.session)
+
+        self.assertTrue(cart.add(1))
+        self.assertTrue(cart.add('2'))
+        self.assertFalse(cart.add(1))
+        self.assertTrue(cart.remove(1))
+        self.assertFalse(cart.remove(3))
+        cart.save()
+
+        self.assertEqual(self.session['cart'], [2])
+        self.assertEqual(self.session['count_items'], 1)
+
+    def test_save_only_changes(self):
+        """ The session is only modified when the cart changes - 3 """
+
+        self.session['cart'] = [1]
+        self.session.modified = False
+
+        cart = SessionCart(self.session)
+        cart.add(1)
+        cart.save()
+
+        self.assertFalse(self.session.modified)
+
+    def test_resolve(self):
+        """ Resolve the items - 4 """
+
+        self.session['cart'] = [3, 1]
+
+        items, total = SessionCart(self.session).resolve()
+
+        self.assertEqual([item.id for item in items], [3, 1])
+        self.assertEqual(total, sum(item.price for item in items))
+
+
+class SessionStoreTest(TestCase):
+    """ Test the session engine of the project
+
+    1.- Saves without changes do not write
+    2.- Changes are written to the database and the cache
+    3.- Every save writes with SESSION_SAVE_EVERY_REQUEST
+    """
+
+    def setUp(self):
+        session = cart_session.SessionStore()
+        session['cart'] = [1, 2]
+        session.create()
+        self.session_key = session.session_key
+
+    def test_unchanged(self):
+        """ Saves without changes do not write - 1 """
+
+        session = cart_session.SessionStore(self.session_key)
+        session['cart'] = [1, 2]
+
+        with self.assertNumQueries(0):
+            session.save()
+
+    def test_changed(self):
+        """ Changes are written to the database and the cache - 2 """
+
+        session = cart_session.SessionStore(self.session_key)
+        session['cart'] = [1, 2, 3]
+        # The UPDATE inside a savepoint
+        with self.assertNumQueries(3):
+            session.save()
+        with self.assertNumQueries(0):
+            session.save()
+
+        # Read through the engine and from the database
+        self.assertEqual(
+            cart_session.SessionStore(self.session_key)['cart'], [1, 2, 3])
+        self.assertEqual(SessionStore(self.session_key)['cart'], [1, 2, 3])
+
+    @override_settings(SESSION_SAVE_EVERY_REQUEST=True)
+    def test_save_every_request(self):
+        """ Every save writes with SESSION_SAVE_EVERY_REQUEST - 3 """
+
+        session = cart_session.SessionStore(self.session_key)
+        session['cart'] = [1, 2]
+
+        with self.assertNumQueries(3):
+            session.save()
@@ -1,23 +1,30 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from django.test import TestCase, RequestFactory
+import json
+import tempfile
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.contrib.sessions.middleware import SessionMiddleware
 
+from cart import catalogue
 from cart.models import Item, Cart
 from cart.views import add_item_cart, delete_item_cart
 
 
 def add_middleware_to_request(request, middleware_class):
-    middleware = middleware_class()
+    middleware = middleware_class(lambda request: None)
     middleware.process_request(request)
     return request
 
 
 def add_middleware_to_response(request, middleware_class):
-    middleware = middleware_class()
+    middleware = middleware_class(lambda request: None)
     middleware.process_response(request)
     return request
 
@@ -39,6 +46,7 @@ class ItemTest(TestCase):
     fixtures = ['cart/fixtures/item.json', 'cart/fixtures/user.json', ]
 
     def setUp(self):
+        cache.clear()
         self.user = User.objects.get(id=2)
         self.item1 = Item.objects.get(id=1)
         self.item2 = Item.objects.get(id=2)
@@ -70,7 +78,7 @@ class ItemTest(TestCase):
 
         cart = Cart.objects.get(id=1)
 
-        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.status_code, 302)
         self.assertTrue(self.item1 in cart.items.all())
 
     def test_user_add_item_cart(self):
@@ -81,7 +89,7 @@ class ItemTest(TestCase):
         """
 
         self.cart = Cart.objects.create(user=self.user)
-        self.cart.items.add(self.item2)
+        self.cart.add_item(self.item2)
         self.cart.save()
 
         request = self.factory.get(reverse('item_add', kwargs={'item_id': '1'}))
@@ -94,7 +102,7 @@ class ItemTest(TestCase):
         cart = Cart.objects.get(id=1)
 
         self.assertTrue(self.item1 in cart.items.all())
-        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.status_code, 302)
 
     def test_user_add_item_cart(self):
         """ Add items to cart - 2.3 
@@ -104,7 +112,7 @@ class ItemTest(TestCase):
         """
 
         self.cart = Cart.objects.create(user=self.user)
-        self.cart.items.add(self.item1)
+        self.cart.add_item(self.item1)
         self.cart.save()
 
         request = self.factory.get(reverse('item_add', kwargs={'item_id': '1'}))
@@ -118,7 +126,7 @@ class ItemTest(TestCase):
 
         self.assertTrue(cart.items.count() == 1)
         self.assertTrue(self.item1 in cart.items.all())
-        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.status_code, 302)
 
     def test_anonymous_add_item_cart_empty(self):
         """ Add items to cart - 3.1   
@@ -175,7 +183,7 @@ class ItemTest(TestCase):
         session['count_items'] = 1
         session['cart'] = '{"items":[1,2]}'
         session.save()
-        response = self.client.get(url)
+        response = self.client.get(url, follow=True)
 
         self.assertEqual(len(response.context['items']), 1)
 
@@ -185,8 +193,8 @@ class ItemTest(TestCase):
         url = reverse('cart_remove_item', kwargs={'item_id': 1})
 
         self.cart = Cart.objects.create(user=self.user)
-        self.cart.items.add(self.item1)
-        self.cart.items.add(self.item2)
+        self.cart.add_item(self.item1)
+        self.cart.add_item(self.item2)
         self.cart.save()
 
         request = self.factory.get(url)
@@ -210,6 +218,7 @@ class CartDetailTest(TestCase):
     def setUp(self):
         """ Set values default for test """
 
+        cache.clear()
         self.item = Item.objects.get(id=1)
         self.user = User.objects.get(id=2)
 
@@ -233,7 +242,7 @@ class CartDetailTest(TestCase):
         """ Test view cart detail when user is login """
 
         self.cart = Cart.objects.create(user=self.user)
-        self.cart.items.add(self.item)
+        self.cart.add_item(self.item)
         self.cart.set_total()
         self.cart.save()
         self.client.login(username='norma', password='n_123456')
@@ -242,4 +251,285 @@ class CartDetailTest(TestCase):
 
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.context['items']), 1)
-        self.assertEqual(response.context['total'], self.item.price)
\ No newline at end of file
+        self.assertEqual(response.context['total'], self.item.price)
+
+    def test_anonymous_cart_detail_queries(self):
+        """ Test view cart detail resolves the session cart in bulk """
+
+        session = self.client.session
+        session['count_items'] = 4
+        session['cart'] = '{"items":[3,99,1,2]}'
+        session.save()
+
+        # One query for the session, one for the items and one for the total
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('cart_detail'))
+
+        items = response.context['items']
+        self.assertEqual([item.id for item in items], [3, 1, 2])
+        self.assertEqual(response.context['total'],
+                         sum(item.price for item in items))
+
+    def test_user_cart_detail_cached(self):
+        """ Test view cart detail is served from cache once read """
+
+        self.cart = Cart.objects.create(user=self.user)
+        self.cart.add_item(self.item)
+        self.client.login(username='norma', password='n_123456')
+        self.client.get(reverse('cart_detail'))
+
+        # Only the session and the user are loaded
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('cart_detail'))
+        self.assertEqual(len(response.context['items']), 1)
+
+        self.client.get(reverse('cart_remove_item', kwargs={'item_id': 1}))
+        response = self.client.get(reverse('cart_detail'))
+        self.assertEqual(len(response.context['items']), 0)
+        self.assertEqual(response.context['total'], 0)
+
+    def test_user_cart_detail_timeout(self):
+        """ Test view cart detail is cached for CART_SNAPSHOT_TIMEOUT """
+
+        self.cart = Cart.objects.create(user=self.user)
+        self.cart.add_item(self.item)
+        self.client.login(username='norma', password='n_123456')
+        self.client.get(reverse('cart_detail'))
+
+        # A change that another process made without reaching this cache
+        self.cart.lines.all().delete()
+        response = self.client.get(reverse('cart_detail'))
+        self.assertEqual(len(response.context['items']), 1)
+
+        with override_settings(CART_SNAPSHOT_TIMEOUT=0):
+            cache.clear()
+            self.client.get(reverse('cart_detail'))
+            response = self.client.get(reverse('cart_detail'))
+        self.assertEqual(len(response.context['items']), 0)
+
+
+@override_settings(MEDIA_ROOT=tempfile.gettempdir())
+class CatalogueTest(TestCase):
+    """ Test the cached catalogue behind the item list
+
+    1.- Filter by category and level
+    2.- Keyset pagination
+    3.- Pages are served from cache until an item changes
+    """
+
+    fixtures = ['cart/fixtures/item.json', ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_filters(self):
+        """ Filter by category and level - 1 """
+
+        response = self.client.get(reverse('item_list'),
+                                   {'category': 'des', 'level': 'a'})
+
+        self.assertEqual([item.id for item in response.context['item_list']],
+                         [2, 3])
+
+    def test_pagination(self):
+        """ Keyset pagination - 2 """
+
+        first = catalogue.get_page(page_size=3)
+        second = catalogue.get_page(cursor=first['next'], page_size=3)
+
+        names = [item.name for item in first['items'] + second['items']]
+        self.assertEqual(names, sorted(names))
+        self.assertEqual(len(names), 4)
+        self.assertIsNone(second['next'])
+
+    def test_cache(self):
+        """ Pages are served from cache until an item changes - 3 """
+
+        catalogue.get_page()
+        with self.assertNumQueries(0):
+            catalogue.get_page()
+
+        item = Item.objects.get(id=1)
+        item.name = 'Zbrush'
+        item.save()
+
+        self.assertEqual(catalogue.get_page()['items'][-1].name, 'Zbrush')
+
+
+class BatchCartTest(TestCase):
+    """ Test the JSON endpoint of batch operations
+
+    1.- Anonymous user
+    2.- User Login
+    3.- Invalid body
+    """
+
+    fixtures = ['cart/fixtures/item.json', 'cart/fixtures/user.json', ]
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.get(id=2)
+        self.url = reverse('cart_batch')
+
+    def post(self, operations):
+        return self.client.post(self.url, json.dumps(
+            {'operations': operations}), content_type='application/json')
+
+    def test_anonymous_batch(self):
+        """ Anonymous user - 1 """
+
+        response = self.post([{'op': 'add', 'item': 1},
+                              {'op': 'add', 'item': 2}])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['items'], [1, 2])
+        self.assertEqual(self.client.session['count_items'], 2)
+
+    def test_user_batch(self):
+        """ User Login - 2 """
+
+        self.client.force_login(self.user)
+        self.post([{'op': 'add', 'item': 1}, {'op': 'add', 'item': 2}])
+        response = self.post([{'op': 'remove', 'item': 1}])
+
+        cart = Cart.objects.get(user=self.user, active=True)
+        self.assertEqual(response.json(), {'items': [2], 'count': 1,
+                                           'total': str(cart.total)})
+        self.assertEqual(list(cart.items.values_list('id', flat=True)), [2])
+        self.assertEqual(cart.item_count, 1)
+
+    def test_invalid_batch(self):
+        """ Invalid body - 3 """
+
+        response = self.client.post(self.url, 'nope',
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+        response = self.post([{'op': 'add', 'item': 'x'}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(self.url).status_code, 405)
+
+
+class MutationResponseTest(TestCase):
+    """ Test the negotiated responses of the add and remove views
+
+    1.- JSON summary
+    2.- HTML fragment
+    3.- Redirect of plain browser requests
+    4.- Item that does not exist
+    5.- Cart that keeps changing under the mutation
+    """
+
+    fixtures = ['cart/fixtures/item.json', 'cart/fixtures/user.json', ]
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.get(id=2)
+        self.item1 = Item.objects.get(id=1)
+        self.item2 = Item.objects.get(id=2)
+
+    def test_json(self):
+        """ JSON summary - 1 """
+
+        url = reverse('item_add', kwargs={'item_id': 1})
+        response = self.client.get(url, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.json(), {
+            'count': 1, 'total': str(self.item1.price), 'changed': True})
+
+        self.client.force_login(self.user)
+        self.client.get(url, HTTP_ACCEPT='application/json')
+        response = self.client.get(
+            reverse('cart_remove_item', kwargs={'item_id': 1}),
+            HTTP_ACCEPT='application/json')
+        self.assertEqual(response.json(), {
+            'count': 0, 'total': '0.00', 'changed': True})
+
+    def test_fragment(self):
+        """ HTML fragment - 2 """
+
+        response = self.client.get(
+            reverse('item_add', kwargs={'item_id': 2}), HTTP_HX_REQUEST='true')
+
+        self.assertTemplateUsed(response, 'cart/cart_summary.html')
+        self.assertTemplateNotUsed(response, 'base.html')
+        self.assertContains(response, 'data-badge="1"')
+        self.assertContains(response, str(self.item2.price))
+
+    def test_redirect(self):
+        """ Redirect of plain browser requests - 3 """
+
+        url = reverse('item_add', kwargs={'item_id': 1})
+        referer = 'http://testserver%s?category=des' % reverse('item_list')
+        response = self.client.get(url, HTTP_REFERER=referer)
+        self.assertRedirects(response, referer)
+
+        response = self.client.get(url, HTTP_REFERER='http://evil.com/',
+                                   follow=True)
+        self.assertRedirects(response, reverse('item_list'))
+        self.assertContains(response, 'Curso agregado exitosamente')
+
+    def test_not_found(self):
+        """ Item that does not exist - 4 """
+
+        url = reverse('item_add', kwargs={'item_id': 99})
+        response = self.client.get(url, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 404)
+        self.assertRedirects(self.client.get(url), reverse('item_list'))
+
+    @override_settings(CART_MAX_RETRIES=0)
+    def test_conflict(self):
+        """ Cart that keeps changing under the mutation - 5 """
+
+        self.client.force_login(self.user)
+        url = reverse('item_add', kwargs={'item_id': 1})
+
+        response = self.client.get(url, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 409)
+        response = self.client.get(url, follow=True)
+        self.assertRedirects(response, reverse('item_list'))
+        self.assertContains(response, 'intente nuevamente')
+        self.assertFalse(Cart.objects.get(user=self.user).lines.exists())
+
+
+class CartBadgeTest(TestCase):
+    """ Test the badge of base.html
+
+    1.- Anonymous user
+    2.- User Login, read from the cache after the first request
+    """
+
+    fixtures = ['cart/fixtures/item.json', 'cart/fixtures/user.json', ]
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.get(id=2)
+
+    def test_anonymous_badge(self):
+        """ Anonymous user - 1 """
+
+        session = self.client.session
+        session['cart'] = [1, 2]
+        session.save()
+
+        response = self.client.get(reverse('item_list'))
+        self.assertContains(response, 'data-badge="2"')
+
+    def test_user_badge(self):
+        """ User Login - 2 """
+
+        cart = Cart.objects.create(user=self.user)
+        for item in Item.objects.filter(id__in=[1, 2, 3]):
+            cart.add_item(item)
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('item_list'))
+        self.assertContains(response, 'data-badge="3"')
+
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(reverse('item_list'))
+        self.assertFalse([query for query in context.captured_queries
+                          if 'cart_cart' in query['sql']])
+
+        self.client.get(reverse('cart_remove_item', kwargs={'item_id': 1}))
+        response = self.client.get(reverse('item_list'))
+        self.assertContains(response, 'data-badge="2"')
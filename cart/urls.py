@@ -1,46 +1,66 @@
-from django.conf.urls import url
+from django.urls import re_path
 from django.contrib.auth import views as auth_views
 
 from . import views
 
 urlpatterns = [
-    url(
-        regex=r'^$',
+    re_path(
+        route=r'^$',
         view=views.ItemListView.as_view(),
         name='item_list'
     ),
-    url(
-        regex=r'^add/(?P<item_id>\d+)/$',
+    re_path(
+        route=r'^add/(?P<item_id>\d+)/$',
         view=views.add_item_cart,
         name='item_add'
     ),
-    url(
-        regex=r'^cart/$',
+    re_path(
+        route=r'^cart/$',
         view=views.cart_detail,
         name='cart_detail'
     ),
-    url(
-        regex=r'^cart/pay/$',
+    re_path(
+        route=r'^cart/pay/$',
         view=views.pay_shopping_cart,
         name='cart_pay'
     ),
-    url(
-        regex=r'^cart/pay/method/$',
+    re_path(
+        route=r'^cart/pay/method/$',
         view=views.pay_method_cart,
         name='cart_pay_method'
     ),
-    url(
-        regex=r'^delete/(?P<item_id>\d+)/$',
+    re_path(
+        route=r'^orders/(?P<order_id>\d+)/$',
+        view=views.order_detail,
+        name='order_detail'
+    ),
+    re_path(
+        route=r'^orders/(?P<order_id>\d+)/status/$',
+        view=views.order_status,
+        name='order_status'
+    ),
+    re_path(
+        route=r'^delete/(?P<item_id>\d+)/$',
         view=views.delete_item_cart,
         name='cart_remove_item'
     ),
-    url(
-        regex=r'^login/$',
+    re_path(
+        route=r'^cart/batch/$',
+        view=views.batch_cart,
+        name='cart_batch'
+    ),
+    re_path(
+        route=r'^performance/$',
+        view=views.performance_stats,
+        name='performance_stats'
+    ),
+    re_path(
+        route=r'^login/$',
         view=auth_views.LoginView.as_view(),
         name='login'
     ),
-    url(
-        regex=r'^logout/$',
+    re_path(
+        route=r'^logout/$',
         view=auth_views.LogoutView.as_view(),
         name='logout'
     ),
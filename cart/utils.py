@@ -0,0 +1,111 @@
+import os
+import time
+from itertools import islice
+
+from django.core.cache import cache
+
+# Width in pixels of each rendition of the item images, twice the size they
+# are displayed at
+RENDITION_SIZES = {
+    'thumbnail': 80,
+    'card': 640,
+}
+
+
+def get_cache_version(key):
+    """ Return the version stored in a cache key, creating it if missing
+
+    :param key: cache key of the version
+    :return: int
+    """
+
+    version = cache.get(key)
+    if version is None:
+        # A time based start avoids reading entries of an evicted version
+        cache.add(key, int(time.time()), None)
+        version = cache.get(key)
+    return version
+
+
+async def aget_cache_version(key):
+    """ Async version of get_cache_version """
+
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, int(time.time()), None)
+        version = await cache.aget(key)
+    return version
+
+
+def bump_cache_version(key):
+    """ Move a cache version forward so the entries built on it are stale
+
+    :param key: cache key of the version
+    """
+
+    try:
+        cache.incr(key)
+    except ValueError:
+        get_cache_version(key)
+
+
+async def abump_cache_version(key):
+    """ Async version of bump_cache_version """
+
+    try:
+        await cache.aincr(key)
+    except ValueError:
+        await aget_cache_version(key)
+
+
+def rendition_name(name, image_hash, width, extension):
+    """ Name of a rendition of the image stored as name
+
+    :param name: name of the original image in the storage
+    :param image_hash: content hash of the original image
+    :param width: width of the rendition in pixels
+    :param extension: file extension of the rendition format
+    :return: string
+    """
+
+    stem = os.path.splitext(name)[0]
+    return '%s.%s.%s.%s' % (stem, image_hash, width, extension)
+
+
+def percentile(samples, percent):
+    """ Nearest rank percentile of a list of samples """
+
+    ordered = sorted(samples)
+    rank = max(int(round(percent / 100.0 * len(ordered))), 1)
+    return ordered[rank - 1]
+
+
+def batched(iterable, size):
+    """ Split an iterable in lists of size elements, without reading ahead """
+
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Progress(object):
+    """ Count processed rows and report the throughput """
+
+    def __init__(self, write, name=None):
+        self.write = write
+        self.name = name
+        self.rows = 0
+        self.start = time.perf_counter()
+
+    @property
+    def rate(self):
+        elapsed = time.perf_counter() - self.start
+        return self.rows / elapsed if elapsed else 0
+
+    def add(self, rows):
+        self.rows += rows
+        self.write('%s%d rows (%d rows/s)' % (
+            '%s: ' % self.name if self.name else '', self.rows, self.rate))
@@ -1,21 +1,168 @@
 import json
 
-from django.shortcuts import render
+from django.shortcuts import get_object_or_404, render
 from django.views.generic import ListView
-from django.core.urlresolvers import reverse_lazy
-from django.http import HttpResponseRedirect
+from django.urls import reverse_lazy
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.http import (HttpResponse, HttpResponseNotFound,
+                         HttpResponseRedirect, JsonResponse)
+from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.db.models import F
 from django.dispatch import receiver
+from django.views.decorators.http import require_POST
 
-from .models import Item, Cart
+from . import catalogue, checkout, search, services, snapshot
+from .middleware import get_stats
+from .models import Item, Cart, CartConflict, Order
+from .services import merge_cart
+from .session import SessionCart
+
+ADDED_MESSAGE = 'Curso agregado exitosamente al carrito de compras.'
+CONFLICT_MESSAGE = ('El carrito de compras cambió al mismo tiempo, '
+                    'intente nuevamente.')
 
 
 class ItemListView(ListView):
-    """ ItemListView is responsible for showing all available courses """
+    """ ItemListView is responsible for showing all available courses
+
+    The courses come from the cached catalogue, filtered by the category and
+    level of the query string and paginated with the cursor in after. When
+    the query string has the words q the courses come from the search index,
+    ranked and paginated by page number.
+    """
 
     model = Item
-    queryset = Item.objects.all().order_by('name')[:10]
+    template_name = 'cart/item_list.html'
+    context_object_name = 'item_list'
+
+    def get_queryset(self):
+        query = self.request.GET.get('q', '').strip()
+        if query:
+            self.page = search.search(
+                query, category=self.request.GET.get('category'),
+                level=self.request.GET.get('level'),
+                page=self.request.GET.get('page'))
+        else:
+            self.page = catalogue.get_page(
+                category=self.request.GET.get('category'),
+                level=self.request.GET.get('level'),
+                cursor=self.request.GET.get('after'))
+        return self.page['items']
+
+    def get_context_data(self, **kwargs):
+        context = super(ItemListView, self).get_context_data(**kwargs)
+        context.update(catalogue_context(self.request, self.page))
+        return context
+
+
+def catalogue_context(request, page):
+    """ Filters and pagination of the item list template
+
+    :param request: 
+    :param page: page returned by the catalogue or by the search
+    :return: dict
+    """
+
+    context = {
+        'query': request.GET.get('q', '').strip(),
+        'category': request.GET.get('category', ''),
+        'level': request.GET.get('level', ''),
+        'categories': [x.value for x in Item.Category],
+        'levels': [x.value for x in Item.Level],
+    }
+    if 'facets' not in page:
+        context['next_cursor'] = page['next']
+        return context
+
+    # Search results, the filters show the number of matches of each value
+    facets = page['facets']
+    context.update({
+        'next_page': page['next'],
+        'count': page['count'],
+        'categories': [(value, label, facets['category'].get(value, 0))
+                       for value, label in context['categories']],
+        'levels': [(value, label, facets['level'].get(value, 0))
+                   for value, label in context['levels']],
+    })
+    return context
+
+
+def response_format(request):
+    """ Format of the response that the client of a cart mutation asks for
+
+    Clients that prefer application/json get the summary as JSON and
+    requests made from scripts (X-Requested-With or HX-Request headers)
+    get it as an HTML fragment, plain browser requests are redirected.
+    :param request: 
+    :return: 'json', 'fragment' or None
+    """
+
+    preferred = request.get_preferred_type(['text/html', 'application/json'])
+    if preferred == 'application/json':
+        return 'json'
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest' or \
+            'HX-Request' in request.headers:
+        return 'fragment'
+    return None
+
+
+def summary_response(request, kind, changed, count, total):
+    """ Small response with the badge count and the total of the cart
+
+    :param request: 
+    :param kind: 'json' or 'fragment', see response_format
+    :param changed: True if the mutation changed the cart
+    :param count: number of items in the cart
+    :param total: total of the cart
+    :return: HttpResponse
+    """
+
+    summary = services.cart_summary(count, total)
+    summary['changed'] = changed
+    if kind == 'json':
+        return JsonResponse(summary)
+    return render(request, 'cart/cart_summary.html', summary)
+
+
+def not_found_response(request, kind, url_name):
+    """ Response of a mutation on an item or cart that does not exist """
+
+    if kind == 'json':
+        return JsonResponse({'error': 'not found'}, status=404)
+    if kind == 'fragment':
+        return HttpResponseNotFound()
+    return HttpResponseRedirect(reverse_lazy(url_name))
+
+
+def conflict_response(request, kind, url_name):
+    """ Response of a mutation that kept colliding with other requests on
+    the same cart, the client can try again """
+
+    if kind == 'json':
+        return JsonResponse({'error': 'conflict'}, status=409)
+    if kind == 'fragment':
+        return HttpResponse(status=409)
+    messages.error(request, CONFLICT_MESSAGE, fail_silently=True)
+    return redirect_back(request, url_name)
+
+
+def redirect_back(request, url_name):
+    """ Redirect to the page that made the request, after a mutation
+
+    :param request: 
+    :param url_name: name of the url used when there is no safe referer
+    :return: HttpResponseRedirect
+    """
+
+    url = request.headers.get('Referer')
+    if not url_has_allowed_host_and_scheme(
+            url, allowed_hosts={request.get_host()},
+            require_https=request.is_secure()):
+        url = reverse_lazy(url_name)
+    return HttpResponseRedirect(url)
 
 
 def add_item_cart(request, item_id):
@@ -23,40 +170,40 @@ def add_item_cart(request, item_id):
 
     If you are an anonymous user, add the element to the session.
     If you are logged in, create or obtain a shopping cart and add the item.
+    The response is negotiated with response_format.
     :param request: 
     :param item_id: 
     :return: HttpResponse
     """
 
+    kind = response_format(request)
     try:
         item = Item.objects.get(id=item_id)
     except Item.DoesNotExist:
-        return HttpResponseRedirect(reverse_lazy('item-list'))
+        return not_found_response(request, kind, 'item_list')
 
     if request.user.is_anonymous:
-        if 'cart' in request.session:
-            data = json.loads(request.session['cart'])
-            if item.id not in data['items']:
-                data['items'].append(item.id)
-                request.session['count_items'] = len(data['items'])
-                request.session['cart'] = json.dumps(data)
-        else:
-            request.session['cart'] = json.dumps({'items': [item.id]})
-            request.session['count_items'] = 1
+        cart = SessionCart(request.session)
+        added = cart.add(item.id)
+        cart.save()
+        count = len(cart)
     else:
         cart, created = Cart.objects.get_or_create(user=request.user,
                                                    active=True)
 
-        if item not in cart.items.all():
-            cart.items.add(item)
-            cart.set_total()
-            cart.save()
-        request.session['count_items'] = cart.items.count()
+        try:
+            added = cart.add_item(item)
+        except CartConflict:
+            return conflict_response(request, kind, 'item_list')
+        if added:
+            snapshot.invalidate(request.user)
+        count = cart.item_count
 
-    items = Item.objects.all()[:10]
-    return render(request,
-                  'cart/item_list.html',
-                  {'info': True, 'item_list': items})
+    if kind is None:
+        messages.success(request, ADDED_MESSAGE, fail_silently=True)
+        return redirect_back(request, 'item_list')
+    total = cart.total() if request.user.is_anonymous else cart.total
+    return summary_response(request, kind, added, count, total)
 
 
 def cart_detail(request):
@@ -69,27 +216,17 @@ def cart_detail(request):
     """
 
     if request.user.is_anonymous:
-        items = []
-        total = 0
-        if 'cart' in request.session:
-            data = json.loads(request.session['cart'])
-            for item_id in data['items']:
-                item = Item.objects.get(pk=item_id)
-                items.append(item)
-                total += item.price
+        items, total = SessionCart(request.session).resolve()
         return render(request, 'cart/cart_detail.html',
                       {'items': items, 'total': total})
     else:
-        try:
-            cart = Cart.objects.get(user=request.user, active=True)
-        except Cart.DoesNotExist:
+        cart = snapshot.get_snapshot(request.user)
+        if cart is None:
             return render(request, 'cart/cart_detail.html',
                           {'items': [], 'total': 0})
 
-        items = cart.items.all()
-        total = cart.total
         return render(request, 'cart/cart_detail.html',
-                      {'items': items, 'total': total})
+                      {'items': cart['items'], 'total': cart['total']})
 
 
 def pay_shopping_cart(request):
@@ -104,9 +241,8 @@ def pay_shopping_cart(request):
         request.session['pay'] = True
         return HttpResponseRedirect(reverse_lazy('login'))
     else:
-        try:
-            cart = Cart.objects.get(user=request.user, active=True)
-        except Cart.DoesNotExist:
+        cart = snapshot.get_snapshot(request.user)
+        if cart is None:
             return HttpResponseRedirect(reverse_lazy('item_list'))
 
         return render(request, 'cart/cart_payment.html', {'cart': cart})
@@ -116,8 +252,9 @@ def pay_shopping_cart(request):
 def pay_method_cart(request):
     """This view allows you to pay for the shopping cart
 
-    Pay the cart through the selected method, in this case, only change the 
-    status of the cart to not active.   
+    Pay the cart through the selected method: the cart becomes a pending
+    order that the checkout workers authorize and fulfil in the background,
+    and the user is sent to the order page to follow its status.
     :param request: 
     :return: HttpResponse
     """
@@ -126,15 +263,50 @@ def pay_method_cart(request):
         cart = Cart.objects.get(user=request.user, active=True)
     except Cart.DoesNotExist:
         return HttpResponseRedirect(reverse_lazy('item_list'))
-    cart.active = False
-    cart.save()
 
-    if 'cart' in request.session:
-        del request.session['cart']
-    if 'count_items' in request.session:
-        del request.session['count_items']
+    try:
+        order = checkout.place_order(cart)
+    except CartConflict:
+        # The cart changed since the preview, show it again
+        messages.error(request, CONFLICT_MESSAGE, fail_silently=True)
+        return HttpResponseRedirect(reverse_lazy('cart_pay'))
+    checkout.enqueue(order)
+
+    SessionCart(request.session).clear()
+
+    return HttpResponseRedirect(reverse_lazy('order_detail',
+                                             kwargs={'order_id': order.id}))
+
+
+@login_required(login_url='/login/')
+def order_detail(request, order_id):
+    """ This view shows an order and its status
 
-    return HttpResponseRedirect(reverse_lazy('item_list'))
+    The page reloads itself until the checkout finishes.
+    :param request: 
+    :param order_id: 
+    :return: HttpResponse
+    """
+
+    order = get_object_or_404(Order, id=order_id, user=request.user)
+    return render(request, 'cart/order_detail.html',
+                  {'order': order, 'lines': order.lines.all()})
+
+
+@login_required(login_url='/login/')
+def order_status(request, order_id):
+    """ Status of an order, for clients that poll the checkout
+
+    :param request: 
+    :param order_id: 
+    :return: JsonResponse
+    """
+
+    order = get_object_or_404(Order, id=order_id, user=request.user)
+    return JsonResponse({'id': order.id, 'status': order.status,
+                         'status_display': order.get_status_display(),
+                         'finished': order.is_finished,
+                         'total': str(order.total)})
 
 
 def delete_item_cart(request, item_id):
@@ -142,43 +314,79 @@ def delete_item_cart(request, item_id):
 
     If you are an anonymous user, just delete the session item
     If you are logged in, remove the item from the cart
+    The response is negotiated with response_format.
     :param request: 
     :param item_id: 
     :return: HttpResponse
     """
 
+    kind = response_format(request)
     if request.user.is_anonymous:
-        if 'cart' in request.session:
-            data = json.loads(request.session['cart'])
-            data['items'].remove(int(item_id))
-
-            items = []
-            total = 0
-            for item_id in data['items']:
-                item = Item.objects.get(id=item_id)
-                items.append(item)
-                total += item.price
-
-            request.session['cart'] = json.dumps(data)
-            request.session['count_items'] = len(data['items'])
-            return render(request, 'cart/cart_detail.html',
-                          {'items': items, 'total': total})
-        else:
-            return HttpResponseRedirect(reverse_lazy('item_list'))
+        cart = SessionCart(request.session)
+        removed = cart.remove(item_id)
+        cart.save()
+
+        if kind is None:
+            return redirect_back(request, 'cart_detail')
+        return summary_response(request, kind, removed, len(cart),
+                                cart.total())
     else:
         try:
             cart = Cart.objects.get(user=request.user, active=True)
-        except Cart.DoesNotExist:
-            return HttpResponseRedirect(reverse_lazy('item_list'))
+            item = Item.objects.get(id=item_id)
+        except (Cart.DoesNotExist, Item.DoesNotExist):
+            return not_found_response(request, kind, 'item_list')
 
-        item = Item.objects.get(id=item_id)
-        cart.items.remove(item)
-        cart.set_total()
-        cart.save()
+        try:
+            removed = cart.remove_item(item)
+        except CartConflict:
+            return conflict_response(request, kind, 'cart_pay')
+        if removed:
+            snapshot.invalidate(request.user)
+        count = cart.item_count
 
-        request.session['count_items'] = cart.items.count()
+        if kind is None:
+            return redirect_back(request, 'cart_pay')
+        return summary_response(request, kind, removed, count, cart.total)
 
-        return render(request, 'cart/cart_payment.html', {'cart': cart})
+
+@require_POST
+def batch_cart(request):
+    """ Add and remove many items of the shopping cart in one request
+
+    The body is a JSON object with the list of operations, they are applied
+    in order to the session cart of anonymous users or to the active cart
+    of logged in users, and the new state of the cart is returned.
+    :param request: 
+    :return: JsonResponse
+    """
+
+    try:
+        operations = services.parse_operations(json.loads(request.body))
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+
+    if request.user.is_anonymous:
+        state = services.apply_session_operations(request.session, operations)
+    else:
+        try:
+            state = services.apply_cart_operations(request.user, operations)
+        except CartConflict:
+            return JsonResponse({'error': 'conflict'}, status=409)
+
+    return JsonResponse(state)
+
+
+@staff_member_required
+def performance_stats(request):
+    """ Show the measures of PerformanceMiddleware grouped by url name
+
+    The stats belong to the process that serves the request.
+    :param request: 
+    :return: JsonResponse
+    """
+
+    return JsonResponse(get_stats())
 
 
 @receiver(user_logged_in)
@@ -187,25 +395,23 @@ def post_login(user, request, **kwargs):
 
     Once the logged-in user signal is received, this view is responsible for
     seeing if it has a cart in the session, and converting it into an instance 
-    of the database.
+    of the database. If the cart keeps changing the session cart is kept,
+    to be merged on a later login.
     :param user: 
     :param request: 
-    :return: HttpResponse
+    :return: 
     """
     if 'cart' in request.session:
-        cart, created = Cart.objects.get_or_create(user=user, active=True)
-        items_id = json.loads(request.session['cart'])
-        for item_id in items_id['items']:
-            item = Item.objects.get(id=item_id)
-            cart.items.add(item)
-        cart.set_total()
-        cart.save()
+        session_cart = SessionCart(request.session)
+        try:
+            merge_cart(user, session_cart.item_ids)
+        except CartConflict:
+            messages.error(request, CONFLICT_MESSAGE, fail_silently=True)
+            return
 
-        if 'cart' in request.session:
-            del request.session['cart']
+        session_cart.clear()
         if 'pay' in request.session:
             del request.session['pay']
-        return render(request, 'cart/cart_payment.html', {'cart': cart})
 
 
 @receiver(user_logged_out)
@@ -217,9 +423,8 @@ def post_logout(user, **kwargs):
     :param user: 
     :return: 
     """
-    try:
-        cart = Cart.objects.get(user=user, active=True)
-        cart.active = False
-        cart.save()
-    except Cart.DoesNotExist:
-        pass
\ No newline at end of file
+    # Only the flag is written, a full save would overwrite the totals of a
+    # mutation committed since the cart was read
+    if Cart.objects.filter(user=user, active=True).update(
+            active=False, version=F('version') + 1):
+        snapshot.invalidate(user)
\ No newline at end of file
@@ -0,0 +1,18 @@
+"""
+ASGI config for shopping_cart project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+The cart endpoints are served by their async views (cart.async_views).
+
+For more information on this file, see
+https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "shopping_cart.settings")
+os.environ.setdefault("DJANGO_ASYNC_VIEWS", "True")
+
+application = get_asgi_application()
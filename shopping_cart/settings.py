@@ -4,10 +4,10 @@ Django settings for shopping_cart project.
 Generated by 'django-admin startproject' using Django 1.11.1.
 
 For more information on this file, see
-https://docs.djangoproject.com/en/1.11/topics/settings/
+https://docs.djangoproject.com/en/5.2/topics/settings/
 
 For the full list of settings and their values, see
-https://docs.djangoproject.com/en/1.11/ref/settings/
+https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 import os
@@ -24,7 +24,7 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 
 # Quick-start development settings - unsuitable for production
-# See https://docs.djangoproject.com/en/1.11/howto/deployment/checklist/
+# See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
 
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = env('DJANGO_SECRET_KEY')
@@ -56,6 +56,7 @@ INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 
 
 MIDDLEWARE = [
+    'cart.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -65,6 +66,9 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Fraction of requests measured by PerformanceMiddleware, from 0 to 1
+PERFORMANCE_SAMPLE_RATE = env.float('DJANGO_PERFORMANCE_SAMPLE_RATE', 0.01)
+
 ROOT_URLCONF = 'shopping_cart.urls'
 
 TEMPLATES = [
@@ -78,6 +82,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'cart.context_processors.cart',
             ],
         },
     },
@@ -85,20 +90,62 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'shopping_cart.wsgi.application'
 
+# Serve the cart endpoints with their async views, enabled by asgi.py
+ASYNC_VIEWS = env.bool('DJANGO_ASYNC_VIEWS', False)
+
 
 # Database
-# https://docs.djangoproject.com/en/1.11/ref/settings/#databases
+# https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # In memory by default. The threads of cart/tests/test_concurrency.py
+        # need their own connections and are skipped unless it is a file,
+        # e.g. DJANGO_TEST_DATABASE=test_db.sqlite3
+        'TEST': {
+            'NAME': env('DJANGO_TEST_DATABASE', default=None),
+        },
     }
 }
 
+DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    # Catalogue pages, search results and carts. locmem is a copy per
+    # process: a version bumped to invalidate an entry is only seen by the
+    # process that bumped it, so point DJANGO_CACHE_URL to redis or memcached
+    # when running more than one process
+    'default': env.cache_url('DJANGO_CACHE_URL',
+                             default='locmemcache://shopping_cart'),
+    # Must be shared by every process and host, unlike locmem, so a session
+    # written by one worker is never read stale from the cache of another:
+    # point DJANGO_SESSION_CACHE_URL to redis or memcached, e.g.
+    # redis://127.0.0.1:6379/1. Without it the dummy cache makes the
+    # sessions be read from and written to django_session only, one row per
+    # write, instead of writing a second copy to a cache that is not faster
+    # than the database.
+    'sessions': env.cache_url('DJANGO_SESSION_CACHE_URL', default='dummycache://'),
+}
+
+
+# Sessions
+# https://docs.djangoproject.com/en/5.2/topics/http/sessions/
+
+# cached_db that skips saves without changes, see cart.session.SessionStore.
+# 'django.contrib.sessions.backends.cache' avoids the database entirely at
+# the cost of losing the sessions evicted from the cache.
+SESSION_ENGINE = env('DJANGO_SESSION_ENGINE', default='cart.session')
+SESSION_CACHE_ALIAS = 'sessions'
+
 
 # Password validation
-# https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
+# https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -117,7 +164,7 @@ AUTH_PASSWORD_VALIDATORS = [
 
 
 # Internationalization
-# https://docs.djangoproject.com/en/1.11/topics/i18n/
+# https://docs.djangoproject.com/en/5.2/topics/i18n/
 
 LANGUAGE_CODE = 'es-pe'
 
@@ -125,13 +172,11 @@ TIME_ZONE = 'UTC'
 
 USE_I18N = True
 
-USE_L10N = True
-
 USE_TZ = True
 
 
 # Static files (CSS, JavaScript, Images)
-# https://docs.djangoproject.com/en/1.11/howto/static-files/
+# https://docs.djangoproject.com/en/5.2/howto/static-files/
 STATIC_URL = '/static/'
 STATICFILES_FINDERS = (
     'django.contrib.staticfiles.finders.FileSystemFinder',
@@ -145,6 +190,31 @@ STATICFILES_DIRS = (
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
+# Cart
+# Attempts of a cart mutation that collides with concurrent requests
+CART_MAX_RETRIES = 5
+# Seconds a cart is served from the cache. With a cache per process the other
+# processes keep showing the cart as it was before a change up to this long,
+# see cart.snapshot
+CART_SNAPSHOT_TIMEOUT = env.int(
+    'DJANGO_CART_SNAPSHOT_TIMEOUT',
+    default=10 if CACHES['default']['BACKEND'].endswith('LocMemCache')
+    else 60 * 30)
+
+# Checkout
+CHECKOUT_PAYMENT_GATEWAY = env('DJANGO_CHECKOUT_PAYMENT_GATEWAY',
+                               default='cart.checkout.LocalGateway')
+CHECKOUT_WORKERS = env.int('DJANGO_CHECKOUT_WORKERS', 4)
+CHECKOUT_MAX_ATTEMPTS = 3
+# Seconds before the first retry, doubled on each attempt
+CHECKOUT_RETRY_DELAY = 1
+# Process orders inside the request instead of the worker pool
+CHECKOUT_EAGER = env.bool('DJANGO_CHECKOUT_EAGER', False)
+
+EMAIL_BACKEND = env('DJANGO_EMAIL_BACKEND',
+                    default='django.core.mail.backends.console.EmailBackend')
+DEFAULT_FROM_EMAIL = 'shopping_cart@localhost'
+
 # Urls Redirect
 LOGIN_REDIRECT_URL = '/cart/pay/'
 LOGOUT_REDIRECT_URL = '/'
@@ -1,9 +1,10 @@
-from django.conf.urls import url, include
+from django.urls import include, re_path
 from django.contrib import admin
 from django.conf import settings
 from django.conf.urls.static import static
 
 urlpatterns = [
-    url(r'^admin/', admin.site.urls),
-    url(r'^',include('cart.urls')),
+    re_path(r'^admin/', admin.site.urls),
+    re_path(r'^', include('cart.async_urls' if settings.ASYNC_VIEWS
+                          else 'cart.urls')),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file